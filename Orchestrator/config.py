@@ -9,9 +9,39 @@ RAG_URL = os.getenv("RAG_URL", "http://127.0.0.1:8000")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
 
+# LLM tương thích OpenAI (tuỳ chọn): nếu đặt LLM_BASE_URL thì dùng thay cho Gemini
+LLM_BASE_URL = os.getenv("LLM_BASE_URL")
+LLM_MODEL = os.getenv("LLM_MODEL", "default")
+
+# Timeout (giây) và kích thước pool kết nối HTTP dùng chung
+RAG_TIMEOUT = float(os.getenv("RAG_TIMEOUT", "10"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+SLACK_TIMEOUT = float(os.getenv("SLACK_TIMEOUT", "10"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+
+# Số chunk lấy từ RAG và ngân sách token của context: rag-service bỏ chunk gần trùng và chọn theo MMR
+# trong ngân sách này trước khi ghép context (0 = lấy nguyên các chunk như cũ)
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "5"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+
+# Answer cache: bỏ qua Gemini khi cùng câu hỏi + cùng context đã được trả lời gần đây
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# Ngưỡng cosine để coi 2 câu hỏi là một (0 = chỉ khớp chính xác sau khi chuẩn hoá)
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0"))
+
 # Slack integration configuration
 SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN")
 SLACK_SIGNING_SECRET = os.getenv("SLACK_SIGNING_SECRET")
+SLACK_API_URL = os.getenv("SLACK_API_URL", "https://slack.com/api")
+# Số worker sinh câu trả lời song song và độ dài tối đa hàng đợi event Slack
+SLACK_WORKERS = int(os.getenv("SLACK_WORKERS", "4"))
+SLACK_QUEUE_SIZE = int(os.getenv("SLACK_QUEUE_SIZE", "100"))
+
+# Slack: hiển thị câu trả lời dần dần (gửi ngay đoạn đầu rồi chat.update tối đa một lần mỗi
+# SLACK_UPDATE_INTERVAL giây); tắt thì chỉ gửi một tin nhắn khi đã có đủ câu trả lời
+SLACK_STREAM = os.getenv("SLACK_STREAM", "1") not in ("0", "false", "False")
+SLACK_UPDATE_INTERVAL = float(os.getenv("SLACK_UPDATE_INTERVAL", "1.0"))
 
 # Dify (optional) – kept for parity with prior integrations
 DIFY_API_KEY = os.getenv("DIFY_API_KEY")
@@ -0,0 +1,218 @@
+"""
+Load test cho Orchestrator: gửi nhiều Slack event cùng lúc và đo xem chúng có được xử lý song song không.
+
+1. Chạy server giả lập RAG + LLM + Slack API (mỗi bước có độ trễ cố định):
+    python loadtest.py stub --port 8100 --rag-delay 0.5 --llm-delay 1.0
+
+2. Chạy Orchestrator trỏ vào server giả lập:
+    RAG_URL=http://127.0.0.1:8100 LLM_BASE_URL=http://127.0.0.1:8100 SLACK_API_URL=http://127.0.0.1:8100 \\
+    SLACK_BOT_TOKEN=xoxb-test SLACK_SIGNING_SECRET=test uvicorn main:app --port 9000
+
+3. Bắn tải:
+    python loadtest.py slack --url http://127.0.0.1:9000 --stub http://127.0.0.1:8100 --n 20 --secret test
+
+4. So sánh thời gian tới đoạn đầu tiên (TTFT) của /ask thường và /ask stream (SSE):
+    python loadtest.py ask --url http://127.0.0.1:9000 --n 20
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import statistics
+import time
+import uuid
+
+import httpx
+
+
+STUB_ANSWER = "Câu trả lời giả lập được sinh dần từng từ một để thử chế độ stream của Orchestrator"
+
+
+def build_stub_app(rag_delay: float, llm_delay: float, slack_delay: float, token_delay: float = 0.0):
+    from fastapi import FastAPI, Request
+    from fastapi.responses import StreamingResponse
+
+    app = FastAPI(title="Orchestrator load-test stub")
+    state = {"slack_messages": 0, "slack_updates": 0}
+
+    @app.post("/search")
+    async def search(request: Request):
+        body = await request.json()
+        await asyncio.sleep(rag_delay)
+        chunk = f"Thông tin giả lập cho: {body.get('query', '')}"
+        return {"context": chunk, "results": [{"chunk": chunk, "score": 1.0}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        # llm_delay: thời gian tới token đầu tiên; mỗi từ sau đó mất thêm token_delay
+        body = await request.json()
+        words = STUB_ANSWER.split()
+        if not body.get("stream"):
+            await asyncio.sleep(llm_delay + token_delay * (len(words) - 1))
+            return {"choices": [{"message": {"role": "assistant", "content": STUB_ANSWER}}]}
+
+        async def events():
+            await asyncio.sleep(llm_delay)
+            for i, word in enumerate(words):
+                if i:
+                    await asyncio.sleep(token_delay)
+                delta = {"choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}}]}
+                yield f"data: {json.dumps(delta, ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/chat.postMessage")
+    async def post_message(request: Request):
+        await request.json()
+        await asyncio.sleep(slack_delay)
+        state["slack_messages"] += 1
+        return {"ok": True, "ts": str(time.time())}
+
+    @app.post("/chat.update")
+    async def update_message(request: Request):
+        body = await request.json()
+        await asyncio.sleep(slack_delay)
+        state["slack_updates"] += 1
+        return {"ok": True, "ts": body.get("ts")}
+
+    @app.get("/stats")
+    async def stats():
+        return state
+
+    return app
+
+
+def sign(secret: str, timestamp: str, body: bytes) -> str:
+    base = f"v0:{timestamp}:{body.decode()}".encode()
+    return "v0=" + hmac.new(secret.encode(), base, hashlib.sha256).hexdigest()
+
+
+async def send_event(client: httpx.AsyncClient, url: str, secret: str, i: int) -> float:
+    body = json.dumps({
+        "type": "event_callback",
+        "event": {
+            "type": "message",
+            "channel": "C-LOADTEST",
+            "text": f"câu hỏi số {i} {uuid.uuid4().hex[:6]}",
+            "client_msg_id": uuid.uuid4().hex,
+            "event_ts": str(time.time()),
+        },
+    }).encode()
+    timestamp = str(int(time.time()))
+    headers = {
+        "Content-Type": "application/json",
+        "X-Slack-Request-Timestamp": timestamp,
+        "X-Slack-Signature": sign(secret, timestamp, body),
+    }
+    started = time.perf_counter()
+    resp = await client.post(f"{url}/slack/events", content=body, headers=headers)
+    resp.raise_for_status()
+    return time.perf_counter() - started
+
+
+async def wait_for_answers(client: httpx.AsyncClient, stub_url: str, expected: int, timeout: float = 120) -> bool:
+    """Chờ server giả lập nhận đủ `expected` tin nhắn trả lời từ Orchestrator."""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        resp = await client.get(f"{stub_url}/stats")
+        if resp.json().get("slack_messages", 0) >= expected:
+            return True
+        await asyncio.sleep(0.05)
+    return False
+
+
+async def run_slack(args):
+    async with httpx.AsyncClient(timeout=120) as client:
+        before = 0
+        if args.stub:
+            before = (await client.get(f"{args.stub}/stats")).json().get("slack_messages", 0)
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(send_event(client, args.url, args.secret, i) for i in range(args.n)))
+        wall = time.perf_counter() - started
+        answered = None
+        if args.stub and await wait_for_answers(client, args.stub, before + args.n):
+            answered = time.perf_counter() - started
+    latencies = sorted(latencies)
+    p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+    print(f"events={args.n}  wall={wall:.2f}s")
+    print(f"ack latency p50={statistics.median(latencies):.3f}s p95={p95:.3f}s max={latencies[-1]:.3f}s")
+    # Xử lý tuần tự thì wall ~ tổng latency; song song thì wall ~ latency lớn nhất
+    print(f"song song hiệu dụng: x{sum(latencies) / wall:.1f} (tuần tự = x1.0)")
+    if answered is not None:
+        print(f"toàn bộ {args.n} câu trả lời đã gửi về Slack sau {answered:.2f}s")
+
+
+async def ask_once(client: httpx.AsyncClient, url: str, i: int, stream: bool) -> tuple[float, float]:
+    """(thời gian tới khi thấy đoạn đầu tiên của câu trả lời, tổng thời gian) của một request /ask."""
+    payload = {"question": f"câu hỏi số {i} {uuid.uuid4().hex[:6]}", "stream": stream}
+    started = time.perf_counter()
+    if not stream:
+        resp = await client.post(f"{url}/ask", json=payload)
+        resp.raise_for_status()
+        elapsed = time.perf_counter() - started
+        return elapsed, elapsed
+    first = None
+    async with client.stream("POST", f"{url}/ask", json=payload) as resp:
+        resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            if first is None and line.startswith("data:") and '"delta"' in line:
+                first = time.perf_counter() - started
+    total = time.perf_counter() - started
+    return first if first is not None else total, total
+
+
+async def run_ask(args):
+    def pct(values: list[float], q: float) -> float:
+        ordered = sorted(values)
+        return ordered[max(int(len(ordered) * q) - 1, 0)] * 1000
+
+    async with httpx.AsyncClient(timeout=120) as client:
+        print(f"{'mode':<8} {'n':>4} {'ttft p50':>9} {'ttft p95':>9} {'total p50':>10} {'total p95':>10}  (ms)")
+        for stream in (False, True):
+            timings = await asyncio.gather(*(ask_once(client, args.url, i, stream) for i in range(args.n)))
+            ttft, total = [t for t, _ in timings], [t for _, t in timings]
+            print(
+                f"{'stream' if stream else 'full':<8} {args.n:>4} {pct(ttft, 0.5):>9.0f} {pct(ttft, 0.95):>9.0f} "
+                f"{pct(total, 0.5):>10.0f} {pct(total, 0.95):>10.0f}"
+            )
+        if args.stub:
+            print(f"stub: {(await client.get(f'{args.stub}/stats')).json()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test Orchestrator")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_stub = sub.add_parser("stub", help="Server giả lập RAG / LLM / Slack API")
+    p_stub.add_argument("--port", type=int, default=8100)
+    p_stub.add_argument("--rag-delay", type=float, default=0.5)
+    p_stub.add_argument("--llm-delay", type=float, default=1.0)
+    p_stub.add_argument("--slack-delay", type=float, default=0.05)
+    p_stub.add_argument("--token-delay", type=float, default=0.05, help="Thời gian sinh mỗi từ sau từ đầu tiên")
+
+    p_slack = sub.add_parser("slack", help="Gửi N Slack event đồng thời")
+    p_slack.add_argument("--url", default="http://127.0.0.1:9000")
+    p_slack.add_argument("--n", type=int, default=20)
+    p_slack.add_argument("--secret", default="test")
+    p_slack.add_argument("--stub", default=None, help="URL server giả lập để đo thời gian đến khi trả lời xong")
+
+    p_ask = sub.add_parser("ask", help="TTFT / tổng thời gian của N request /ask đồng thời, thường và stream")
+    p_ask.add_argument("--url", default="http://127.0.0.1:9000")
+    p_ask.add_argument("--n", type=int, default=20)
+    p_ask.add_argument("--stub", default=None)
+
+    args = parser.parse_args()
+    if args.command == "stub":
+        import uvicorn
+        app = build_stub_app(args.rag_delay, args.llm_delay, args.slack_delay, args.token_delay)
+        uvicorn.run(app, host="127.0.0.1", port=args.port)
+    elif args.command == "ask":
+        asyncio.run(run_ask(args))
+    else:
+        asyncio.run(run_slack(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,46 @@
+import json
 import logging
+import time
+from collections import OrderedDict
 
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from google.api_core import exceptions as google_exceptions
 
-from config import GEMINI_API_KEY, GEMINI_MODEL, RAG_URL
+from config import (
+    ANSWER_CACHE_SIMILARITY,
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_TTL,
+    CONTEXT_TOKEN_BUDGET,
+    GEMINI_API_KEY,
+    GEMINI_MODEL,
+    HTTP_MAX_CONNECTIONS,
+    LLM_BASE_URL,
+    LLM_MODEL,
+    LLM_TIMEOUT,
+    RAG_TIMEOUT,
+    RAG_TOP_K,
+    RAG_URL,
+    SLACK_QUEUE_SIZE,
+    SLACK_STREAM,
+    SLACK_UPDATE_INTERVAL,
+    SLACK_WORKERS,
+)
+from services.answer_cache import AnswerCache, context_fingerprint
 from services.gemini_client import GeminiClient
+from services.generation_stats import GenerationStats
 from services.llm_client import LLMClient
 from services.rag_client import RagClient
-from services.slack_client import send_to_slack, verify_slack_request
+from services.slack_client import (
+    SlackAPIError,
+    SlackMessageStream,
+    close_slack_client,
+    send_to_slack,
+    start_slack_client,
+    verify_slack_request,
+)
+from services.worker_pool import WorkerPool
 
 
 app = FastAPI(title="AI Orchestrator")
@@ -16,16 +48,50 @@ app = FastAPI(title="AI Orchestrator")
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-rag_client = RagClient(RAG_URL)
-gemini = GeminiClient(GEMINI_API_KEY, GEMINI_MODEL)
+rag_client = RagClient(RAG_URL, timeout=RAG_TIMEOUT, max_connections=HTTP_MAX_CONNECTIONS)
+# Mặc định dùng Gemini; đặt LLM_BASE_URL để chuyển sang LLM tương thích OpenAI
+if LLM_BASE_URL:
+    llm = LLMClient(LLM_BASE_URL, LLM_MODEL, timeout=LLM_TIMEOUT, max_connections=HTTP_MAX_CONNECTIONS)
+else:
+    llm = GeminiClient(GEMINI_API_KEY, GEMINI_MODEL, timeout=LLM_TIMEOUT)
+answer_cache = AnswerCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_SIMILARITY)
+# TTFT (thời gian tới đoạn đầu tiên) và tổng thời gian sinh câu trả lời, xem /metrics
+generation_stats = GenerationStats()
 
-# Cache để tránh xử lý lại cùng một event (deduplication)
-processed_events = set()
+# Cache để tránh xử lý lại cùng một event (deduplication), giữ theo thứ tự nhận
+processed_events: OrderedDict[str, None] = OrderedDict()
+PROCESSED_EVENTS_MAX = 10000
+
+# Worker nền sinh câu trả lời cho Slack; endpoint chỉ xác thực, lọc trùng và đưa vào hàng đợi
+slack_workers = WorkerPool(SLACK_WORKERS, SLACK_QUEUE_SIZE, name="slack")
+
+# Tổng số token context (ước lượng) trước / sau khi rag-service chọn lọc, xem /metrics
+context_totals = {"requests": 0, "tokens_in": 0, "tokens_used": 0, "tokens_saved": 0}
+
+
+@app.on_event("startup")
+async def startup_event():
+    # Các client HTTP dùng chung (pool kết nối) sống suốt vòng đời app
+    await rag_client.start()
+    await llm.start()
+    await start_slack_client()
+    slack_workers.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await slack_workers.stop()
+    await rag_client.aclose()
+    await llm.aclose()
+    await close_slack_client()
 
 
 # ---- REQUEST MODEL ----
 class UserQuery(BaseModel):
     question: str
+    # True (hoặc header Accept: text/event-stream): /ask trả về Server-Sent Events, từng đoạn câu trả lời
+    # được gửi ngay khi LLM sinh ra
+    stream: bool = False
 
 
 def build_prompt(question: str, context: str) -> str:
@@ -42,13 +108,80 @@ Hãy trở lời dựa trên ngữ cảnh và câu hỏi ở trên .
 """
 
 
+def stream_answer(prompt: str):
+    """Stream câu trả lời của LLM (từng đoạn text), có ghi TTFT / tổng thời gian."""
+    return generation_stats.track(llm.astream(prompt))
+
+
+async def generate_answer(prompt: str) -> str:
+    return "".join([chunk async for chunk in stream_answer(prompt)])
+
+
+def sse_event(data: dict, event: str | None = None) -> str:
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def sse_answer(question: str, prompt: str, fingerprint: str, embedding, cached_answer: str | None):
+    """
+    Các event SSE của /ask?stream: "meta" (prompt, cached), nhiều event không tên {"delta": ...},
+    rồi "done" (câu trả lời đầy đủ, ttft_ms, total_ms) hoặc "error".
+    """
+    yield sse_event({"finalpromt": prompt, "cached": cached_answer is not None}, "meta")
+    if cached_answer is not None:
+        yield sse_event({"delta": cached_answer})
+        yield sse_event({"answer": cached_answer, "cached": True}, "done")
+        return
+    started = time.perf_counter()
+    ttft = None
+    answer = ""
+    try:
+        async for chunk in stream_answer(prompt):
+            if ttft is None:
+                ttft = time.perf_counter() - started
+            answer += chunk
+            yield sse_event({"delta": chunk})
+    except Exception as exc:
+        logger.error("LLM stream error: %s", exc, exc_info=True)
+        yield sse_event({"detail": str(exc)}, "error")
+        return
+    answer_cache.set(question, fingerprint, answer, embedding)
+    total = time.perf_counter() - started
+    logger.info("LLM stream done: ttft=%.0fms total=%.0fms", (ttft or total) * 1000, total * 1000)
+    yield sse_event({
+        "answer": answer,
+        "cached": False,
+        "ttft_ms": round((ttft or total) * 1000, 1),
+        "total_ms": round(total * 1000, 1),
+    }, "done")
+
+
+async def retrieve_context(question: str) -> tuple[str, list | None]:
+    """Lấy context từ RAG (kèm embedding câu hỏi nếu answer cache so khớp theo ngữ nghĩa)."""
+    rag_result = await rag_client.aretrieve(
+        question,
+        top_k=RAG_TOP_K,
+        include_embedding=answer_cache.semantic_enabled,
+        context_tokens=CONTEXT_TOKEN_BUDGET,
+    )
+    stats = rag_result.get("context_stats")
+    if stats:
+        context_totals["requests"] += 1
+        for key in ("tokens_in", "tokens_used", "tokens_saved"):
+            context_totals[key] += stats.get(key, 0)
+        logger.info(
+            "RAG context: %d/%d chunks, %d tokens (saved %d, %d near-duplicates)",
+            stats.get("selected", 0), stats.get("candidates", 0), stats.get("tokens_used", 0),
+            stats.get("tokens_saved", 0), stats.get("duplicates", 0),
+        )
+    # Context từ RAG đã là tổng hợp của các chunk được chọn rồi
+    return rag_result.get("context", ""), rag_result.get("embedding")
+
+
 @app.post("/promt")
-def get_promt(query: UserQuery):
+async def get_promt(query: UserQuery):
     # 1. Lấy context từ RAG
-    rag_result = rag_client.retrieve(query.question)
-
-    # Context từ RAG đã là tổng hợp của các chunk rồi
-    context = rag_result.get("context", "")
+    context, _ = await retrieve_context(query.question)
 
     # 2. Build final prompt
     final_prompt = f"""
@@ -65,27 +198,104 @@ Please answer clearly based on the context.
     return final_prompt
 
 @app.post("/ask")
-def ask_ai(query: UserQuery):
+async def ask_ai(query: UserQuery, request: Request):
     # 1. Lấy context từ RAG
-    rag_result = rag_client.retrieve(query.question)
-
-    # Context từ RAG đã là tổng hợp của các chunk rồi
-    context = rag_result.get("context", "")
+    context, embedding = await retrieve_context(query.question)
 
     final_prompt = build_prompt(query.question, context)
 
+    # 2. Cùng câu hỏi + cùng context đã trả lời gần đây thì không cần gọi LLM
+    fingerprint = context_fingerprint(context)
+    llm_answer = answer_cache.get(query.question, fingerprint, embedding)
+    cached = llm_answer is not None
+
+    if query.stream or "text/event-stream" in request.headers.get("accept", ""):
+        # Người dùng thấy đoạn đầu tiên sau TTFT thay vì chờ LLM sinh xong cả câu trả lời
+        return StreamingResponse(
+            sse_answer(query.question, final_prompt, fingerprint, embedding, llm_answer),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
     # 3. Gọi LLM Worker
-    llm_answer = gemini.generate(final_prompt)
+    if not cached:
+        llm_answer = await generate_answer(final_prompt)
+        answer_cache.set(query.question, fingerprint, llm_answer, embedding)
 
     # 4. Trả kết quả
     return {
         "finalpromt": final_prompt,
         "answer": llm_answer,
+        "cached": cached,
     }
 
 
+@app.get("/cache/stats")
+def cache_stats():
+    return answer_cache.stats()
+
+
+async def answer_slack_event(channel: str, text: str) -> None:
+    """Job nền: RAG -> LLM -> gửi câu trả lời về Slack."""
+    logger.info("Calling RAG at %s/search with query=%s", RAG_URL, text)
+    # Context từ RAG đã là tổng hợp của các chunk rồi, không cần join lại
+    context, embedding = await retrieve_context(text)
+    logger.info("RAG context: %s", context)
+
+    final_prompt = build_prompt(text, context)
+    fingerprint = context_fingerprint(context)
+    # Stream: tin nhắn được gửi ngay khi có đoạn đầu tiên rồi sửa tại chỗ (có throttle) tới khi xong
+    message = SlackMessageStream(channel, SLACK_UPDATE_INTERVAL) if SLACK_STREAM else None
+    try:
+        llm_answer = answer_cache.get(text, fingerprint, embedding)
+        if llm_answer is None:
+            partial = ""
+            async for chunk in stream_answer(final_prompt):
+                partial += chunk
+                if message is not None:
+                    try:
+                        await message.push(partial)
+                    except SlackAPIError as exc:
+                        # Lỗi Slack không làm hỏng câu trả lời: tiếp tục sinh, bản cuối gửi lại sau
+                        logger.warning("Slack API error while streaming, continuing: %s", exc.detail)
+            llm_answer = partial
+            answer_cache.set(text, fingerprint, llm_answer, embedding)
+        else:
+            logger.info("Answer cache hit for query=%s", text)
+    except google_exceptions.ResourceExhausted as exc:
+        logger.warning("Gemini quota exceeded, fallback to RAG context: %s", exc)
+        llm_answer = f"Dựa trên thông tin có sẵn:\n\n{context}" if context else "Xin lỗi, hệ thống đang tạm thời quá tải. Vui lòng thử lại sau."
+    except Exception as exc:
+        logger.error("LLM error, fallback to RAG context: %s", exc, exc_info=True)
+        llm_answer = f"Dựa trên thông tin có sẵn:\n\n{context}" if context else "Xin lỗi, đã xảy ra lỗi khi xử lý câu hỏi. Vui lòng thử lại sau."
+
+    logger.info("Sending answer back to Slack channel=%s", channel)
+    try:
+        if message is not None:
+            # Bản cuối (hoặc câu trả lời dự phòng khi lỗi giữa chừng) thay cho phần đang hiển thị
+            await message.finish(llm_answer)
+            logger.info("Sent to Slack successfully (%d updates)", message.updates)
+        else:
+            await send_to_slack(channel, llm_answer)
+            logger.info("Sent to Slack successfully")
+    except SlackAPIError as exc:
+        logger.error("Slack API error, answer not delivered to channel=%s: %s", channel, exc.detail)
+
+
+def mark_processed(event_id: str) -> None:
+    processed_events[event_id] = None
+    # Chỉ giữ PROCESSED_EVENTS_MAX event gần nhất để tránh rò bộ nhớ
+    while len(processed_events) > PROCESSED_EVENTS_MAX:
+        processed_events.popitem(last=False)
+
+
 @app.post("/slack/events")
 async def slack_events(request: Request):
+    # Slack gửi lại (retry) khi lần trước chưa được trả lời kịp; retry vẫn phải qua bước kiểm tra chữ ký,
+    # sau đó bị bỏ nhờ cache event_id nếu event gốc đã vào hàng đợi
+    retry_num = request.headers.get("X-Slack-Retry-Num")
+    retry_reason = request.headers.get("X-Slack-Retry-Reason")
+
     raw_body = await request.body()
     headers = {
         "X-Slack-Request-Timestamp": request.headers.get("X-Slack-Request-Timestamp"),
@@ -124,19 +334,6 @@ async def slack_events(request: Request):
     bot_id = event.get("bot_id")
 
     if event_type in {"message", "app_mention"} and not bot_id:
-        # Deduplication: Check if we've already processed this event
-        event_id = event.get("client_msg_id") or event.get("event_ts")
-        if event_id:
-            if event_id in processed_events:
-                logger.info("Duplicate event ignored: event_id=%s", event_id)
-                return {"ok": True}
-            # Mark event as processed immediately to prevent race condition
-            processed_events.add(event_id)
-            # Cleanup old events (keep last 1000 events to prevent memory leak)
-            if len(processed_events) > 1000:
-                processed_events.clear()
-                logger.info("Cleared processed_events cache")
-        
         channel = event.get("channel")
         raw_text = event.get("text", "")
         # Remove leading bot mention if any (for app_mention events)
@@ -148,31 +345,36 @@ async def slack_events(request: Request):
         if not channel:
             raise HTTPException(status_code=400, detail="Missing Slack channel")
 
-        logger.info("Calling RAG at %s/search with query=%s", RAG_URL, text)
-        rag_result = rag_client.retrieve(text)
-        logger.info("RAG response: %s", rag_result)
-        # Context từ RAG đã là tổng hợp của các chunk rồi, không cần join lại
-        context = rag_result.get("context", "")
-
-        final_prompt = build_prompt(text, context)
-        try:
-            llm_answer = gemini.generate(final_prompt)
-        except google_exceptions.ResourceExhausted as exc:
-            logger.warning("Gemini quota exceeded, fallback to RAG context: %s", exc)
-            llm_answer = f"Dựa trên thông tin có sẵn:\n\n{context}" if context else "Xin lỗi, hệ thống đang tạm thời quá tải. Vui lòng thử lại sau."
-        except Exception as exc:
-            logger.error("Gemini error, fallback to RAG context: %s", exc, exc_info=True)
-            llm_answer = f"Dựa trên thông tin có sẵn:\n\n{context}" if context else "Xin lỗi, đã xảy ra lỗi khi xử lý câu hỏi. Vui lòng thử lại sau."
-
-        logger.info("Sending answer back to Slack channel=%s", channel)
-        await send_to_slack(channel, llm_answer)
-        logger.info("Sent to Slack successfully")
+        # Deduplication: event_id của Slack giữ nguyên giữa các lần retry
+        event_id = payload.get("event_id") or event.get("client_msg_id") or event.get("event_ts")
+        if event_id and event_id in processed_events:
+            logger.info("Duplicate event ignored: event_id=%s retry=%s reason=%s", event_id, retry_num, retry_reason)
+            return {"ok": True}
+
+        # Đưa vào hàng đợi rồi trả lời ngay để Slack không retry (giới hạn ~3 giây)
+        if not slack_workers.submit(lambda: answer_slack_event(channel, text)):
+            # Hàng đợi đầy: trả lỗi để Slack gửi lại sau (event chưa được ghi nhận)
+            logger.warning("Slack queue full (depth=%d), rejecting event_id=%s", slack_workers.depth, event_id)
+            raise HTTPException(status_code=503, detail="Server busy, please retry")
+        if event_id:
+            mark_processed(event_id)
+        logger.info("Slack event queued: event_id=%s depth=%d", event_id, slack_workers.depth)
     else:
         logger.info("Ignored Slack event (not a user message)")
 
     return {"ok": True}
 
 
+@app.get("/metrics")
+def metrics():
+    return {
+        "slack_queue": slack_workers.stats(),
+        "answer_cache": answer_cache.stats(),
+        "context": context_totals,
+        "llm": generation_stats.stats(),
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="127.0.0.1", port=9000, reload=True)
@@ -0,0 +1,115 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Sequence
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.lower().split())
+
+
+def context_fingerprint(context: str) -> str:
+    """Dấu vân tay của context RAG: context đổi thì câu trả lời cũ không còn dùng được."""
+    return hashlib.sha256(context.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """
+    Cache câu trả lời của LLM, khoá theo (câu hỏi chuẩn hoá, fingerprint context).
+    Nếu bật `similarity_threshold`, câu hỏi khác chữ nhưng embedding đủ gần
+    (cùng context) cũng được coi là trúng cache.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600, similarity_threshold: float = 0.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        # (question, fingerprint) -> (thời điểm lưu, câu trả lời, embedding câu hỏi)
+        self._data: OrderedDict[tuple[str, str], tuple[float, str, Optional[Sequence[float]]]] = OrderedDict()
+        # fingerprint -> các câu hỏi đã lưu với context đó (để so khớp theo embedding)
+        self._by_context: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return self.similarity_threshold > 0
+
+    def _remove(self, key: tuple[str, str]):
+        self._data.pop(key, None)
+        questions = self._by_context.get(key[1])
+        if questions is not None:
+            questions.discard(key[0])
+            if not questions:
+                del self._by_context[key[1]]
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl is not None and now - stored_at > self.ttl
+
+    def get(self, question: str, fingerprint: str, embedding: Optional[Sequence[float]] = None) -> Optional[str]:
+        now = time.monotonic()
+        key = (normalize_question(question), fingerprint)
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and not self._expired(item[0], now):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                self._remove(key)
+
+            if self.semantic_enabled and embedding:
+                best_key, best_score = None, self.similarity_threshold
+                for other in list(self._by_context.get(fingerprint, ())):
+                    other_key = (other, fingerprint)
+                    stored_at, _, other_emb = self._data[other_key]
+                    if self._expired(stored_at, now):
+                        self._remove(other_key)
+                        continue
+                    if not other_emb:
+                        continue
+                    # Embedding từ rag-service đã chuẩn hoá nên tích vô hướng = cosine
+                    score = sum(a * b for a, b in zip(embedding, other_emb))
+                    if score >= best_score:
+                        best_key, best_score = other_key, score
+                if best_key is not None:
+                    self._data.move_to_end(best_key)
+                    self.hits += 1
+                    self.semantic_hits += 1
+                    return self._data[best_key][1]
+
+            self.misses += 1
+            return None
+
+    def set(self, question: str, fingerprint: str, answer: str, embedding: Optional[Sequence[float]] = None):
+        if self.maxsize <= 0:
+            return
+        key = (normalize_question(question), fingerprint)
+        with self._lock:
+            self._data[key] = (time.monotonic(), answer, list(embedding) if embedding else None)
+            self._data.move_to_end(key)
+            self._by_context.setdefault(fingerprint, set()).add(key[0])
+            while len(self._data) > self.maxsize:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._by_context.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "similarity_threshold": self.similarity_threshold,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
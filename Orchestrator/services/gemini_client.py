@@ -1,11 +1,53 @@
+from typing import AsyncIterator, Iterator
+
 import google.generativeai as genai
 
 class GeminiClient:
-    def __init__(self, api_key: str, model: str = "gemini-2.5-flash"):
+    def __init__(self, api_key: str, model: str = "gemini-2.5-flash", timeout: float = 60.0):
         genai.configure(api_key=api_key)
         self.model = model
+        self.timeout = timeout
+        # Tạo model một lần, dùng lại cho mọi request
+        self._model = genai.GenerativeModel(self.model)
+
+    async def start(self) -> None:
+        # SDK Gemini tự quản lý kết nối; giữ cùng giao diện với LLMClient
+        pass
+
+    async def aclose(self) -> None:
+        pass
 
     def generate(self, prompt: str):
-        model = genai.GenerativeModel(self.model)
-        response = model.generate_content(prompt)
+        response = self._model.generate_content(prompt, request_options={"timeout": self.timeout})
+        return response.text
+
+    async def agenerate(self, prompt: str):
+        """Phiên bản async: không chặn event loop trong lúc chờ Gemini."""
+        response = await self._model.generate_content_async(prompt, request_options={"timeout": self.timeout})
         return response.text
+
+    @staticmethod
+    def _text(chunk) -> str:
+        # Chunk không có phần text (vd. chỉ có thông tin safety) thì .text báo lỗi: bỏ qua
+        try:
+            return chunk.text
+        except ValueError:
+            return ""
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """Trả về từng đoạn câu trả lời ngay khi Gemini sinh ra."""
+        response = self._model.generate_content(prompt, stream=True, request_options={"timeout": self.timeout})
+        for chunk in response:
+            text = self._text(chunk)
+            if text:
+                yield text
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        """Phiên bản async của stream."""
+        response = await self._model.generate_content_async(
+            prompt, stream=True, request_options={"timeout": self.timeout}
+        )
+        async for chunk in response:
+            text = self._text(chunk)
+            if text:
+                yield text
@@ -0,0 +1,48 @@
+import time
+from collections import deque
+from typing import AsyncIterator
+
+
+def _percentiles(values: deque) -> dict:
+    if not values:
+        return {"p50_ms": None, "p95_ms": None}
+    ordered = sorted(values)
+    p95 = ordered[max(int(len(ordered) * 0.95) - 1, 0)]
+    return {"p50_ms": round(ordered[len(ordered) // 2] * 1000, 1), "p95_ms": round(p95 * 1000, 1)}
+
+
+class GenerationStats:
+    """
+    Thời gian tới token đầu tiên (TTFT) và tổng thời gian sinh câu trả lời của LLM,
+    tính trên `window` lần gọi gần nhất. Người dùng thấy chữ đầu tiên sau TTFT nên đây là chỉ số chính.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.ttft: deque = deque(maxlen=window)
+        self.total: deque = deque(maxlen=window)
+        self.completed = 0
+        self.failed = 0
+
+    async def track(self, chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Bọc stream của LLM: ghi lại TTFT ở đoạn đầu tiên và tổng thời gian khi stream kết thúc."""
+        started = time.perf_counter()
+        first = True
+        try:
+            async for chunk in chunks:
+                if first:
+                    first = False
+                    self.ttft.append(time.perf_counter() - started)
+                yield chunk
+        except Exception:
+            self.failed += 1
+            raise
+        self.completed += 1
+        self.total.append(time.perf_counter() - started)
+
+    def stats(self) -> dict:
+        return {
+            "completed": self.completed,
+            "failed": self.failed,
+            "ttft": _percentiles(self.ttft),
+            "total": _percentiles(self.total),
+        }
@@ -1,20 +1,107 @@
+import json
+from typing import AsyncIterator, Iterable, Iterator, Optional
+
+import httpx
 import requests
 
+
 class LLMClient:
-    def __init__(self, base_url: str, model: str):
+    def __init__(self, base_url: str, model: str, timeout: float = 60.0, max_connections: int = 100):
         self.base_url = base_url
         self.model = model
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.session = requests.Session()
+        self._client: Optional[httpx.AsyncClient] = None
 
-    def generate(self, prompt: str):
-        url = f"{self.base_url}/v1/chat/completions"
+    async def start(self) -> None:
+        """Tạo AsyncClient dùng chung (gọi khi app startup)."""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            )
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self.session.close()
+
+    def _payload(self, prompt: str, stream: bool = False) -> dict:
         payload = {
             "model": self.model,
             "messages": [
                 {"role": "user", "content": prompt}
             ]
         }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    @staticmethod
+    def _delta(line: str) -> Optional[str]:
+        """
+        Nội dung của một dòng SSE "data: {...}" trong response stream của /v1/chat/completions.
+        Trả về None khi gặp "data: [DONE]".
+        """
+        if not line.startswith("data:"):
+            return ""
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return None
+        choices = json.loads(data).get("choices") or [{}]
+        return choices[0].get("delta", {}).get("content") or ""
 
-        resp = requests.post(url, json=payload)
+    @classmethod
+    def _deltas(cls, lines: Iterable[str]) -> Iterator[str]:
+        for line in lines:
+            delta = cls._delta(line)
+            if delta is None:
+                return
+            if delta:
+                yield delta
+
+    def generate(self, prompt: str):
+        url = f"{self.base_url}/v1/chat/completions"
+        resp = self.session.post(url, json=self._payload(prompt), timeout=self.timeout)
+        resp.raise_for_status()
+
+        return resp.json()["choices"][0]["message"]["content"]
+
+    async def agenerate(self, prompt: str):
+        await self.start()
+        resp = await self._client.post("/v1/chat/completions", json=self._payload(prompt))
         resp.raise_for_status()
 
         return resp.json()["choices"][0]["message"]["content"]
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """Trả về từng đoạn câu trả lời ngay khi LLM sinh ra ("stream": true, Server-Sent Events)."""
+        url = f"{self.base_url}/v1/chat/completions"
+        with self.session.post(url, json=self._payload(prompt, stream=True), timeout=self.timeout, stream=True) as resp:
+            resp.raise_for_status()
+            if resp.headers.get("content-type", "").startswith("application/json"):
+                yield resp.json()["choices"][0]["message"]["content"]
+                return
+            # text/event-stream thường không ghi charset
+            resp.encoding = resp.encoding or "utf-8"
+            yield from self._deltas(resp.iter_lines(decode_unicode=True))
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        """Phiên bản async của stream."""
+        await self.start()
+        async with self._client.stream("POST", "/v1/chat/completions", json=self._payload(prompt, stream=True)) as resp:
+            resp.raise_for_status()
+            if resp.headers.get("content-type", "").startswith("application/json"):
+                # Server không hỗ trợ stream: trả về cả câu trả lời một lần
+                data = json.loads(await resp.aread())
+                yield data["choices"][0]["message"]["content"]
+                return
+            async for line in resp.aiter_lines():
+                delta = self._delta(line)
+                if delta is None:
+                    return
+                if delta:
+                    yield delta
@@ -1,12 +1,62 @@
+from typing import Optional
+
+import httpx
 import requests
 
+
 class RagClient:
-    def __init__(self, base_url: str):
+    def __init__(self, base_url: str, timeout: float = 10.0, max_connections: int = 100):
         self.base_url = base_url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        # Giữ kết nối keep-alive thay vì mở kết nối mới mỗi request
+        self.session = requests.Session()
+        self._client: Optional[httpx.AsyncClient] = None
 
-    def retrieve(self, query: str, top_k: int = 1):
-        url = f"{self.base_url}/search"
+    async def start(self) -> None:
+        """Tạo AsyncClient dùng chung (gọi khi app startup)."""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            )
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self.session.close()
+
+    @staticmethod
+    def _payload(query: str, top_k: int, include_embedding: bool, context_tokens: Optional[int] = None) -> dict:
         payload = {"query": query, "top_k": top_k}
-        resp = requests.post(url, json=payload)
+        if include_embedding:
+            payload["include_embedding"] = True
+        if context_tokens:
+            # rag-service chọn chunk (bỏ gần trùng, MMR) trong ngân sách token rồi mới ghép context
+            payload["context_tokens"] = context_tokens
+        return payload
+
+    def retrieve(self, query: str, top_k: int = 1, include_embedding: bool = False, context_tokens: Optional[int] = None):
+        url = f"{self.base_url}/search"
+        payload = self._payload(query, top_k, include_embedding, context_tokens)
+        resp = self.session.post(url, json=payload, timeout=self.timeout)
+        resp.raise_for_status()
+        return resp.json()
+
+    async def aretrieve(
+        self, query: str, top_k: int = 1, include_embedding: bool = False, context_tokens: Optional[int] = None
+    ):
+        await self.start()
+        resp = await self._client.post("/search", json=self._payload(query, top_k, include_embedding, context_tokens))
         resp.raise_for_status()
         return resp.json()
+
+    async def aretrieve_many(self, queries: list[str], top_k: int = 1, context_tokens: Optional[int] = None):
+        """Gửi nhiều câu hỏi trong một request tới /search/batch; trả về list response như /search."""
+        await self.start()
+        payload = {"queries": [self._payload(q, top_k, False, context_tokens) for q in queries]}
+        resp = await self._client.post("/search/batch", json=payload)
+        resp.raise_for_status()
+        return resp.json()["results"]
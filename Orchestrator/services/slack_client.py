@@ -1,11 +1,33 @@
 import hashlib
 import hmac
+import time
 from typing import Optional
 
 import httpx
 from fastapi import HTTPException
 
-from config import SLACK_BOT_TOKEN, SLACK_SIGNING_SECRET
+from config import SLACK_API_URL, SLACK_BOT_TOKEN, SLACK_SIGNING_SECRET, SLACK_TIMEOUT
+
+
+class SlackAPIError(HTTPException):
+    """Lỗi khi gọi Slack Web API (mạng, HTTP lỗi hoặc {"ok": false}), tách biệt với lỗi của LLM."""
+
+
+# AsyncClient dùng chung cho mọi tin nhắn (tạo khi app startup)
+_client: Optional[httpx.AsyncClient] = None
+
+
+async def start_slack_client() -> None:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(base_url=SLACK_API_URL, timeout=httpx.Timeout(SLACK_TIMEOUT))
+
+
+async def close_slack_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
 
 
 def verify_slack_request(request_body: bytes, timestamp: Optional[str], signature: Optional[str]) -> None:
@@ -26,26 +48,78 @@ def verify_slack_request(request_body: bytes, timestamp: Optional[str], signatur
         raise HTTPException(status_code=400, detail="Invalid Slack signature")
 
 
-async def send_to_slack(channel: str, text: str) -> None:
-    """
-    Send a message to a Slack channel.
-    """
+async def _call_slack(method: str, payload: dict) -> dict:
     if not SLACK_BOT_TOKEN:
-        raise HTTPException(status_code=500, detail="Slack bot token is not configured.")
+        raise SlackAPIError(status_code=500, detail="Slack bot token is not configured.")
 
-    url = "https://slack.com/api/chat.postMessage"
+    await start_slack_client()
     headers = {
         "Authorization": f"Bearer {SLACK_BOT_TOKEN}",
         "Content-Type": "application/json",
     }
-    payload = {"channel": channel, "text": text}
+    try:
+        resp = await _client.post(f"/{method}", json=payload, headers=headers)
+        resp.raise_for_status()
+        data = resp.json()
+    except (httpx.HTTPError, ValueError) as exc:
+        raise SlackAPIError(status_code=502, detail=f"Error calling Slack {method}: {exc}") from exc
+    if data.get("ok") is False:
+        raise SlackAPIError(status_code=502, detail=f"Slack {method} failed: {data.get('error')}")
+    return data
+
+
+async def send_to_slack(channel: str, text: str) -> Optional[str]:
+    """
+    Send a message to a Slack channel. Returns the message ts (used to update it later).
+    """
+    data = await _call_slack("chat.postMessage", {"channel": channel, "text": text})
+    return data.get("ts")
+
+
+async def update_slack_message(channel: str, ts: str, text: str) -> None:
+    """Sửa nội dung một tin nhắn đã gửi (chat.update)."""
+    await _call_slack("chat.update", {"channel": channel, "ts": ts, "text": text})
+
+
+class SlackMessageStream:
+    """
+    Hiển thị câu trả lời đang được sinh trên Slack: gửi tin nhắn ngay khi có đoạn đầu tiên, sau đó
+    sửa tại chỗ (chat.update) tối đa một lần mỗi `interval` giây để không vượt rate limit của Slack.
+    """
 
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.post(url, json=payload, headers=headers, timeout=10)
-            resp.raise_for_status()
-        except httpx.RequestError as exc:
-            raise HTTPException(status_code=502, detail=f"Error sending message to Slack: {exc}") from exc
+    def __init__(self, channel: str, interval: float = 1.0):
+        self.channel = channel
+        self.interval = interval
+        self.ts: Optional[str] = None
+        self.updates = 0
+        self._posted = False
+        self._sent = ""
+        # Thời điểm gửi gần nhất, kể cả lần gửi lỗi: Slack lỗi (vd. rate limit) thì cũng không gửi dồn
+        self._last_sent = float("-inf")
 
+    async def _send(self, text: str) -> None:
+        self._last_sent = time.monotonic()
+        if not self._posted:
+            self.ts = await send_to_slack(self.channel, text)
+            self._posted = True
+        elif self.ts is not None:
+            await update_slack_message(self.channel, self.ts, text)
+            self.updates += 1
+        else:
+            # Slack không trả về ts: không sửa được tin nhắn, chờ gửi bản cuối
+            return
+        self._sent = text
 
+    async def push(self, text: str) -> None:
+        """`text`: toàn bộ câu trả lời tính tới hiện tại. Chỉ gửi khi tới lượt (throttle)."""
+        if not text.strip():
+            return
+        if time.monotonic() - self._last_sent >= self.interval:
+            await self._send(text)
 
+    async def finish(self, text: str) -> None:
+        """Gửi bản cuối (luôn gửi nếu khác bản đang hiển thị)."""
+        if self._posted and self.ts is None:
+            await send_to_slack(self.channel, text)
+        elif text != self._sent or not self._posted:
+            await self._send(text)
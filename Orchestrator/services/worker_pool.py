@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable[None]]
+
+
+class WorkerPool:
+    """
+    Hàng đợi có giới hạn + N worker asyncio xử lý job nền.
+    Khi hàng đợi đầy, submit() trả về False để nơi gọi tự xử lý (backpressure).
+    """
+
+    def __init__(self, concurrency: int = 4, max_queue: int = 100, name: str = "worker"):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.name = name
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list[asyncio.Task] = []
+        # Metrics
+        self.submitted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.max_depth = 0
+        self._total_wait = 0.0
+        self._total_run = 0.0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"{self.name}-{i}") for i in range(self.concurrency)
+        ]
+
+    async def stop(self, drain_timeout: float = 10.0) -> None:
+        """Chờ xử lý nốt các job đang chờ (tối đa drain_timeout giây) rồi dừng worker."""
+        if self._queue is not None and self._workers:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("%s: stop with %d job(s) still queued", self.name, self.depth)
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, job: Job) -> bool:
+        if self._queue is None:
+            self.start()
+        try:
+            self._queue.put_nowait((time.monotonic(), job))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.submitted += 1
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        return True
+
+    async def _worker(self, worker_id: int) -> None:
+        while True:
+            enqueued_at, job = await self._queue.get()
+            started = time.monotonic()
+            self._total_wait += started - enqueued_at
+            self.in_flight += 1
+            try:
+                await job()
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                self.failed += 1
+                logger.error("%s-%d: job failed: %s", self.name, worker_id, exc, exc_info=True)
+            finally:
+                self.in_flight -= 1
+                self._total_run += time.monotonic() - started
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        done = self.processed + self.failed
+        return {
+            "concurrency": self.concurrency,
+            "max_queue": self.max_queue,
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "in_flight": self.in_flight,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "failed": self.failed,
+            "avg_wait_s": self._total_wait / done if done else 0.0,
+            "avg_run_s": self._total_run / done if done else 0.0,
+        }
@@ -0,0 +1,68 @@
+"""
+Server giả lập của loadtest.py (RAG + LLM + Slack API) chạy bằng uvicorn trong thread.
+Biến môi trường được đặt trước khi import config / main để Orchestrator trỏ vào server này.
+"""
+import os
+import socket
+import sys
+import threading
+import time
+
+import httpx
+import pytest
+import uvicorn
+
+# Chạy được cả từ thư mục gốc repo lẫn từ Orchestrator/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loadtest import build_stub_app  # noqa: E402
+
+# Mỗi từ của STUB_ANSWER cách nhau TOKEN_DELAY giây khi stream
+TOKEN_DELAY = 0.02
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+STUB_URL = f"http://127.0.0.1:{_free_port()}"
+os.environ.update({
+    "RAG_URL": STUB_URL,
+    "LLM_BASE_URL": STUB_URL,
+    "SLACK_API_URL": STUB_URL,
+    "SLACK_BOT_TOKEN": "xoxb-test",
+    "SLACK_SIGNING_SECRET": "test",
+    "SLACK_STREAM": "1",
+    "ANSWER_CACHE_SIMILARITY": "0",
+})
+
+
+@pytest.fixture(scope="session")
+def stub():
+    app = build_stub_app(rag_delay=0, llm_delay=0, slack_delay=0, token_delay=TOKEN_DELAY)
+    port = int(STUB_URL.rsplit(":", 1)[1])
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("stub server did not start")
+        time.sleep(0.01)
+    yield STUB_URL
+    server.should_exit = True
+    thread.join(5)
+
+
+@pytest.fixture
+def stub_stats(stub):
+    """Hàm trả về số tin nhắn / update Slack mà stub nhận được kể từ đầu test."""
+    before = httpx.get(f"{stub}/stats").json()
+
+    def delta() -> dict:
+        now = httpx.get(f"{stub}/stats").json()
+        return {key: now[key] - before[key] for key in before}
+
+    return delta
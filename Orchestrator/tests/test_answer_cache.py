@@ -0,0 +1,94 @@
+import math
+
+import pytest
+
+from services import answer_cache as answer_cache_module
+from services.answer_cache import AnswerCache, context_fingerprint
+
+CONTEXT = context_fingerprint("Học phí ngành CNTT là 40 triệu đồng / năm.")
+OTHER_CONTEXT = context_fingerprint("Điểm chuẩn năm nay là 25 điểm.")
+
+
+def unit(*values: float) -> list[float]:
+    norm = math.sqrt(sum(v * v for v in values))
+    return [v / norm for v in values]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_exact_hit_ignores_case_and_spaces():
+    cache = AnswerCache()
+    cache.set("Học phí  ngành CNTT?", CONTEXT, "40 triệu")
+    assert cache.get("học phí ngành cntt?", CONTEXT) == "40 triệu"
+    assert cache.get("học phí ngành cntt?", OTHER_CONTEXT) is None
+
+
+def test_semantic_hit_at_or_above_threshold():
+    cache = AnswerCache(similarity_threshold=0.9)
+    cache.set("Học phí ngành CNTT?", CONTEXT, "40 triệu", unit(1, 0))
+    # cos = 0.9 đúng bằng ngưỡng: trúng
+    assert cache.get("CNTT học phí bao nhiêu?", CONTEXT, [0.9, math.sqrt(1 - 0.81)]) == "40 triệu"
+    # cos = 0.89: không trúng
+    assert cache.get("Ngành CNTT học mấy năm?", CONTEXT, [0.89, math.sqrt(1 - 0.89 ** 2)]) is None
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_semantic_match_picks_most_similar_question():
+    cache = AnswerCache(similarity_threshold=0.5)
+    cache.set("q1", CONTEXT, "a1", unit(1, 0))
+    cache.set("q2", CONTEXT, "a2", unit(1, 1))
+    assert cache.get("q3", CONTEXT, unit(1, 0.9)) == "a2"
+    assert cache.get("q4", CONTEXT, unit(1, 0.1)) == "a1"
+
+
+def test_different_fingerprint_never_matches():
+    cache = AnswerCache(similarity_threshold=0.5)
+    embedding = unit(1, 2, 3)
+    cache.set("Học phí ngành CNTT?", CONTEXT, "40 triệu", embedding)
+    # Cùng câu hỏi, cùng embedding nhưng context đã đổi: câu trả lời cũ không dùng được
+    assert cache.get("Học phí ngành CNTT?", OTHER_CONTEXT, embedding) is None
+    assert cache.get("CNTT học phí?", OTHER_CONTEXT, embedding) is None
+
+
+def test_zero_threshold_disables_fuzzy_hits():
+    cache = AnswerCache(similarity_threshold=0)
+    assert not cache.semantic_enabled
+    embedding = unit(1, 2, 3)
+    cache.set("Học phí ngành CNTT?", CONTEXT, "40 triệu", embedding)
+    assert cache.get("CNTT học phí?", CONTEXT, embedding) is None
+    assert cache.get("Học phí ngành CNTT?", CONTEXT, embedding) == "40 triệu"
+    assert cache.stats()["semantic_hits"] == 0
+
+
+def test_ttl_expiry_evicts_from_context_index(clock):
+    cache = AnswerCache(ttl=60, similarity_threshold=0.5)
+    cache.set("q1", CONTEXT, "a1", unit(1, 0))
+    cache.set("q2", CONTEXT, "a2", unit(0, 1))
+    clock[0] += 30
+    cache.set("q3", OTHER_CONTEXT, "a3", unit(1, 0))
+    clock[0] += 31
+
+    # Hết hạn khi tra chính xác
+    assert cache.get("q1", CONTEXT) is None
+    assert cache._by_context[CONTEXT] == {"q2"}
+    # Hết hạn khi quét theo embedding: không trả câu trả lời cũ, bỏ khỏi chỉ mục theo context
+    assert cache.get("q4", CONTEXT, unit(0, 1)) is None
+    assert CONTEXT not in cache._by_context
+    assert cache.get("q3", OTHER_CONTEXT) == "a3"
+    assert cache.stats()["size"] == 1
+
+
+def test_lru_eviction_keeps_context_index_in_sync():
+    cache = AnswerCache(maxsize=2, similarity_threshold=0.5)
+    cache.set("q1", CONTEXT, "a1", unit(1, 0))
+    cache.set("q2", OTHER_CONTEXT, "a2", unit(1, 0))
+    assert cache.get("q1", CONTEXT) == "a1"
+    cache.set("q3", OTHER_CONTEXT, "a3", unit(0, 1))
+    # q2 ít dùng gần đây nhất bị đẩy ra
+    assert cache._by_context == {CONTEXT: {"q1"}, OTHER_CONTEXT: {"q3"}}
+    assert cache.get("q5", OTHER_CONTEXT, unit(1, 0)) is None
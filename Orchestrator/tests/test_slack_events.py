@@ -0,0 +1,99 @@
+"""/slack/events: hàng đợi đầy trả 503 mà không ghi nhận event, retry sau đó được nhận và lọc trùng."""
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from loadtest import sign
+from services.worker_pool import WorkerPool
+
+SECRET = "test"
+
+
+def post_event(client: TestClient, event_id: str, retry: int | None = None):
+    body = json.dumps({
+        "type": "event_callback",
+        "event_id": event_id,
+        "event": {"type": "message", "channel": "C1", "text": f"câu hỏi {event_id}"},
+    }).encode()
+    timestamp = str(int(time.time()))
+    headers = {
+        "Content-Type": "application/json",
+        "X-Slack-Request-Timestamp": timestamp,
+        "X-Slack-Signature": sign(SECRET, timestamp, body),
+    }
+    if retry is not None:
+        headers.update({"X-Slack-Retry-Num": str(retry), "X-Slack-Retry-Reason": "http_timeout"})
+    return client.post("/slack/events", content=body, headers=headers)
+
+
+def wait_for(predicate, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def slack(monkeypatch):
+    """main.app với một worker, hàng đợi 1 chỗ và job trả lời giả chờ tới khi test cho chạy tiếp."""
+    answered: list[str] = []
+    release = threading.Event()
+
+    async def answer(channel: str, text: str):
+        answered.append(text)
+        while not release.is_set():
+            await asyncio.sleep(0.01)
+
+    monkeypatch.setattr(main, "slack_workers", WorkerPool(1, 1, name="slack-test"))
+    monkeypatch.setattr(main, "processed_events", OrderedDict())
+    monkeypatch.setattr(main, "answer_slack_event", answer)
+    with TestClient(main.app) as client:
+        try:
+            yield client, answered, release
+        finally:
+            release.set()
+
+
+def test_full_queue_rejects_without_marking_processed(slack):
+    client, answered, release = slack
+    assert post_event(client, "Ev1").json() == {"ok": True}
+    # Ev1 đang chạy trên worker duy nhất, Ev2 chiếm chỗ duy nhất trong hàng đợi
+    wait_for(lambda: answered == ["câu hỏi Ev1"])
+    assert post_event(client, "Ev2").status_code == 200
+    resp = post_event(client, "Ev3")
+    assert resp.status_code == 503
+    assert "Ev3" not in main.processed_events
+    assert main.slack_workers.stats()["rejected"] == 1
+
+    release.set()
+    wait_for(lambda: main.slack_workers.depth == 0 and main.slack_workers.in_flight == 0)
+    # Slack gửi lại Ev3: lần này được nhận vì lần trước chưa được ghi nhận
+    assert post_event(client, "Ev3", retry=1).json() == {"ok": True}
+    wait_for(lambda: len(answered) == 3)
+    assert answered == ["câu hỏi Ev1", "câu hỏi Ev2", "câu hỏi Ev3"]
+
+
+def test_retry_after_enqueue_is_deduplicated(slack):
+    client, answered, release = slack
+    release.set()
+    assert post_event(client, "Ev1").json() == {"ok": True}
+    wait_for(lambda: main.slack_workers.stats()["processed"] == 1)
+    # Retry (kể cả http_timeout) của event đã vào hàng đợi: trả 200, không trả lời lần hai
+    for retry in (1, 2):
+        assert post_event(client, "Ev1", retry=retry).json() == {"ok": True}
+    assert main.slack_workers.stats()["submitted"] == 1
+    assert answered == ["câu hỏi Ev1"]
+    # Chữ ký sai vẫn bị từ chối kể cả khi là retry
+    resp = client.post(
+        "/slack/events",
+        content=json.dumps({"type": "event_callback", "event_id": "Ev1", "event": {}}).encode(),
+        headers={"X-Slack-Request-Timestamp": str(int(time.time())), "X-Slack-Signature": "v0=bad",
+                 "X-Slack-Retry-Num": "1", "X-Slack-Retry-Reason": "http_timeout"},
+    )
+    assert resp.status_code == 400
@@ -0,0 +1,189 @@
+"""Stream câu trả lời (LLMClient.astream, /ask SSE, Slack) với server giả lập của loadtest.py."""
+import asyncio
+import json
+import logging
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from loadtest import STUB_ANSWER
+from services import slack_client
+from services.llm_client import LLMClient
+from services.slack_client import SlackAPIError, SlackMessageStream, close_slack_client
+
+WORDS = STUB_ANSWER.split()
+
+
+def run(coro):
+    """Chạy coroutine trong event loop mới rồi đóng các client dùng chung (chúng gắn với loop đó)."""
+    async def wrapper():
+        try:
+            return await coro
+        finally:
+            await close_slack_client()
+            await main.llm.aclose()
+            await main.rag_client.aclose()
+
+    return asyncio.run(wrapper())
+
+
+def collect(client: LLMClient) -> list[tuple[float, str]]:
+    async def go():
+        started = time.monotonic()
+        try:
+            return [(time.monotonic() - started, chunk) async for chunk in client.astream("xin chào")]
+        finally:
+            await client.aclose()
+
+    return asyncio.run(go())
+
+
+def test_astream_yields_tokens_as_they_arrive(stub):
+    chunks = collect(LLMClient(stub, "test"))
+    assert [chunk for _, chunk in chunks] == [WORDS[0]] + [" " + word for word in WORDS[1:]]
+    # Đoạn đầu tới trước khi stub sinh xong cả câu trả lời
+    assert chunks[0][0] < chunks[-1][0] / 2
+
+
+def test_astream_falls_back_to_json_response(stub, monkeypatch):
+    client = LLMClient(stub, "test")
+    # Không gửi "stream": true thì stub trả về JSON như server không hỗ trợ stream
+    monkeypatch.setattr(client, "_payload", lambda prompt, stream=False: LLMClient._payload(client, prompt))
+    assert [chunk for _, chunk in collect(client)] == [STUB_ANSWER]
+
+
+def sse_events(lines) -> list[tuple[str | None, dict]]:
+    events, name = [], None
+    for line in lines:
+        if line.startswith("event:"):
+            name = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            events.append((name, json.loads(line[len("data:"):])))
+            name = None
+    return events
+
+
+def test_ask_sse_streams_deltas_then_done(stub):
+    question = "SSE: học phí ngành CNTT?"
+    with TestClient(main.app) as client:
+        with client.stream("POST", "/ask", json={"question": question, "stream": True}) as resp:
+            assert resp.headers["content-type"].startswith("text/event-stream")
+            events = sse_events(resp.iter_lines())
+        assert events[0][0] == "meta" and events[0][1]["cached"] is False
+        assert question in events[0][1]["finalpromt"]
+        deltas = [data["delta"] for name, data in events[1:-1]]
+        assert len(deltas) == len(WORDS) and "".join(deltas) == STUB_ANSWER
+        name, done = events[-1]
+        assert name == "done" and done["answer"] == STUB_ANSWER and done["cached"] is False
+        assert 0 < done["ttft_ms"] <= done["total_ms"]
+
+        # Lần hai (header Accept thay cho "stream"): lấy từ answer cache, một delta duy nhất
+        resp = client.post("/ask", json={"question": question}, headers={"Accept": "text/event-stream"})
+        events = sse_events(resp.text.splitlines())
+    assert [name for name, _ in events] == ["meta", None, "done"]
+    assert events[1][1]["delta"] == STUB_ANSWER and events[2][1]["cached"] is True
+
+
+def test_message_stream_throttles_updates(stub, stub_stats):
+    message = SlackMessageStream("C1", interval=10)
+
+    async def go():
+        partial = ""
+        for word in WORDS:
+            partial += word + " "
+            await message.push(partial)
+        await message.finish(STUB_ANSWER)
+
+    run(go())
+    # Tin nhắn đầu gửi ngay, các push trong cùng interval bị bỏ, bản cuối luôn được gửi
+    assert stub_stats() == {"slack_messages": 1, "slack_updates": 1}
+    assert message.updates == 1 and message.ts is not None
+
+
+def test_message_stream_follows_llm_stream(stub, stub_stats):
+    interval = 0.1
+    message = SlackMessageStream("C1", interval=interval)
+
+    async def go():
+        partial = ""
+        async for chunk in main.llm.astream("xin chào"):
+            partial += chunk
+            await message.push(partial)
+        await message.finish(partial)
+
+    started = time.monotonic()
+    run(go())
+    elapsed = time.monotonic() - started
+    stats = stub_stats()
+    assert stats["slack_messages"] == 1 and stats["slack_updates"] == message.updates
+    # Tối đa một update mỗi interval (+ bản cuối), ít hơn hẳn số token
+    assert 1 <= message.updates <= elapsed / interval + 1 < len(WORDS)
+    assert message._sent == STUB_ANSWER
+
+
+def cached_answers(monkeypatch) -> list[str]:
+    answers = []
+    original = main.answer_cache.set
+
+    def spy(question, fingerprint, answer, embedding=None):
+        answers.append(answer)
+        original(question, fingerprint, answer, embedding)
+
+    monkeypatch.setattr(main.answer_cache, "set", spy)
+    return answers
+
+
+def test_slack_event_streams_answer(stub, stub_stats, monkeypatch, caplog):
+    monkeypatch.setattr(main, "SLACK_UPDATE_INTERVAL", 0.05)
+    answers = cached_answers(monkeypatch)
+    caplog.set_level(logging.INFO, logger="main")
+    run(main.answer_slack_event("C1", "Slack: điểm chuẩn năm nay?"))
+    stats = stub_stats()
+    assert answers == [STUB_ANSWER]
+    assert stats["slack_messages"] == 1 and stats["slack_updates"] >= 1
+    assert not [r for r in caplog.records if r.levelno >= logging.WARNING]
+
+
+def test_slack_failure_is_not_an_llm_error(stub, stub_stats, monkeypatch, caplog):
+    # Slack API trả 404 cho mọi lời gọi: postMessage / update đều lỗi
+    monkeypatch.setattr(slack_client, "SLACK_API_URL", f"{stub}/missing")
+    monkeypatch.setattr(main, "SLACK_UPDATE_INTERVAL", 0.05)
+    answers = cached_answers(monkeypatch)
+    caplog.set_level(logging.INFO, logger="main")
+    run(main.answer_slack_event("C1", "Slack lỗi: lịch thi?"))
+    messages = [r.getMessage() for r in caplog.records]
+    # Câu trả lời vẫn được sinh đầy đủ; lỗi được ghi là lỗi Slack, không phải lỗi LLM
+    assert answers == [STUB_ANSWER]
+    assert any("Slack API error while streaming" in m for m in messages)
+    assert any("Slack API error, answer not delivered" in m for m in messages)
+    assert not any("LLM error" in m for m in messages)
+    assert stub_stats() == {"slack_messages": 0, "slack_updates": 0}
+
+
+def test_llm_failure_still_answers_on_slack(stub, stub_stats, monkeypatch, caplog):
+    monkeypatch.setattr(main, "llm", LLMClient(f"{stub}/missing", "test"))
+    caplog.set_level(logging.INFO, logger="main")
+    run(main.answer_slack_event("C1", "LLM lỗi: học bổng?"))
+    messages = [r.getMessage() for r in caplog.records]
+    assert any("LLM error" in m for m in messages)
+    assert not any("Slack API error" in m for m in messages)
+    # Câu trả lời dự phòng (context từ RAG) vẫn được gửi
+    assert stub_stats()["slack_messages"] == 1
+
+
+def test_call_slack_rejects_not_ok_response(monkeypatch):
+    async def post(*args, **kwargs):
+        return httpx.Response(200, json={"ok": False, "error": "channel_not_found"}, request=httpx.Request("POST", "x"))
+
+    async def go():
+        await slack_client.start_slack_client()
+        monkeypatch.setattr(slack_client._client, "post", post)
+        with pytest.raises(SlackAPIError) as exc_info:
+            await slack_client.send_to_slack("C1", "hi")
+        return exc_info.value
+
+    error = run(go())
+    assert error.status_code == 502 and "channel_not_found" in error.detail
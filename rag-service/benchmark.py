@@ -0,0 +1,512 @@
+"""
+Script đo hiệu năng các thành phần của rag-service.
+
+Ví dụ:
+    python benchmark.py embed --file data1.txt --batch-size 64
+    python benchmark.py backends --backends torch onnx onnx-int8
+    python benchmark.py index --n 200000 --k 3 --nprobe 8 16 64 --ef 32 64 128
+    python benchmark.py sparse --n 500000
+    python benchmark.py quant --n 200000 --rescore 0 50 100
+    python benchmark.py microbatch --concurrency 1 8 32 --wait-ms 2 5
+    python benchmark.py rerank --candidates 0 10 20 50 --k 3
+    python benchmark.py chunk --dir data/crawl/pages --size 300 500 800
+"""
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from rag.chunker import Chunker
+from rag.config import CHUNK_OVERLAP, CHUNK_SIZE
+from rag.embedder import Embedder
+from rag.index import FlatIndex, HNSWIndex, IVFIndex
+from rag.loader import DocumentLoader
+from rag.sparse_index import BM25Index
+from rag.storage import Segment, normalize_rows, write_segment
+
+
+def load_chunks(file_path: str, limit: int | None = None) -> list[str]:
+    text = DocumentLoader().load(file_path)
+    chunks = Chunker(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP).split_text(text)
+    return chunks[:limit] if limit else chunks
+
+
+def bench_embed(args):
+    """So sánh vòng lặp get_embedding từng đoạn với get_embeddings theo batch."""
+    chunks = load_chunks(args.file, args.limit)
+    embedder = Embedder(batch_size=args.batch_size, num_workers=args.workers)
+    # Encode thử một lần để loại bỏ chi phí khởi động khỏi kết quả đo
+    embedder.get_embeddings(chunks[:8])
+    print(f"Số đoạn: {len(chunks)}")
+
+    started = time.perf_counter()
+    for chunk in chunks:
+        embedder.get_embedding(chunk)
+    loop_time = time.perf_counter() - started
+    print(f"loop  : {loop_time:.2f}s  {len(chunks) / loop_time:.1f} chunks/s")
+
+    started = time.perf_counter()
+    embedder.get_embeddings(chunks)
+    batch_time = time.perf_counter() - started
+    print(
+        f"batch : {batch_time:.2f}s  {len(chunks) / batch_time:.1f} chunks/s "
+        f"(batch_size={args.batch_size}, workers={args.workers}, x{loop_time / batch_time:.1f})"
+    )
+    embedder.close()
+
+
+def bench_backends(args):
+    """
+    Độ trễ một câu hỏi, throughput theo batch và độ lệch embedding của từng backend
+    so với backend đầu tiên trong danh sách (mặc định torch làm chuẩn).
+    """
+    chunks = load_chunks(args.file, args.limit)
+    queries = chunks[:args.queries]
+    print(f"Số đoạn: {len(chunks)}, số câu hỏi: {len(queries)}, batch_size={args.batch_size}")
+    print(
+        f"{'backend':<10} {'load(s)':>8} {'ms/query':>9} {'chunks/s':>9} "
+        f"{'max |diff|':>11} {'min cos':>8} {'top1 agree':>11}"
+    )
+    reference = None
+    for backend in args.backends:
+        started = time.perf_counter()
+        embedder = Embedder(batch_size=args.batch_size, backend=backend)
+        load_s = time.perf_counter() - started
+        embedder.get_embeddings(chunks[:8])
+
+        started = time.perf_counter()
+        for query in queries:
+            embedder.get_embeddings([query])
+        query_ms = (time.perf_counter() - started) * 1000 / max(len(queries), 1)
+
+        started = time.perf_counter()
+        vectors = normalize_rows(embedder.get_embeddings(chunks))
+        throughput = len(chunks) / (time.perf_counter() - started)
+
+        if reference is None:
+            reference = vectors
+            diff, min_cos, agree = 0.0, 1.0, 1.0
+        else:
+            diff = float(np.abs(vectors - reference).max())
+            min_cos = float((vectors * reference).sum(axis=1).min())
+            # Câu hỏi lấy từ chính các đoạn: so đoạn gần nhất (trừ chính nó) giữa hai backend
+            q_ref, q_new = reference[:len(queries)] @ reference.T, vectors[:len(queries)] @ vectors.T
+            for scores in (q_ref, q_new):
+                scores[np.arange(len(queries)), np.arange(len(queries))] = -np.inf
+            agree = float((q_ref.argmax(axis=1) == q_new.argmax(axis=1)).mean())
+        print(
+            f"{backend:<10} {load_s:>8.2f} {query_ms:>9.2f} {throughput:>9.1f} "
+            f"{diff:>11.2e} {min_cos:>8.5f} {agree:>11.3f}"
+        )
+        embedder.close()
+
+
+def synthetic_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    """Vector ngẫu nhiên có cấu trúc cụm (gần với embedding thật hơn phân phối đều)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(n // 200, 1), dim)).astype(np.float32)
+    labels = rng.integers(0, len(centers), size=n)
+    return normalize_rows(centers[labels] + 0.6 * rng.normal(size=(n, dim)).astype(np.float32))
+
+
+def _timed_search(index, queries: np.ndarray, k: int):
+    started = time.perf_counter()
+    ids = np.vstack([index.search(q[None, :], k)[1] for q in queries])
+    return ids, (time.perf_counter() - started) * 1000 / len(queries)
+
+
+def _recall(ids: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(row) & set(gt)) for row, gt in zip(ids.tolist(), truth.tolist()))
+    return hits / truth.size
+
+
+def bench_index(args):
+    """Recall@k và độ trễ mỗi truy vấn của flat / ivf / hnsw so với quét chính xác bằng numpy."""
+    if args.db:
+        from rag.vector_store import VectorStore
+        vectors = np.ascontiguousarray(VectorStore(index_backend="exact").vectors)
+    else:
+        vectors = synthetic_vectors(args.n, args.dim)
+    n, dim = vectors.shape
+    rng = np.random.default_rng(1)
+    queries = normalize_rows(vectors[rng.integers(0, n, size=args.queries)] + 0.3 * rng.normal(size=(args.queries, dim)))
+    k = args.k
+
+    started = time.perf_counter()
+    truth = []
+    for q in queries:
+        scores = vectors @ q
+        truth.append(np.argpartition(scores, n - k)[n - k:])
+    exact_ms = (time.perf_counter() - started) * 1000 / len(queries)
+    truth = np.array(truth)
+    print(f"n={n} dim={dim} queries={len(queries)} k={k}")
+    print(f"{'backend':<8} {'param':<14} {'build(s)':>9} {'recall@k':>9} {'ms/query':>9}")
+    print(f"{'exact':<8} {'-':<14} {0:>9.2f} {1:>9.3f} {exact_ms:>9.3f}")
+
+    for backend in args.backends:
+        if backend == "flat":
+            index, settings = FlatIndex(dim), [("-", None)]
+        elif backend == "ivf":
+            index, settings = IVFIndex(dim), [(f"nprobe={p}", ("nprobe", p)) for p in args.nprobe]
+        else:
+            index, settings = HNSWIndex(dim), [(f"ef_search={e}", ("ef_search", e)) for e in args.ef]
+        started = time.perf_counter()
+        index.build(vectors)
+        build_s = time.perf_counter() - started
+        for label, setting in settings:
+            if setting:
+                setattr(index, *setting)
+            ids, ms = _timed_search(index, queries, k)
+            print(f"{backend:<8} {label:<14} {build_s:>9.2f} {_recall(ids, truth):>9.3f} {ms:>9.3f}")
+
+
+def bench_quant(args):
+    """
+    Bộ nhớ cho lượt quét đầu và recall@k / độ trễ của float16 / int8 (có / không chấm lại float32)
+    so với quét float32 chính xác. Dòng "python list" là cách lưu cũ (list float của Python) để đối chiếu.
+    """
+    from rag.vector_store import VectorStore
+    tmp = None
+    if args.db:
+        store = VectorStore(index_backend="exact")
+    else:
+        tmp = tempfile.TemporaryDirectory()
+        store = VectorStore(index_backend="exact", db_path=os.path.join(tmp.name, "db"))
+        vectors = synthetic_vectors(args.n, args.dim)
+        store.add_documents([f"doc {i}" for i in range(args.n)], vectors)
+    n, dim = len(store), store._manifest["dim"]
+    if n == 0:
+        print("DB trống")
+        return
+    rng = np.random.default_rng(1)
+    base = store.vectors[rng.integers(0, n, size=args.queries)]
+    queries = normalize_rows(base + 0.3 * rng.normal(size=base.shape).astype(np.float32))
+    k = args.k
+
+    def run():
+        keys, started = [], time.perf_counter()
+        for q in queries:
+            keys.append([(r["source"], r["chunk"]) for r in store.search(q, k)])
+        return keys, (time.perf_counter() - started) * 1000 / len(queries)
+
+    store.vector_dtype = "float32"
+    truth, exact_ms = run()
+    python_list = sys.getsizeof([0.0] * dim) + dim * sys.getsizeof(1.0)
+    print(f"n={n} dim={dim} queries={len(queries)} k={k} segments={len(store.segments)}")
+    print(f"{'vectors':<12} {'rescore':>8} {'MB':>9} {'bytes/vec':>10} {'recall@k':>9} {'ms/query':>9}")
+    print(f"{'python list':<12} {'-':>8} {python_list * n / 2**20:>9.1f} {python_list:>10} {'-':>9} {'-':>9}")
+    print(f"{'float32':<12} {'-':>8} {4 * dim * n / 2**20:>9.1f} {4 * dim:>10} {1:>9.3f} {exact_ms:>9.3f}")
+    for dtype, itemsize in (("float16", 2), ("int8", 1)):
+        store.vector_dtype = dtype
+        started = time.perf_counter()
+        store._sync_derived()
+        build_s = time.perf_counter() - started
+        for rescore in args.rescore:
+            store.rescore_candidates = rescore
+            found, ms = run()
+            recall = sum(len(set(a) & set(b)) for a, b in zip(found, truth)) / max(sum(len(t) for t in truth), 1)
+            print(
+                f"{dtype:<12} {rescore or '-':>8} {itemsize * dim * n / 2**20:>9.1f} "
+                f"{itemsize * dim:>10} {recall:>9.3f} {ms:>9.3f}"
+            )
+        print(f"  (dựng {dtype}: {build_s:.2f}s)")
+    if tmp is not None:
+        for seg in store.segments:
+            seg.close()
+        tmp.cleanup()
+
+
+def synthetic_docs(n: int, vocab: int, length: int = 20, seed: int = 0) -> list[str]:
+    """Văn bản giả với phân bố từ Zipf (vài từ rất phổ biến, đa số hiếm) giống văn bản thật."""
+    rng = np.random.default_rng(seed)
+    words = rng.zipf(1.3, size=(n, length)) % vocab
+    return [" ".join(f"w{w}" for w in row) for row in words]
+
+
+def bench_sparse(args):
+    """Thời gian dựng postings BM25 và độ trễ mỗi truy vấn từ khoá."""
+    if args.db:
+        from rag.vector_store import VectorStore
+        store = VectorStore(index_backend="exact")
+        view = store._view
+        tmp = None
+    else:
+        docs = synthetic_docs(args.n, args.vocab)
+        tmp = tempfile.TemporaryDirectory()
+        seg_path = os.path.join(tmp.name, "seg-000001")
+        write_segment(seg_path, docs, [np.zeros((len(docs), 1), dtype=np.float32)], dim=1)
+        segments = [Segment(seg_path)]
+        view = (segments, np.array([0, len(docs)], dtype=np.int64), None, 0)
+    segments, starts = view[:2]
+    index = BM25Index()
+    started = time.perf_counter()
+    index.sync(segments)
+    build_s = time.perf_counter() - started
+
+    rng = np.random.default_rng(1)
+    n = int(starts[-1])
+    queries = [" ".join(segments[0].chunk(int(i)).split()[:3]) for i in rng.integers(0, segments[0].count, size=args.queries)]
+    started = time.perf_counter()
+    for q in queries:
+        index.search(q, view, args.k)
+    ms = (time.perf_counter() - started) * 1000 / len(queries)
+    print(f"docs={n} queries={len(queries)} k={args.k}")
+    print(f"build postings: {build_s:.2f}s, search: {ms:.3f} ms/query")
+    if tmp is not None:
+        segments[0].close()
+        tmp.cleanup()
+
+
+def bench_microbatch(args):
+    """
+    Throughput và độ trễ p50 / p99 của các truy vấn đồng thời: mỗi truy vấn tự encode + search
+    (như /search trước đây) so với gom qua MicroBatcher. Câu hỏi không lặp lại để không trúng cache.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from rag.batcher import MicroBatcher
+    from rag.rag_engine import RagEngine
+    engine = RagEngine()
+    engine.warmup()
+    base = load_chunks(args.file, args.limit) or ["câu hỏi thử"]
+    counter = iter(range(10**9))
+
+    def next_query() -> str:
+        i = next(counter)
+        return f"{base[i % len(base)][:200]} #{i}"
+
+    def run(label: str, call, concurrency: int):
+        latencies = []
+
+        def worker(_):
+            for _ in range(args.requests):
+                query = next_query()
+                started = time.perf_counter()
+                call(query)
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(worker, range(concurrency)))
+        elapsed = time.perf_counter() - started
+        p50, p99 = np.percentile(latencies, [50, 99])
+        return f"{label:<16} {concurrency:>5} {len(latencies) / elapsed:>9.1f} {p50:>8.2f} {p99:>8.2f}"
+
+    print(f"{'mode':<16} {'conc':>5} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'avg batch':>10}")
+    for concurrency in args.concurrency:
+        print(run("single", lambda q: engine.retrieve(q, top_k=args.k), concurrency))
+        for wait_ms in args.wait_ms:
+            batcher = MicroBatcher(
+                lambda queries: engine.retrieve_many(queries, args.k),
+                max_batch=args.max_batch,
+                max_wait_ms=wait_ms,
+                workers=args.workers,
+            )
+            line = run(f"batch {wait_ms}ms", batcher, concurrency)
+            print(f"{line} {batcher.stats()['avg_batch']:>10.1f}")
+            batcher.close()
+
+
+def _eval_set(store, args) -> list[tuple[str, str]]:
+    """
+    Cặp (câu hỏi, đoạn cần tìm). Có --eval: file TSV "câu hỏi<TAB>chuỗi con của chunk đúng".
+    Không có: tự sinh từ DB - câu hỏi là một đoạn liên tiếp khoảng nửa số từ của một chunk ngẫu nhiên.
+    """
+    if args.eval:
+        with open(args.eval, "r", encoding="utf-8") as f:
+            rows = [line.rstrip("\n").split("\t") for line in f if "\t" in line]
+        return [(row[0], row[1]) for row in rows]
+    chunks = [chunk for chunk in store.iter_chunks() if len(chunk.split()) >= 6]
+    rng = np.random.default_rng(1)
+    pairs = []
+    for i in rng.choice(len(chunks), size=min(args.queries, len(chunks)), replace=False):
+        words = chunks[i].split()
+        size = max(len(words) // 2, 3)
+        start = int(rng.integers(0, len(words) - size + 1))
+        pairs.append((" ".join(words[start:start + size]), chunks[i]))
+    return pairs
+
+
+def bench_rerank(args):
+    """
+    Độ chính xác (hit@k, MRR@k) và độ trễ theo số ứng viên N đưa vào cross-encoder.
+    N = 0 là không rerank (chỉ bước tìm kiếm thứ nhất).
+    """
+    from rag.rag_engine import RagEngine
+    engine = RagEngine()
+    pairs = _eval_set(engine.vector_store, args)
+    if not pairs:
+        print("Không có dữ liệu đánh giá (DB trống?)")
+        return
+    reranker = engine.reranker
+    # Chạy thử để loại chi phí load model / lần gọi đầu khỏi kết quả đo
+    reranker.score_pairs([(pairs[0][0], pairs[0][1])], budget_ms=0)
+    k = args.k
+    print(f"queries={len(pairs)} k={k} mode={args.mode or 'mặc định'} budget_ms={args.budget}")
+    print(f"{'N':>5} {'hit@k':>7} {'MRR@k':>7} {'stage1 ms':>10} {'rerank ms':>10} {'p95 ms':>8}")
+    for n in args.candidates:
+        reranker.cache.clear()
+        hits, rr, stage1, stage2, totals = 0, 0.0, 0.0, 0.0, []
+        for query, expected in pairs:
+            started = time.perf_counter()
+            results = engine.retrieve(query, top_k=max(n, k), mode=args.mode, rerank=False)
+            middle = time.perf_counter()
+            if n:
+                results = reranker.rerank(query, results, k, budget_ms=args.budget)
+            finished = time.perf_counter()
+            stage1 += middle - started
+            stage2 += finished - middle
+            totals.append((finished - started) * 1000)
+            rank = next((i for i, r in enumerate(results[:k], start=1) if expected in r["chunk"]), None)
+            if rank:
+                hits += 1
+                rr += 1.0 / rank
+        q = len(pairs)
+        print(
+            f"{n:>5} {hits / q:>7.3f} {rr / q:>7.3f} {stage1 * 1000 / q:>10.2f} "
+            f"{stage2 * 1000 / q:>10.2f} {np.percentile(totals, 95):>8.2f}"
+        )
+
+
+def _line_chunks(lines):
+    """Chunker cũ để đối chiếu: mỗi dòng không rỗng (trừ dòng SOURCE:) là một chunk."""
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("SOURCE:"):
+            yield line
+
+
+def bench_chunk(args):
+    """
+    Số chunk, thời gian ingest (encode + ghi segment) và kích thước DB trên dữ liệu crawl:
+    chunker cũ (mỗi dòng một chunk) so với chunker gom theo CHUNK_SIZE.
+    """
+    from rag.vector_store import VectorStore
+    if args.dir:
+        files = sorted(glob.glob(os.path.join(args.dir, "**", "*.txt"), recursive=True))
+    else:
+        files = [args.file]
+    loader = DocumentLoader()
+    lines = [line for path in files for line in loader.iter_lines(path)]
+    embedder = Embedder(batch_size=args.batch_size)
+    embedder.get_embeddings(["khởi động"] * 8)
+    print(f"{len(files)} file, {sum(os.path.getsize(p) for p in files) / 2**20:.2f} MB, model {embedder.model_name}")
+
+    configs = [("mỗi dòng (cũ)", None)]
+    for size in args.size:
+        length_fn = embedder.count_tokens if args.unit == "tokens" else None
+        configs.append((f"{size}/{args.overlap} {args.unit}", Chunker(size, args.overlap, length_fn=length_fn)))
+    print(
+        f"{'chunker':<20} {'chunks':>8} {'avg chars':>10} {'max chars':>10} {'chunk s':>8} "
+        f"{'ingest s':>9} {'chunks/s':>9} {'DB MB':>8}"
+    )
+    for label, chunker in configs:
+        started = time.perf_counter()
+        chunks = list(_line_chunks(lines) if chunker is None else chunker.iter_chunks(lines))
+        chunk_s = time.perf_counter() - started
+        with tempfile.TemporaryDirectory() as tmp:
+            store = VectorStore(index_backend="exact", db_path=os.path.join(tmp, "db"))
+            started = time.perf_counter()
+            for i in range(0, len(chunks), args.batch_size):
+                batch = chunks[i:i + args.batch_size]
+                store.add_documents(batch, embedder.get_embeddings(batch), flush=False)
+            store.save_db()
+            ingest_s = time.perf_counter() - started
+            db_bytes = sum(
+                os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(tmp) for name in names
+            )
+            for seg in store.segments:
+                seg.close()
+        lengths = [len(chunk) for chunk in chunks] or [0]
+        print(
+            f"{label:<20} {len(chunks):>8} {np.mean(lengths):>10.0f} {max(lengths):>10} {chunk_s:>8.2f} "
+            f"{ingest_s:>9.2f} {len(chunks) / max(ingest_s, 1e-9):>9.1f} {db_bytes / 2**20:>8.2f}"
+        )
+    embedder.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark rag-service")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_embed = sub.add_parser("embed", help="Throughput tạo embedding (chunks/s)")
+    p_embed.add_argument("--file", default="data1.txt")
+    p_embed.add_argument("--limit", type=int, default=None)
+    p_embed.add_argument("--batch-size", type=int, default=64)
+    p_embed.add_argument("--workers", type=int, default=0)
+    p_embed.set_defaults(func=bench_embed)
+
+    p_backends = sub.add_parser("backends", help="So sánh backend embedding: độ trễ, throughput, độ lệch")
+    p_backends.add_argument("--file", default="data1.txt")
+    p_backends.add_argument("--limit", type=int, default=2000)
+    p_backends.add_argument("--queries", type=int, default=100)
+    p_backends.add_argument("--batch-size", type=int, default=64)
+    p_backends.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"])
+    p_backends.set_defaults(func=bench_backends)
+
+    p_index = sub.add_parser("index", help="Recall@k / độ trễ của các backend chỉ mục")
+    p_index.add_argument("--db", action="store_true", help="Dùng vector trong DB hiện tại thay vì dữ liệu giả")
+    p_index.add_argument("--n", type=int, default=100000)
+    p_index.add_argument("--dim", type=int, default=384)
+    p_index.add_argument("--queries", type=int, default=200)
+    p_index.add_argument("--k", type=int, default=3)
+    p_index.add_argument("--backends", nargs="+", default=["flat", "ivf", "hnsw"])
+    p_index.add_argument("--nprobe", type=int, nargs="+", default=[4, 16, 64])
+    p_index.add_argument("--ef", type=int, nargs="+", default=[32, 64, 128])
+    p_index.set_defaults(func=bench_index)
+
+    p_quant = sub.add_parser("quant", help="Bộ nhớ / recall@k / độ trễ của vector float16 / int8")
+    p_quant.add_argument("--db", action="store_true", help="Dùng vector trong DB hiện tại thay vì dữ liệu giả")
+    p_quant.add_argument("--n", type=int, default=100000)
+    p_quant.add_argument("--dim", type=int, default=384)
+    p_quant.add_argument("--queries", type=int, default=200)
+    p_quant.add_argument("--k", type=int, default=3)
+    p_quant.add_argument("--rescore", type=int, nargs="+", default=[0, 20, 100])
+    p_quant.set_defaults(func=bench_quant)
+
+    p_sparse = sub.add_parser("sparse", help="Độ trễ tìm kiếm từ khoá BM25")
+    p_sparse.add_argument("--db", action="store_true", help="Dùng chunk trong DB hiện tại thay vì dữ liệu giả")
+    p_sparse.add_argument("--n", type=int, default=200000)
+    p_sparse.add_argument("--vocab", type=int, default=50000)
+    p_sparse.add_argument("--queries", type=int, default=200)
+    p_sparse.add_argument("--k", type=int, default=50)
+    p_sparse.set_defaults(func=bench_sparse)
+
+    p_micro = sub.add_parser("microbatch", help="Throughput / p99 khi gom truy vấn đồng thời thành batch")
+    p_micro.add_argument("--file", default="data1.txt")
+    p_micro.add_argument("--limit", type=int, default=1000)
+    p_micro.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    p_micro.add_argument("--requests", type=int, default=50, help="Số truy vấn mỗi client")
+    p_micro.add_argument("--wait-ms", type=float, nargs="+", default=[2, 5])
+    p_micro.add_argument("--max-batch", type=int, default=32)
+    p_micro.add_argument("--workers", type=int, default=2)
+    p_micro.add_argument("--k", type=int, default=3)
+    p_micro.set_defaults(func=bench_microbatch)
+
+    p_rerank = sub.add_parser("rerank", help="Độ chính xác / độ trễ của cross-encoder theo số ứng viên N")
+    p_rerank.add_argument("--eval", default=None, help="File TSV: câu hỏi<TAB>chuỗi con của chunk đúng")
+    p_rerank.add_argument("--queries", type=int, default=100, help="Số câu hỏi tự sinh khi không có --eval")
+    p_rerank.add_argument("--candidates", type=int, nargs="+", default=[0, 5, 10, 20, 50])
+    p_rerank.add_argument("--k", type=int, default=3)
+    p_rerank.add_argument("--mode", default=None)
+    p_rerank.add_argument("--budget", type=float, default=0, help="Ngân sách rerank (ms), 0 = không giới hạn")
+    p_rerank.set_defaults(func=bench_rerank)
+
+    p_chunk = sub.add_parser("chunk", help="Số chunk / thời gian ingest / kích thước DB theo cấu hình chunker")
+    p_chunk.add_argument("--file", default="data1.txt")
+    p_chunk.add_argument("--dir", default=None, help="Thư mục trang do crawler.py ghi (mọi file *.txt)")
+    p_chunk.add_argument("--size", type=int, nargs="+", default=[CHUNK_SIZE])
+    p_chunk.add_argument("--overlap", type=int, default=CHUNK_OVERLAP)
+    p_chunk.add_argument("--unit", choices=["chars", "tokens"], default="chars")
+    p_chunk.add_argument("--batch-size", type=int, default=64)
+    p_chunk.set_defaults(func=bench_chunk)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
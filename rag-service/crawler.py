@@ -1,74 +1,354 @@
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+"""
+Crawler bất đồng bộ (asyncio + httpx) lấy nội dung web làm dữ liệu cho RAG.
+
+- Một AsyncClient dùng chung (giữ kết nối), giới hạn số request đồng thời và tốc độ theo từng host
+- Frontier (hàng đợi URL) khử trùng ngay khi thêm: mỗi URL chỉ vào hàng đợi một lần
+- Mỗi trang ghi ngay ra một file riêng trong PAGES_DIR (và nối vào OUTPUT_FILE nếu có),
+  định dạng "SOURCE: url" như trước nên `/ingest-dir` chỉ encode lại các trang thay đổi
+- Checkpoint (STATE_FILE) lưu frontier + ETag / Last-Modified của từng trang: bị ngắt thì chạy lại
+  sẽ làm tiếp; lần crawl sau gửi If-None-Match / If-Modified-Since, trang không đổi (304) không tải lại
+
+Thử với site local:
+    python -m http.server 8001 --directory tests/fixtures/site
+    python crawler.py --base http://127.0.0.1:8001/ --pages-dir data/crawl/pages --rps 50
+"""
+import argparse
+import asyncio
+import hashlib
+import json
 import os
 import time
+from collections import deque
+from urllib.parse import urldefrag, urljoin, urlparse
+
+import httpx
+from bs4 import BeautifulSoup
+
+from rag.storage import write_json
 
 # --- CẤU HÌNH ---
 BASE_URL = "https://vju.vnu.edu.vn/"
 MAX_PAGES = 100  # Tăng lên 100 trang để lấy nhiều dữ liệu hơn
 OUTPUT_FILE = "data1.txt"
+PAGES_DIR = "data/crawl/pages"
+STATE_FILE = "data/crawl/state.json"
+# Tổng số request đồng thời, số request đồng thời và số request / giây tối đa trên một host
+CONCURRENCY = 16
+PER_HOST_CONCURRENCY = 2
+PER_HOST_RPS = 2.0
+REQUEST_TIMEOUT = 10
+# Ghi checkpoint sau mỗi bấy nhiêu trang
+CHECKPOINT_EVERY = 20
+# Chỉ lưu câu dài hơn MIN_TEXT_CHARS ký tự và trang có nội dung từ MIN_PAGE_CHARS ký tự
+MIN_TEXT_CHARS = 20
+MIN_PAGE_CHARS = 500
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+SKIP_EXTENSIONS = (".pdf", ".jpg", ".jpeg", ".png", ".gif", ".svg", ".zip", ".rar", ".doc", ".docx", ".xls", ".xlsx", ".mp4")
+
+
+def normalize_url(url: str) -> str:
+    """Bỏ #fragment và viết thường scheme / host để cùng một trang chỉ có một khoá."""
+    url, _ = urldefrag(url)
+    parsed = urlparse(url)
+    return parsed._replace(scheme=parsed.scheme.lower(), netloc=parsed.netloc.lower(), path=parsed.path or "/").geturl()
+
+
+class Frontier:
+    """Hàng đợi FIFO (deque, pop O(1)) kèm tập URL đã thấy: URL trùng bị bỏ ngay khi thêm."""
+
+    def __init__(self):
+        self.queue: deque[str] = deque()
+        self.seen: set[str] = set()
+
+    def add(self, url: str) -> bool:
+        if url in self.seen:
+            return False
+        self.seen.add(url)
+        self.queue.append(url)
+        return True
+
+    def pop(self) -> str | None:
+        return self.queue.popleft() if self.queue else None
+
+    def __len__(self):
+        return len(self.queue)
+
+
+class HostLimiter:
+    """Mỗi host: tối đa `concurrency` request cùng lúc và các request bắt đầu cách nhau >= 1 / rps giây."""
+
+    def __init__(self, concurrency: int = PER_HOST_CONCURRENCY, rps: float = PER_HOST_RPS):
+        self.concurrency = concurrency
+        self.interval = 1.0 / rps if rps > 0 else 0.0
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self._next_start: dict[str, float] = {}
+
+    async def acquire(self, host: str):
+        semaphore = self._semaphores.setdefault(host, asyncio.Semaphore(self.concurrency))
+        await semaphore.acquire()
+        # Giữ chỗ thời điểm bắt đầu trước khi ngủ để các request cùng host xếp hàng đều nhau
+        now = time.monotonic()
+        start = max(now, self._next_start.get(host, 0.0))
+        self._next_start[host] = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def release(self, host: str):
+        self._semaphores[host].release()
 
-visited_urls = set()
-queue_urls = [BASE_URL]
 
-def get_soup(url):
+def extract(html: bytes, url: str, allowed_hosts: set[str]) -> tuple[str, list[str]]:
+    """Nội dung chính (p, h1-h3, li) và các link nội bộ của trang."""
+    soup = BeautifulSoup(html, "html.parser")
+    # Mẹo: Chỉ lấy thẻ <p>, tiêu đề và <li> để bớt rác menu/footer
+    lines = [tag.get_text(strip=True) for tag in soup.find_all(["p", "h1", "h2", "h3", "li"])]
+    body_text = "".join(text + "\n" for text in lines if len(text) > MIN_TEXT_CHARS)
+    links = []
+    for a in soup.find_all("a", href=True):
+        link = normalize_url(urljoin(url, a["href"]))
+        parsed = urlparse(link)
+        if parsed.scheme not in ("http", "https") or parsed.path.lower().endswith(SKIP_EXTENSIONS):
+            continue
+        if any(parsed.netloc == host or parsed.netloc.endswith("." + host) for host in allowed_hosts):
+            links.append(link)
+    return body_text, list(dict.fromkeys(links))
+
+
+class Crawler:
+    def __init__(
+        self,
+        base_urls: list[str],
+        max_pages: int = MAX_PAGES,
+        pages_dir: str = PAGES_DIR,
+        state_file: str = STATE_FILE,
+        output_file: str | None = OUTPUT_FILE,
+        concurrency: int = CONCURRENCY,
+        limiter: HostLimiter | None = None,
+        fresh: bool = False,
+    ):
+        self.base_urls = [normalize_url(url) for url in base_urls]
+        self.allowed_hosts = {urlparse(url).netloc for url in self.base_urls}
+        self.max_pages = max_pages
+        self.pages_dir = pages_dir
+        self.state_file = state_file
+        self.output_file = output_file
+        self.concurrency = concurrency
+        self.limiter = limiter or HostLimiter()
+        self.frontier = Frontier()
+        # url -> {etag, last_modified, file, links}: validator cho lần crawl sau và link để đi tiếp khi 304
+        self.pages: dict[str, dict] = {}
+        self.in_flight: set[str] = set()
+        self.stats = {"saved": 0, "fetched": 0, "not_modified": 0, "skipped": 0, "errors": 0}
+        self._since_checkpoint = 0
+        self._load_state(fresh)
+
+    # --- checkpoint ---
+    def _load_state(self, fresh: bool):
+        state = {}
+        if os.path.exists(self.state_file):
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        self.pages = state.get("pages", {})
+        if state and not state.get("done") and not fresh:
+            # Lần chạy trước bị ngắt: làm tiếp từ frontier đã lưu
+            self.frontier.seen = set(state.get("seen", []))
+            self.frontier.queue = deque(state.get("frontier", []))
+            self.stats.update(state.get("stats", {}))
+            print(f"[crawl] Tiếp tục từ checkpoint: {len(self.frontier)} URL chờ, {self.stats['saved']} trang đã lưu")
+            return
+        if self.output_file:
+            # Lần crawl mới: ghi lại file gộp từ đầu
+            os.makedirs(os.path.dirname(self.output_file) or ".", exist_ok=True)
+            open(self.output_file, "w", encoding="utf-8").close()
+        for url in self.base_urls:
+            self.frontier.add(url)
+
+    def checkpoint(self, done: bool = False):
+        os.makedirs(os.path.dirname(self.state_file) or ".", exist_ok=True)
+        write_json(self.state_file, {
+            "done": done,
+            # URL đang tải dở được đưa lại vào đầu hàng đợi khi tiếp tục
+            "frontier": list(self.in_flight) + list(self.frontier.queue),
+            "seen": sorted(self.frontier.seen),
+            "pages": self.pages,
+            "stats": self.stats,
+        })
+        self._since_checkpoint = 0
+
+    # --- ghi kết quả ---
+    def _page_path(self, url: str) -> str:
+        name = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.pages_dir, f"{name}.txt")
+
+    def _write_page(self, url: str, body_text: str) -> str:
+        path = self._page_path(url)
+        os.makedirs(self.pages_dir, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(f"SOURCE: {url}\n{body_text}\n{'=' * 20}\n")
+        os.replace(tmp_path, path)
+        return path
+
+    def _drop_page(self, url: str, previous: dict | None, forget: bool = False):
+        """
+        Trang không còn đủ điều kiện lưu: xoá file cũ để `/ingest-dir` không nạp lại nội dung lỗi thời;
+        `forget` (404 / 410, không phải HTML) thì bỏ luôn trang khỏi self.pages.
+        """
+        if previous and previous.get("file"):
+            try:
+                os.remove(previous["file"])
+                print(f"[crawl] Đã xoá trang không còn hợp lệ: {url}")
+            except FileNotFoundError:
+                pass
+        if forget:
+            self.pages.pop(url, None)
+
+    def _append_output(self, path: str):
+        if not self.output_file:
+            return
+        with open(path, "r", encoding="utf-8") as src, open(self.output_file, "a", encoding="utf-8") as out:
+            out.write(src.read())
+            out.flush()
+
+    # --- crawl ---
+    async def _fetch(self, client: httpx.AsyncClient, url: str):
+        entry = self.pages.get(url, {})
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        host = urlparse(url).netloc
+        await self.limiter.acquire(host)
+        try:
+            return await client.get(url, headers=headers)
+        finally:
+            self.limiter.release(host)
+
+    async def _visit(self, client: httpx.AsyncClient, url: str):
+        """Xử lý một URL; lỗi (mạng, parse, ghi file) chỉ làm hỏng trang này chứ không dừng cả lần crawl."""
+        try:
+            await self._process(client, url)
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"[crawl] Lỗi {url}: {e}")
+
+    async def _process(self, client: httpx.AsyncClient, url: str):
+        entry = self.pages.get(url)
+        resp = await self._fetch(client, url)
+
+        if resp.status_code == 304 and entry is not None:
+            # Trang không đổi: giữ file cũ, đi tiếp theo các link đã lưu
+            self.stats["not_modified"] += 1
+            links = entry.get("links", [])
+            if entry.get("file") and os.path.exists(entry["file"]) and self.stats["saved"] < self.max_pages:
+                self.stats["saved"] += 1
+                self._append_output(entry["file"])
+        elif resp.status_code == 200 and "html" in resp.headers.get("content-type", "html"):
+            self.stats["fetched"] += 1
+            body_text, links = await asyncio.to_thread(extract, resp.content, str(resp.url), self.allowed_hosts)
+            previous, entry = entry, {"etag": resp.headers.get("etag"), "last_modified": resp.headers.get("last-modified"), "links": links}
+            if len(body_text) <= MIN_PAGE_CHARS:  # Chỉ lưu trang có nội dung đáng kể
+                self._drop_page(url, previous)
+            elif self.stats["saved"] < self.max_pages:
+                entry["file"] = self._write_page(url, body_text)
+                self.stats["saved"] += 1
+                self._append_output(entry["file"])
+                print(f"[{self.stats['saved']}/{self.max_pages}] Đã lưu: {url}")
+            elif previous and previous.get("file"):
+                # Hết lượt lưu: trang vẫn hợp lệ, giữ file cũ thay vì bỏ rơi nó trên đĩa
+                entry["file"] = previous["file"]
+            self.pages[url] = entry
+        else:
+            self.stats["skipped"] += 1
+            if resp.status_code in (200, 404, 410):
+                # Không còn là HTML (200) hoặc trang đã bị gỡ (404 / 410)
+                self._drop_page(url, entry, forget=True)
+            return
+
+        for link in links:
+            self.frontier.add(link)
+        self._since_checkpoint += 1
+        if self._since_checkpoint >= CHECKPOINT_EVERY:
+            self.checkpoint()
+
+    async def _worker(self, client: httpx.AsyncClient, wake: asyncio.Event):
+        while self.stats["saved"] < self.max_pages:
+            url = self.frontier.pop()
+            if url is None:
+                # Hàng đợi trống: hết việc nếu không còn ai đang tải (không còn link mới nào sắp tới)
+                if not self.in_flight:
+                    wake.set()
+                    return
+                wake.clear()
+                await wake.wait()
+                continue
+            self.in_flight.add(url)
+            cancelled = False
+            try:
+                await self._visit(client, url)
+            except asyncio.CancelledError:
+                # Bị huỷ giữa chừng (Ctrl+C): URL vẫn nằm trong in_flight để checkpoint đưa lại vào hàng đợi
+                cancelled = True
+                raise
+            finally:
+                if not cancelled:
+                    self.in_flight.discard(url)
+                    wake.set()
+
+    async def run(self, client: httpx.AsyncClient | None = None) -> dict:
+        print(f"--- BẮT ĐẦU QUÉT (Max: {self.max_pages} trang, {self.concurrency} luồng) ---")
+        started = time.perf_counter()
+        own_client = client is None
+        if own_client:
+            client = httpx.AsyncClient(
+                headers={"User-Agent": USER_AGENT},
+                timeout=REQUEST_TIMEOUT,
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+            )
+        wake = asyncio.Event()
+        try:
+            await asyncio.gather(*(self._worker(client, wake) for _ in range(self.concurrency)))
+        finally:
+            if own_client:
+                await client.aclose()
+            # Hết frontier hoặc đủ số trang: đánh dấu xong để lần sau bắt đầu lại từ BASE_URL (có điều kiện)
+            done = not self.in_flight and (not self.frontier or self.stats["saved"] >= self.max_pages)
+            self.checkpoint(done=done)
+        self.stats["seconds"] = round(time.perf_counter() - started, 2)
+        print(f"-> HOÀN TẤT: {self.stats}. Nạp vào RAG bằng POST /ingest-dir {{\"path\": \"{self.pages_dir}\"}}")
+        return self.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawler bất đồng bộ cho dữ liệu RAG")
+    parser.add_argument("--base", nargs="+", default=[BASE_URL], help="URL bắt đầu (chỉ đi theo link cùng host)")
+    parser.add_argument("--max-pages", type=int, default=MAX_PAGES)
+    parser.add_argument("--pages-dir", default=PAGES_DIR)
+    parser.add_argument("--state", default=STATE_FILE)
+    parser.add_argument("--output", default=OUTPUT_FILE, help="File gộp mọi trang (bỏ trống để tắt)")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--per-host", type=int, default=PER_HOST_CONCURRENCY)
+    parser.add_argument("--rps", type=float, default=PER_HOST_RPS, help="Số request / giây tối đa trên một host")
+    parser.add_argument("--fresh", action="store_true", help="Bỏ qua checkpoint dở, quét lại từ đầu")
+    args = parser.parse_args()
+
+    crawler = Crawler(
+        args.base,
+        max_pages=args.max_pages,
+        pages_dir=args.pages_dir,
+        state_file=args.state,
+        output_file=args.output or None,
+        concurrency=args.concurrency,
+        limiter=HostLimiter(args.per_host, args.rps),
+        fresh=args.fresh,
+    )
     try:
-        # Thêm header để giả lập trình duyệt, tránh bị chặn
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
-        resp = requests.get(url, headers=headers, timeout=10)
-        if resp.status_code == 200:
-            return BeautifulSoup(resp.content, 'html.parser')
-    except: pass
-    return None
-
-def crawl():
-    print(f"--- BẮT ĐẦU QUÉT SÂU (Max: {MAX_PAGES} trang) ---")
-    
-    content_list = []
-    count = 0
-    
-    # Tạo thư mục nếu chưa có
-    if not os.path.exists("data"): os.makedirs("data")
-
-    while queue_urls and count < MAX_PAGES:
-        current_url = queue_urls.pop(0)
-        
-        if current_url in visited_urls: continue
-        visited_urls.add(current_url)
-
-        print(f"[{count+1}/{MAX_PAGES}] Đang đọc: {current_url}")
-        
-        soup = get_soup(current_url)
-        if not soup: continue
-
-        # 1. Lấy nội dung text
-        # Mẹo: Chỉ lấy thẻ <p> và <div> chính để bớt rác menu/footer
-        body_text = ""
-        for tag in soup.find_all(['p', 'h1', 'h2', 'h3', 'li']):
-            text = tag.get_text(strip=True)
-            if len(text) > 20: # Chỉ lấy câu dài hơn 20 ký tự
-                body_text += text + "\n"
-        
-        if len(body_text) > 500: # Chỉ lưu trang có nội dung đáng kể
-            content_list.append(f"SOURCE: {current_url}\n{body_text}\n{'='*20}\n")
-            count += 1
-        
-        # 2. Tìm link mới để cho vào hàng đợi
-        for a in soup.find_all('a', href=True):
-            full_url = urljoin(BASE_URL, a['href'])
-            parsed = urlparse(full_url)
-            # Chỉ lấy link nội bộ vju.vnu.edu.vn
-            if "vju.vnu.edu.vn" in parsed.netloc and full_url not in visited_urls:
-                queue_urls.append(full_url)
-        
-        # Nghỉ 0.5 giây để không làm sập web trường
-        time.sleep(0.5)
-
-    print(f"\n-> Đang lưu dữ liệu vào {OUTPUT_FILE}...")
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        f.write("".join(content_list))
-    print("-> HOÀN TẤT! Hãy chạy file console để hỏi.")
+        asyncio.run(crawler.run())
+    except KeyboardInterrupt:
+        print(f"-> Đã dừng, checkpoint lưu ở {args.state}: chạy lại cùng lệnh để quét tiếp")
+
 
 if __name__ == "__main__":
-    crawl()
\ No newline at end of file
+    main()
@@ -0,0 +1,52 @@
+"""
+Lưu model embedding vào thư mục local (EMBEDDING_MODEL_PATH) cho cả 3 backend của Embedder:
+    <out>/                            - model PyTorch (backend "torch")
+    <out>/onnx/model.onnx             - graph ONNX (backend "onnx")
+    <out>/onnx/model_qint8_<cpu>.onnx - graph ONNX lượng tử hoá động int8 (backend "onnx-int8")
+
+Cần sentence-transformers[onnx]. Ví dụ:
+    python export_model.py
+    python export_model.py --out models/all-MiniLM-L6-v2 --cpu avx512_vnni
+"""
+import argparse
+import os
+
+from sentence_transformers import SentenceTransformer
+from sentence_transformers.backend import export_dynamic_quantized_onnx_model
+
+from rag.config import EMBEDDING_MODEL_NAME, EMBEDDING_MODEL_PATH, EMBEDDING_ONNX_FILE
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Xuất model embedding ra thư mục local (torch / onnx / onnx int8)")
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    parser.add_argument("--out", default=EMBEDDING_MODEL_PATH)
+    parser.add_argument(
+        "--cpu",
+        default="avx2",
+        choices=["arm64", "avx2", "avx512", "avx512_vnni"],
+        help="Tập lệnh CPU đích của bản int8",
+    )
+    args = parser.parse_args()
+
+    SentenceTransformer(args.model, device="cpu").save(args.out)
+    print(f"[export] PyTorch -> {args.out}")
+
+    # Lần đầu load với backend onnx, sentence-transformers tự export graph từ bản PyTorch
+    onnx_model = SentenceTransformer(args.out, device="cpu", backend="onnx")
+    onnx_model.save(args.out)
+    onnx_path = os.path.join(args.out, EMBEDDING_ONNX_FILE)
+    if not os.path.exists(onnx_path) and os.path.exists(os.path.join(args.out, "model.onnx")):
+        os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+        os.replace(os.path.join(args.out, "model.onnx"), onnx_path)
+    print(f"[export] ONNX -> {onnx_path}")
+
+    export_dynamic_quantized_onnx_model(onnx_model, args.cpu, args.out)
+    int8_file = f"onnx/model_qint8_{args.cpu}.onnx"
+    print(f"[export] ONNX int8 -> {os.path.join(args.out, int8_file)}")
+    if args.cpu != "avx2":
+        print(f"[export] Đặt EMBEDDING_ONNX_INT8_FILE = \"{int8_file}\" trong rag/config.py")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,58 +1,153 @@
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI, HTTPException
 from fastapi import Query
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
+from rag.batcher import MicroBatcher
+from rag.config import (
+    SEARCH_BATCH_ENABLED,
+    SEARCH_BATCH_MAX_SIZE,
+    SEARCH_BATCH_WAIT_MS,
+    SEARCH_BATCH_WORKERS,
+    WARMUP_ENABLED,
+)
+from rag.embedder import Embedder
+from rag.jobs import JobManager
 from rag.rag_engine import RagEngine
+from rag.startup import StartupTracker
+from rag.storage import normalize_rows
+from rag.vector_store import VectorStore
 
 app = FastAPI(title="RAG Service")
 
-# Khởi tạo RagEngine khi ứng dụng start
+# RagEngine được khởi tạo nền sau khi app start; None cho tới khi model và DB đã load xong
 rag_engine: RagEngine | None = None
+# Auto-ingest lỗi vẫn cho service sẵn sàng (như trước đây: chỉ log cảnh báo)
+startup = StartupTracker(["model", "index", "auto_ingest", "warmup"], optional=("auto_ingest",))
+# Một thread ghi duy nhất: mọi thao tác ghi DB (ingest nền lẫn đồng bộ, upsert / xoá nguồn, auto-ingest)
+# xếp hàng tuần tự ở đây
+jobs = JobManager()
+# Gom các /search đến gần nhau thành một batch (tạo khi startup nếu SEARCH_BATCH_ENABLED)
+search_batcher: MicroBatcher | None = None
 
 
-@app.on_event("startup")
-def startup_event():
+def _auto_ingest(engine: RagEngine):
+    """Auto-ingest a default dataset if vector DB is empty."""
+    if len(engine.vector_store) != 0:
+        startup.skip("auto_ingest", "Vector DB already loaded")
+        return
+    abs_path = os.path.abspath(os.getenv("DEFAULT_DATA_PATH", "data1.txt"))
+    if not os.path.exists(abs_path):
+        startup.skip("auto_ingest", f"file not found {abs_path}")
+        return
+    print(f"[INFO] Auto-ingest from {abs_path}")
+
+    def run(on_progress):
+        engine.vector_store.reset()  # đảm bảo sạch trước khi ingest mặc định
+        return engine.ingest(abs_path, on_progress=on_progress)
+
+    try:
+        startup.run("auto_ingest", jobs.run, "auto-ingest", {"file_path": abs_path}, run)
+    except Exception:
+        pass
+
+
+def _start_engine():
     global rag_engine
     try:
-        rag_engine = RagEngine()
-        # Auto-ingest a default dataset if vector DB is empty
-        if not rag_engine.vector_store.data.get("vectors"):
-            default_data_path = os.getenv("DEFAULT_DATA_PATH", "data1.txt")
-            abs_path = os.path.abspath(default_data_path)
-            if os.path.exists(abs_path):
-                try:
-                    print(f"[INFO] Auto-ingest from {abs_path}")
-                    rag_engine.vector_store.reset()  # đảm bảo sạch trước khi ingest mặc định
-                    rag_engine.ingest(abs_path)
-                except Exception as e:
-                    print(f"[WARN] Auto-ingest failed: {e}")
-            else:
-                print(f"[INFO] Skip auto-ingest: file not found {abs_path}")
-        else:
-            print("[INFO] Vector DB already loaded, skip auto-ingest")
+        # Load model và mở DB / chỉ mục là hai việc độc lập: chạy song song
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            embedder = pool.submit(startup.run, "model", Embedder)
+            vector_store = pool.submit(startup.run, "index", VectorStore)
+            engine = RagEngine(embedder=embedder.result(), vector_store=vector_store.result())
     except Exception as e:
-        # Để app vẫn khởi động (có thể ingest sau), log lỗi khởi tạo nếu có
         print(f"RagEngine init failed: {e}")
-        rag_engine = RagEngine()  # thử khởi tạo lại tối thiểu
+        return
+    # Từ đây đã phục vụ được request; /ready chờ thêm auto-ingest và warmup
+    rag_engine = engine
+    _auto_ingest(engine)
+    if not WARMUP_ENABLED:
+        startup.skip("warmup", "WARMUP_ENABLED = False")
+        return
+    try:
+        startup.run("warmup", engine.warmup)
+    except Exception:
+        pass
+
+
+@app.on_event("startup")
+def startup_event():
+    global search_batcher
+    if SEARCH_BATCH_ENABLED:
+        search_batcher = MicroBatcher(
+            _search_responses,
+            max_batch=SEARCH_BATCH_MAX_SIZE,
+            max_wait_ms=SEARCH_BATCH_WAIT_MS,
+            workers=SEARCH_BATCH_WORKERS,
+            name="search-batch",
+        )
+    # Không chặn startup: uvicorn nhận kết nối ngay, /health và /ready báo trạng thái từng bước
+    threading.Thread(target=_start_engine, name="rag-startup", daemon=True).start()
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    jobs.shutdown()
+    if search_batcher is not None:
+        search_batcher.close()
+    if rag_engine is not None:
+        rag_engine.vector_store.close()
 
 
 class IngestRequest(BaseModel):
     file_path: str
+    # True: chạy nền, trả về ngay job_id (xem /jobs/{job_id}); False: chờ ingest xong như trước
+    background: bool = False
+
+
+class IngestDirRequest(BaseModel):
+    path: str
+    pattern: str = "**/*.txt"
+    background: bool = False
+
+
+def _submit(kind: str, params: dict, fn) -> JSONResponse:
+    job = jobs.submit(kind, params, fn)
+    return JSONResponse(status_code=202, content={"status": job.status, "job_id": job.id})
 
 
 class RetrieveRequest(BaseModel):
     query: str
     top_k: int = 1
     include_prompt: bool = False
+    # "dense" / "sparse" / "hybrid"; bỏ trống = RETRIEVAL_MODE trong rag/config.py
+    mode: str | None = None
+    # Rerank bằng cross-encoder; bỏ trống = RERANK_ENABLED
+    rerank: bool | None = None
+    # Ngân sách token của context trong prompt; bỏ trống = CONTEXT_TOKEN_BUDGET
+    context_tokens: int | None = None
 
 
 @app.post("/ingest")
 def ingest(request: IngestRequest):
     if rag_engine is None:
-        raise HTTPException(status_code=500, detail="RAG Engine not initialized")
+        raise HTTPException(status_code=503, detail="RAG Engine not ready (xem /ready)")
+    engine = rag_engine
+    params = {"file_path": request.file_path}
+
+    def run(on_progress):
+        return engine.ingest(request.file_path, on_progress=on_progress)
+
+    if request.background:
+        if not os.path.exists(request.file_path):
+            raise HTTPException(status_code=404, detail=f"Không tìm thấy file: {request.file_path}")
+        return _submit("ingest", params, run)
     try:
-        rag_engine.ingest(request.file_path)
-        return {"status": "ok"}
+        # Chạy đồng bộ nhưng vẫn qua hàng đợi ghi: request chờ job xong
+        stats = jobs.run("ingest", params, run)
+        return {"status": "ok", **stats}
     except FileNotFoundError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
@@ -63,27 +158,143 @@ def ingest(request: IngestRequest):
 @app.get("/ingest-txt")
 def ingest_txt(path: str = Query(..., description="Đường dẫn file .txt")):
     if rag_engine is None:
-        raise HTTPException(status_code=500, detail="RAG Engine not initialized")
+        raise HTTPException(status_code=503, detail="RAG Engine not ready (xem /ready)")
+    engine = rag_engine
     try:
-        rag_engine.ingest(path)
-        return {"status": "ok", "path": path}
+        stats = jobs.run("ingest", {"file_path": path}, lambda on_progress: engine.ingest(path, on_progress=on_progress))
+        return {"status": "ok", "path": path, **stats}
     except FileNotFoundError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Nạp tăng dần cả thư mục: chỉ encode file mới / đã sửa, xoá chunk của file đã bị xoá
+@app.post("/ingest-dir")
+def ingest_dir(request: IngestDirRequest):
+    if rag_engine is None:
+        raise HTTPException(status_code=503, detail="RAG Engine not ready (xem /ready)")
+    engine = rag_engine
+    params = {"path": request.path, "pattern": request.pattern}
+
+    def run(on_progress):
+        return engine.ingest_dir(request.path, request.pattern, on_progress=on_progress)
+
+    if request.background:
+        if not os.path.isdir(request.path):
+            raise HTTPException(status_code=404, detail=f"Không tìm thấy thư mục: {request.path}")
+        return _submit("ingest-dir", params, run)
+    try:
+        stats = jobs.run("ingest-dir", params, run)
+        return {"status": "ok", "path": request.path, **stats}
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/jobs")
+def list_jobs():
+    return {"jobs": [job.to_dict() for job in jobs.list()]}
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Không có job: {job_id}")
+    return job.to_dict()
+
+
+class UpsertSourceRequest(BaseModel):
+    source: str
+    text: str
+    metadata: dict | None = None
+
+
+class DeleteSourceRequest(BaseModel):
+    source: str
+
+
+# Thay nội dung của một nguồn (vd. một URL) mà không phải nạp lại toàn bộ DB
+@app.post("/sources/upsert")
+def upsert_source(request: UpsertSourceRequest):
+    if rag_engine is None:
+        raise HTTPException(status_code=503, detail="RAG Engine not ready (xem /ready)")
+    engine = rag_engine
+    try:
+        stats = jobs.run(
+            "upsert-source",
+            {"source": request.source},
+            lambda on_progress: engine.upsert_source(request.source, request.text, request.metadata),
+        )
+        return {"status": "ok", "source": request.source, **stats}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/sources/delete")
+def delete_source(request: DeleteSourceRequest):
+    if rag_engine is None:
+        raise HTTPException(status_code=503, detail="RAG Engine not ready (xem /ready)")
+    engine = rag_engine
+    try:
+        result = jobs.run(
+            "delete-source",
+            {"source": request.source},
+            lambda on_progress: {"removed": engine.delete_source(request.source)},
+        )
+        removed = result["removed"]
+        if removed == 0:
+            raise HTTPException(status_code=404, detail=f"Không có chunk nào của nguồn: {request.source}")
+        return {"status": "ok", "source": request.source, "removed": removed}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/sources")
+def list_sources():
+    if rag_engine is None:
+        raise HTTPException(status_code=503, detail="RAG Engine not ready (xem /ready)")
+    return {"sources": rag_engine.vector_store.sources()}
+
+
+# Xuất DB ra file .txt để kiểm tra thủ công (không còn ghi mỗi lần ingest)
+@app.get("/export-txt")
+def export_txt():
+    if rag_engine is None:
+        raise HTTPException(status_code=503, detail="RAG Engine not ready (xem /ready)")
+    try:
+        path = rag_engine.vector_store.export_txt()
+        return {"status": "ok", "path": os.path.abspath(path)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _public(results: list[dict]) -> list[dict]:
+    """Kết quả trả cho client: bỏ "vector" đã lưu (chỉ dùng nội bộ để chọn context)."""
+    return [{key: value for key, value in r.items() if key != "vector"} for r in results]
+
+
 @app.post("/retrieve")
 def retrieve(request: RetrieveRequest):
     if rag_engine is None:
-        raise HTTPException(status_code=500, detail="RAG Engine not initialized")
+        raise HTTPException(status_code=503, detail="RAG Engine not ready (xem /ready)")
     try:
-        results = rag_engine.retrieve(request.query, top_k=request.top_k)
-        response = {"results": results}
+        results = rag_engine.retrieve(
+            request.query, top_k=request.top_k, mode=request.mode, rerank=request.rerank
+        )
+        response = {"results": _public(results)}
         if request.include_prompt:
-            prompt = rag_engine.generate_prompt(request.query, results)
-            response["prompt"] = prompt
+            # Prompt chỉ chứa các chunk được chọn (bỏ gần trùng, MMR, trong ngân sách token)
+            selected, stats = rag_engine.build_context(request.query, results, request.context_tokens)
+            response["prompt"] = rag_engine.generate_prompt(request.query, selected)
+            response["context_stats"] = stats
         return response
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -91,28 +302,137 @@ def retrieve(request: RetrieveRequest):
 class SearchRequest(BaseModel):
     query: str
     top_k: int = 1
+    include_embedding: bool = False
+    mode: str | None = None
+    rerank: bool | None = None
+    # Có giá trị: context chỉ gồm các chunk được chọn trong ngân sách token này (xem RagEngine.build_context)
+    context_tokens: int | None = None
 
 
 class SearchResponse(BaseModel):
     context: str
     results: list
+    embedding: list | None = None
+    context_stats: dict | None = None
+
+
+def _search_responses(requests: list[SearchRequest]) -> list[dict | Exception]:
+    """
+    Xử lý nhiều SearchRequest cùng lúc: mỗi nhóm (mode, rerank) là một lần retrieve_many
+    (encode một batch + một phép nhân ma trận). Nhóm bị lỗi trả về Exception ở đúng vị trí của nó.
+    """
+    engine = rag_engine
+    queries = [q.query for q in requests]
+    batch: list[list[dict] | Exception | None] = [None] * len(queries)
+    # Mỗi chế độ tìm kiếm (dense / sparse / hybrid, có / không rerank) chạy thành một batch riêng
+    for mode, rerank in dict.fromkeys((q.mode, q.rerank) for q in requests):
+        idx = [i for i, q in enumerate(requests) if (q.mode, q.rerank) == (mode, rerank)]
+        try:
+            found = engine.retrieve_many(
+                [queries[i] for i in idx], [requests[i].top_k for i in idx], mode=mode, rerank=rerank
+            )
+        except Exception as e:
+            found = [e] * len(idx)
+        for i, results in zip(idx, found):
+            batch[i] = results
+    wants_embedding = [q.include_embedding and not isinstance(r, Exception) for q, r in zip(requests, batch)]
+    embeddings = None
+    if any(wants_embedding):
+        # Embedding câu hỏi (đã có trong cache) để Orchestrator so khớp câu hỏi tương tự
+        idx = [i for i, wants in enumerate(wants_embedding) if wants]
+        vectors = normalize_rows(engine.embed_queries([queries[i] for i in idx]))
+        embeddings = dict(zip(idx, vectors))
+    responses = []
+    for i, results in enumerate(batch):
+        if isinstance(results, Exception):
+            responses.append(results)
+            continue
+        # Mỗi phần tử có cùng cấu trúc với response của /search
+        item = {"results": _public(results)}
+        context_results = results
+        if requests[i].context_tokens is not None:
+            try:
+                context_results, item["context_stats"] = engine.build_context(
+                    queries[i], results, requests[i].context_tokens
+                )
+            except Exception as e:
+                responses.append(e)
+                continue
+        item["context"] = "\n\n".join([r.get("chunk", "") for r in context_results])
+        if wants_embedding[i]:
+            item["embedding"] = embeddings[i].tolist()
+        responses.append(item)
+    return responses
 
 
 @app.post("/search", response_model=SearchResponse)
 def search(request: SearchRequest):
     if rag_engine is None:
-        raise HTTPException(status_code=500, detail="RAG Engine not initialized")
+        raise HTTPException(status_code=503, detail="RAG Engine not ready (xem /ready)")
     try:
-        results = rag_engine.retrieve(request.query, top_k=request.top_k)
-        context_text = "\n\n".join([r.get("chunk", "") for r in results])
-        return {"context": context_text, "results": results}
+        # Có batcher: chờ trong cửa sổ ngắn để được xử lý chung với các /search đồng thời khác
+        if search_batcher is not None:
+            return search_batcher(request)
+        response = _search_responses([request])[0]
+        if isinstance(response, Exception):
+            raise response
+        return response
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+class BatchSearchRequest(BaseModel):
+    queries: list[SearchRequest]
+
+
+class BatchSearchResponse(BaseModel):
+    results: list[SearchResponse]
+
+
+@app.post("/search/batch", response_model=BatchSearchResponse)
+def search_batch(request: BatchSearchRequest):
+    if rag_engine is None:
+        raise HTTPException(status_code=503, detail="RAG Engine not ready (xem /ready)")
+    try:
+        responses = _search_responses(request.queries)
+        for response in responses:
+            if isinstance(response, Exception):
+                raise response
+        return {"results": responses}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    if rag_engine is None:
+        raise HTTPException(status_code=503, detail="RAG Engine not ready (xem /ready)")
+    stats = rag_engine.cache_stats()
+    stats["search_batch"] = search_batcher.stats() if search_batcher is not None else None
+    return stats
+
+
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    """Liveness: chỉ lỗi khi một bước khởi động bắt buộc thất bại (cần khởi động lại pod)."""
+    stages = startup.snapshot()
+    if startup.failed:
+        return JSONResponse(status_code=503, content={"status": "failed", "stages": stages})
+    return {"status": "ok", "ready": startup.ready, "stages": stages}
+
+
+@app.get("/ready")
+def ready():
+    """Readiness: 200 khi model, DB đã load, auto-ingest và warmup đã xong; 503 trong lúc khởi động."""
+    stages = startup.snapshot()
+    if not startup.ready:
+        status = "failed" if startup.failed else "starting"
+        return JSONResponse(status_code=503, content={"status": status, "stages": stages})
+    return {"status": "ready", "stages": stages}
 
 
 if __name__ == "__main__":
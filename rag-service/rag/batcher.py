@@ -0,0 +1,111 @@
+"""
+Gom các request /search đến gần nhau thành một batch (micro-batching).
+
+Request đầu tiên mở một cửa sổ ngắn (max_wait_ms); mọi request đến trong cửa sổ đó, tối đa max_batch,
+được xử lý bằng một lần gọi `fn` (encode một batch + một phép nhân ma trận) rồi trả kết quả về từng nơi gọi.
+Trong lúc một batch đang chạy, request mới tự dồn lại cho batch sau nên tải càng cao batch càng lớn,
+còn độ trễ thêm vào tối đa chỉ là một cửa sổ. Request đến sau một khoảng lặng dài hơn cửa sổ (tải thấp,
+không có ai để gom chung) được xử lý ngay, không phải chờ.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        fn: Callable[[list], list],
+        max_batch: int = 32,
+        max_wait_ms: float = 2.0,
+        workers: int = 1,
+        name: str = "micro-batch",
+    ):
+        # fn(items) -> list kết quả cùng thứ tự; phần tử là Exception thì nơi gọi tương ứng nhận lỗi đó
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: queue.Queue = queue.Queue()
+        self._last_submit = 0.0
+        self.batches = 0
+        self.items = 0
+        self._threads = [
+            threading.Thread(target=self._loop, name=f"{name}-{i}", daemon=True) for i in range(max(workers, 1))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, item: Any) -> Future:
+        future: Future = Future()
+        now = time.monotonic()
+        # Khoảng cách tới request trước: lớn hơn cửa sổ thì nhiều khả năng không có request nào đi kèm
+        busy = now - self._last_submit <= self.max_wait
+        self._last_submit = now
+        self._queue.put((item, future, busy))
+        return future
+
+    def __call__(self, item: Any, timeout: float | None = None) -> Any:
+        """Gửi một phần tử và chờ kết quả (dùng trong endpoint đồng bộ)."""
+        return self.submit(item).result(timeout)
+
+    def _collect(self) -> list[tuple[Any, Future]]:
+        first = self._queue.get()
+        batch = [first[:2]]
+        deadline = time.monotonic() + (self.max_wait if first[2] else 0.0)
+        while len(batch) < self.max_batch:
+            # Lấy ngay phần đã xếp hàng, chỉ chờ khi hàng đợi trống và còn thời gian trong cửa sổ
+            try:
+                batch.append(self._queue.get_nowait()[:2])
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining)[:2])
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            # (None, None) là tín hiệu dừng từ close()
+            stop = any(future is None for _, future in batch)
+            pending = [
+                (item, future) for item, future in batch
+                if future is not None and future.set_running_or_notify_cancel()
+            ]
+            if pending:
+                self._run(pending)
+            if stop:
+                return
+
+    def _run(self, pending: list[tuple[Any, Future]]):
+        self.batches += 1
+        self.items += len(pending)
+        try:
+            results = self.fn([item for item, _ in pending])
+        except Exception as e:
+            results = [e] * len(pending)
+        for (_, future), result in zip(pending, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch": self.items / self.batches if self.batches else 0.0,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+    def close(self):
+        for _ in self._threads:
+            self._queue.put((None, None, False))
@@ -1,33 +1,150 @@
+import re
+from typing import Callable, Iterable, Iterator
+
+# Ranh giới câu: sau . ! ? … (kể cả khi theo sau là ngoặc / nháy đóng)
+_SENTENCE_END_RE = re.compile(r"(?:(?<=[.!?…])|(?<=[.!?…][\"')\]]))\s+")
+# Dòng phân cách trang do crawler.py ghi ("=" * 20)
+_PAGE_BREAK_RE = re.compile(r"^={3,}$")
+
+
 class Chunker:
-    def __init__(self, chunk_size: int = 800, chunk_overlap: int = 120):
+    def __init__(
+        self,
+        chunk_size: int = 800,
+        chunk_overlap: int = 120,
+        length_fn: Callable[[str], int] | None = None,
+    ):
         """
         Args:
-            chunk_size: Độ dài tối đa của mỗi đoạn văn bản (ký tự).
-            chunk_overlap: Số ký tự lặp lại giữa 2 đoạn liền kề (giúp giữ ngữ cảnh).
+            chunk_size: Độ dài tối đa của mỗi đoạn văn bản (ký tự, hoặc token nếu truyền length_fn).
+            chunk_overlap: Độ dài lặp lại tối đa giữa 2 đoạn liền kề (giúp giữ ngữ cảnh), tính theo câu / dòng trọn vẹn.
+            length_fn: Hàm đo độ dài (mặc định len = số ký tự; vd. Embedder.count_tokens để đo theo token).
         """
+        if chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap phải nhỏ hơn chunk_size")
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.length = length_fn or len
+        # Chi phí của ký tự nối giữa hai phần (1 ký tự khi đo bằng len, thường 0 token với tokenizer)
+        self._sep_cost = self.length(" ")
 
     def split_text(self, text: str) -> list[str]:
         if not text:
             return []
+        return list(self.iter_chunks(text.splitlines()))
+
+    def iter_chunks(self, lines: Iterable[str]) -> Iterator[str]:
+        """Phiên bản generator của split_text cho dữ liệu đọc dần (vd. DocumentLoader.iter_lines)."""
+        for chunk, _ in self.iter_chunks_with_metadata(lines):
+            yield chunk
+
+    def iter_chunks_with_metadata(self, lines: Iterable[str]) -> Iterator[tuple[str, dict | None]]:
+        """
+        Gom các dòng / câu liên tiếp thành chunk dài tối đa chunk_size; chunk sau lặp lại các câu cuối
+        của chunk trước (tối đa chunk_overlap). Dòng dài hơn chunk_size được tách theo câu, câu quá dài
+        thì tách theo từ. Chỉ đọc dòng tiếp theo khi cần nên bộ nhớ không phụ thuộc kích thước file.
+
+        Dòng "SOURCE: <url>" và dòng "=====" do crawler.py ghi là ranh giới trang: chunk không vắt qua
+        hai trang, không thành chunk riêng, và "SOURCE:" gán {"url": <url>} cho các chunk phía sau nó.
+        """
+        metadata = None
+        # Các phần (text, độ dài, ký tự nối phía trước) của chunk đang gom và tổng độ dài
+        parts: list[tuple[str, int, str]] = []
+        size = 0
 
-        # Nếu người dùng cung cấp nhiều dòng, tách mỗi dòng thành một chunk
-        lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
-        if lines:
-            return lines
-
-        # Fallback: cắt theo ký tự (ít dùng khi đã có dòng)
-        chunks = []
-        start = 0
-        text_length = len(text)
-
-        while start < text_length:
-            end = start + self.chunk_size
-            chunk = text[start:end]
-            chunks.append(chunk)
-            if end >= text_length:
+        def emit() -> str:
+            return "".join(sep + text if i else text for i, (text, _, sep) in enumerate(parts))
+
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("SOURCE:") or _PAGE_BREAK_RE.match(line):
+                if parts:
+                    yield emit(), metadata
+                    parts, size = [], 0
+                if line.startswith("SOURCE:"):
+                    url = line[len("SOURCE:"):].strip()
+                    metadata = {"url": url} if url else None
+                continue
+
+            sep = "\n"
+            for piece, length in self._pieces(line):
+                cost = length + (self._sep_cost if parts else 0)
+                if parts and size + cost > self.chunk_size:
+                    yield emit(), metadata
+                    parts, size = self._overlap(parts)
+                    cost = length + (self._sep_cost if parts else 0)
+                    # Phần lặp lại quá dài so với phần mới: bỏ lặp thay vì vượt chunk_size
+                    if size + cost > self.chunk_size:
+                        parts, size, cost = [], 0, length
+                parts.append((piece, length, sep))
+                size += cost
+                # Các câu của cùng một dòng nối bằng dấu cách
+                sep = " "
+        if parts:
+            yield emit(), metadata
+
+    def _overlap(self, parts: list[tuple[str, int, str]]) -> tuple[list[tuple[str, int, str]], int]:
+        """Các phần cuối của chunk vừa xuất có tổng độ dài <= chunk_overlap (giữ câu trọn vẹn)."""
+        kept: list[tuple[str, int, str]] = []
+        size = 0
+        for part in reversed(parts):
+            cost = part[1] + (self._sep_cost if kept else 0)
+            if size + cost > self.chunk_overlap:
                 break
-            start += self.chunk_size - self.chunk_overlap
+            kept.append(part)
+            size += cost
+        return kept[::-1], size
+
+    def _pieces(self, line: str) -> Iterator[tuple[str, int]]:
+        """(phần, độ dài) của một dòng: cả dòng nếu vừa chunk_size, nếu không thì theo câu rồi theo từ."""
+        length = self.length(line)
+        if length <= self.chunk_size:
+            yield line, length
+            return
+        for sentence in _SENTENCE_END_RE.split(line):
+            if not sentence:
+                continue
+            length = self.length(sentence)
+            if length <= self.chunk_size:
+                yield sentence, length
+            else:
+                yield from self._split_words(sentence)
 
-        return chunks
\ No newline at end of file
+    def _split_words(self, sentence: str) -> Iterator[tuple[str, int]]:
+        words, size = [], 0
+        for word in sentence.split():
+            length = self.length(word)
+            if length > self.chunk_size:
+                # Một "từ" dài hơn cả chunk (URL, chuỗi không dấu cách): cắt cứng
+                if words:
+                    yield " ".join(words), size
+                    words, size = [], 0
+                yield from self._cut_word(word)
+                continue
+            cost = length + (self._sep_cost if words else 0)
+            if words and size + cost > self.chunk_size:
+                yield " ".join(words), size
+                words, size, cost = [], 0, length
+            words.append(word)
+            size += cost
+        if words:
+            yield " ".join(words), size
+
+    def _cut_word(self, word: str) -> Iterator[tuple[str, int]]:
+        """
+        Cắt `word` thành các đoạn liên tiếp, mỗi đoạn là tiền tố dài nhất có độ dài <= chunk_size
+        theo đơn vị của length_fn (ký tự hoặc token); độ dài tiền tố được tìm nhị phân theo số ký tự.
+        """
+        while word:
+            lo, hi = 1, len(word)
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                if self.length(word[:mid]) <= self.chunk_size:
+                    lo = mid
+                else:
+                    hi = mid - 1
+            piece = word[:lo]
+            yield piece, self.length(piece)
+            word = word[lo:]
@@ -1,5 +1,111 @@
 # Model nhỏ gọn, chạy tốt trên CPU, miễn phí
-EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2" 
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
 
-# Đường dẫn database vector (sẽ dùng ở bước sau)
-VECTOR_DB_PATH = "data/vector_store.pkl"
\ No newline at end of file
+# Backend chạy model embedding: "torch" (PyTorch), "onnx" (ONNX Runtime) hoặc "onnx-int8" (ONNX lượng tử hoá int8)
+EMBEDDING_BACKEND = "torch"
+# Thư mục model local do `python export_model.py` tạo ra (None hoặc không tồn tại = tải từ HuggingFace)
+EMBEDDING_MODEL_PATH = "models/all-MiniLM-L6-v2"
+# Tên file graph ONNX trong thư mục model
+EMBEDDING_ONNX_FILE = "onnx/model.onnx"
+EMBEDDING_ONNX_INT8_FILE = "onnx/model_qint8_avx2.onnx"
+
+# Thư mục database vector (các segment nhị phân + MANIFEST.json, mở bằng mmap - xem rag/storage.py)
+VECTOR_DB_PATH = "data/vector_store"
+
+# Khi số segment vượt quá ngưỡng này, compaction chạy nền để gộp các segment nhỏ
+COMPACTION_MAX_SEGMENTS = 8
+
+# Segment có tỉ lệ chunk đã xoá (tombstone) từ ngưỡng này trở lên sẽ được compaction ghi lại để thu hồi chỗ
+TOMBSTONE_COMPACT_RATIO = 0.3
+
+# File pickle cũ, tự động chuyển sang định dạng mới ở lần khởi động đầu tiên
+LEGACY_DB_PATH = "data/vector_store.pkl"
+
+# Số đoạn văn bản encode trong một lần gọi model khi ingest
+EMBED_BATCH_SIZE = 64
+
+# Ingest dạng stream: số chunk mỗi lần encode + ghi, và số chunk tối đa giữ trong bộ nhớ
+# trước khi ghi thành một segment (bộ nhớ tối đa phụ thuộc hai số này, không phụ thuộc kích thước file)
+INGEST_BATCH_SIZE = 1024
+INGEST_FLUSH_ROWS = 16384
+
+# Chunk: gom dòng / câu liên tiếp tới CHUNK_SIZE, lặp lại tối đa CHUNK_OVERLAP giữa hai chunk liền kề.
+# CHUNK_UNIT: "chars" (ký tự) hoặc "tokens" (token của tokenizer model embedding; model cắt ở max_seq_length)
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+CHUNK_UNIT = "chars"
+
+# Cache embedding của chunk trên đĩa (theo model + hash nội dung), giữ lại qua reset / ingest lại
+EMBED_CACHE_ENABLED = True
+EMBED_CACHE_PATH = "data/embedding_cache"
+
+# Số process encode song song (chỉ dùng cho máy CPU). 0 hoặc 1 = không dùng pool
+EMBED_NUM_WORKERS = 0
+
+# Chỉ mục tìm kiếm: "exact" (numpy, quét toàn bộ), "flat", "ivf" hoặc "hnsw" (faiss)
+INDEX_BACKEND = "exact"
+
+# Kiểu vector dùng cho lượt quét đầu của backend "exact": "float32" (mặc định), "float16" (1/2 bộ nhớ)
+# hoặc "int8" (1/4, scale theo từng chiều). Bản lượng tử hoá được dựng cạnh vectors.f32 của mỗi segment.
+# Nên dùng int8: numpy đổi float16 -> float32 bằng phần mềm nên float16 quét chậm hơn nhiều
+VECTOR_DTYPE = "float32"
+# Với float16 / int8: số ứng viên đầu được chấm lại chính xác bằng float32 (0 = dùng luôn điểm xấp xỉ)
+RESCORE_CANDIDATES = 100
+
+# Backend faiss: số dòng mới tối đa được quét chính xác (ngoài chỉ mục) trước khi dựng nền chỉ mục mới
+# và công bố nguyên tử; chỉ mục đang được search không bao giờ bị sửa tại chỗ
+INDEX_DELTA_ROWS = 20000
+
+# IVF: số cụm tối đa (tự giảm theo kích thước DB) và số cụm quét khi search
+IVF_NLIST = 1024
+IVF_NPROBE = 16
+
+# HNSW: số liên kết mỗi nút, độ rộng khi xây và khi tìm kiếm
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+# Chế độ tìm kiếm mặc định của RagEngine.retrieve: "dense" (embedding), "sparse" (BM25) hoặc "hybrid"
+# (gộp hai danh sách bằng Reciprocal Rank Fusion)
+RETRIEVAL_MODE = "dense"
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Hybrid: số ứng viên lấy từ mỗi bên trước khi gộp, và hằng số k của RRF: điểm = sum 1 / (k + hạng)
+HYBRID_CANDIDATES = 50
+RRF_K = 60
+
+# Micro-batching cho /search: request đến trong cửa sổ SEARCH_BATCH_WAIT_MS (tính từ request đầu tiên),
+# tối đa SEARCH_BATCH_MAX_SIZE, được encode và chấm điểm chung một batch. SEARCH_BATCH_WORKERS batch chạy song song
+SEARCH_BATCH_ENABLED = True
+SEARCH_BATCH_WAIT_MS = 3
+SEARCH_BATCH_MAX_SIZE = 32
+SEARCH_BATCH_WORKERS = 2
+
+# Cache truy vấn trong RagEngine.retrieve: số phần tử tối đa và thời gian sống (giây)
+QUERY_CACHE_SIZE = 4096
+QUERY_CACHE_TTL = 3600
+RESULT_CACHE_SIZE = 4096
+RESULT_CACHE_TTL = 300
+
+# Rerank bằng cross-encoder (CPU) sau bước tìm kiếm thứ nhất: lấy RERANK_CANDIDATES ứng viên, chấm điểm
+# trong một batch rồi trả về top_k. RERANK_BUDGET_MS giới hạn thời gian chấm (0 = không giới hạn):
+# ứng viên không kịp chấm giữ thứ tự ban đầu và xếp sau
+RERANK_ENABLED = False
+RERANK_MODEL_NAME = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+RERANK_CANDIDATES = 20
+RERANK_BUDGET_MS = 300
+RERANK_BATCH_SIZE = 32
+RERANK_CACHE_SIZE = 20000
+RERANK_CACHE_TTL = 3600
+
+# Context đưa vào prompt (RagEngine.build_context): ngân sách token, ngưỡng cosine coi hai chunk là gần trùng,
+# hệ số MMR (1 = chỉ xét độ liên quan, 0 = chỉ xét độ khác biệt) và số ký tự / token dùng để ước lượng token
+CONTEXT_TOKEN_BUDGET = 1500
+CONTEXT_DEDUP_THRESHOLD = 0.95
+CONTEXT_MMR_LAMBDA = 0.7
+CONTEXT_CHARS_PER_TOKEN = 3.0
+
+# Warmup sau khi khởi động: encode + search giả vài vòng (không ghi cache) trước khi /ready trả về 200,
+# để request đầu tiên có độ trễ như lúc chạy ổn định
+WARMUP_ENABLED = True
+WARMUP_ROUNDS = 3
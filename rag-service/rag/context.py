@@ -0,0 +1,79 @@
+"""
+Chọn chunk đưa vào prompt (context) trong một ngân sách token.
+
+1. Bỏ chunk gần trùng: cosine với một chunk xếp trên nó >= dedup_threshold (ma trận cosine tính một lần)
+2. Maximal Marginal Relevance: lần lượt chọn chunk có
+       lambda * sim(câu hỏi, chunk) - (1 - lambda) * max sim(chunk, chunk đã chọn)
+   lớn nhất, nên các chunk sau bổ sung thông tin thay vì lặp lại chunk trước
+3. Dừng khi không chunk nào còn vừa ngân sách token
+
+Chunk liên quan nhất luôn được giữ: nếu nó dài hơn cả ngân sách thì được cắt cho vừa (truncate_tokens)
+thay vì trả về context rỗng.
+
+Số token là ước lượng theo số ký tự (tokenizer của LLM không có ở rag-service).
+"""
+import math
+
+import numpy as np
+
+from rag.config import CONTEXT_CHARS_PER_TOKEN
+from rag.storage import normalize_rows
+
+
+def estimate_tokens(text: str, chars_per_token: float = CONTEXT_CHARS_PER_TOKEN) -> int:
+    return math.ceil(len(text) / chars_per_token) if text else 0
+
+
+def truncate_tokens(text: str, budget: int, chars_per_token: float = CONTEXT_CHARS_PER_TOKEN) -> str:
+    """Phần đầu của `text` có estimate_tokens <= budget."""
+    return text[:max(int(budget * chars_per_token), 0)]
+
+
+def select_context(
+    query_vector: np.ndarray,
+    vectors: np.ndarray,
+    tokens: list[int],
+    budget: int,
+    dedup_threshold: float,
+    mmr_lambda: float,
+) -> tuple[list[int], int]:
+    """
+    Chỉ số các ứng viên được chọn (theo thứ tự MMR) và số ứng viên bị bỏ vì gần trùng.
+    `vectors` (n, dim) theo thứ tự xếp hạng của bước tìm kiếm; `tokens[i]` là số token của ứng viên i.
+    Ứng viên liên quan nhất luôn được chọn đầu tiên; nếu tokens của nó vượt `budget` thì nó là ứng viên
+    duy nhất và nơi gọi cắt nó cho vừa ngân sách.
+    """
+    n = len(tokens)
+    if n == 0:
+        return [], 0
+    vectors = normalize_rows(vectors)
+    relevance = vectors @ normalize_rows(query_vector)[0]
+    similarity = vectors @ vectors.T
+
+    # Gần trùng với một ứng viên xếp trên (còn giữ) thì bỏ: giữ bản có hạng cao hơn
+    keep = np.ones(n, dtype=bool)
+    for i in range(1, n):
+        if (similarity[i, :i][keep[:i]] >= dedup_threshold).any():
+            keep[i] = False
+    duplicates = int(n - keep.sum())
+
+    selected: list[int] = []
+    # Độ giống lớn nhất với các chunk đã chọn, cập nhật sau mỗi lần chọn
+    redundancy = np.full(n, -np.inf, dtype=np.float32)
+    remaining = budget
+    cost = np.asarray(tokens)
+    if budget > 0:
+        best = int(np.argmax(np.where(keep, relevance, -np.inf)))
+        if cost[best] > budget:
+            # Không vừa ngân sách: chỉ giữ chunk này (bị cắt) thay vì bỏ qua nó
+            return [best], duplicates
+    candidates = keep & (cost <= remaining)
+    while candidates.any():
+        mmr = mmr_lambda * relevance - (1.0 - mmr_lambda) * np.maximum(redundancy, 0.0)
+        best = int(np.argmax(np.where(candidates, mmr, -np.inf)))
+        selected.append(best)
+        remaining -= int(cost[best])
+        redundancy = np.maximum(redundancy, similarity[best])
+        keep[best] = False
+        candidates = keep & (cost <= remaining)
+    return selected, duplicates
@@ -1,11 +1,65 @@
 # rag/embedder.py
+import os
+
+import numpy as np
 from sentence_transformers import SentenceTransformer
-from rag.config import EMBEDDING_MODEL_NAME
+from rag.config import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_MODEL_PATH,
+    EMBEDDING_ONNX_FILE,
+    EMBEDDING_ONNX_INT8_FILE,
+    EMBED_BATCH_SIZE,
+    EMBED_NUM_WORKERS,
+)
+
+# "torch": SentenceTransformer PyTorch như trước; "onnx": graph ONNX Runtime (float32);
+# "onnx-int8": graph ONNX đã lượng tử hoá động sang int8 (nhanh nhất trên CPU, sai số nhỏ)
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
 
 class Embedder:
-    def __init__(self):
-        # Tải model từ HuggingFace (sẽ lưu vào cache máy tính)
-        self.model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    def __init__(
+        self,
+        batch_size: int = EMBED_BATCH_SIZE,
+        num_workers: int = EMBED_NUM_WORKERS,
+        backend: str = EMBEDDING_BACKEND,
+        model_path: str | None = EMBEDDING_MODEL_PATH,
+    ):
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"EMBEDDING_BACKEND không hợp lệ: {backend} (chọn {', '.join(EMBEDDING_BACKENDS)})")
+        self.backend = backend
+        # Vector của onnx-int8 lệch chút so với bản gốc nên dùng tên riêng cho cache embedding trên đĩa
+        self.model_name = EMBEDDING_MODEL_NAME if backend != "onnx-int8" else f"{EMBEDDING_MODEL_NAME}@int8"
+        self.model = self._load_model(backend, model_path)
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        # Pool đa tiến trình chỉ được tạo khi thật sự cần (lần encode batch đầu tiên)
+        self._pool = None
+
+    @staticmethod
+    def _load_model(backend: str, model_path: str | None) -> SentenceTransformer:
+        """
+        Load từ thư mục local (xem export_model.py) nếu có, nếu không thì tải từ HuggingFace
+        (sẽ lưu vào cache máy tính). Backend ONNX cần sentence-transformers[onnx].
+        """
+        source = model_path if model_path and os.path.isdir(model_path) else EMBEDDING_MODEL_NAME
+        if model_path and source != model_path:
+            print(f"[INFO] Không thấy thư mục model {model_path}, tải {EMBEDDING_MODEL_NAME} từ HuggingFace")
+        if backend == "torch":
+            return SentenceTransformer(source)
+        file_name = EMBEDDING_ONNX_FILE if backend == "onnx" else EMBEDDING_ONNX_INT8_FILE
+        if backend == "onnx-int8" and not os.path.exists(os.path.join(source, file_name)):
+            raise FileNotFoundError(
+                f"Không có {file_name} trong {source}: chạy `python export_model.py` để xuất model int8"
+            )
+        return SentenceTransformer(
+            source,
+            device="cpu",
+            backend="onnx",
+            model_kwargs={"file_name": file_name, "provider": "CPUExecutionProvider"},
+        )
 
     def get_embedding(self, text: str) -> list[float]:
         """
@@ -15,3 +69,35 @@ class Embedder:
             return []
         # Hàm encode trả về numpy array, cần chuyển về list chuẩn của Python
         return self.model.encode(text).tolist()
+
+    def count_tokens(self, text: str) -> int:
+        """Số token của text theo tokenizer của model (không tính token đặc biệt [CLS] / [SEP])."""
+        return len(self.model.tokenizer.tokenize(text))
+
+    def get_embeddings(self, texts: list[str], batch_size: int | None = None) -> np.ndarray:
+        """
+        Encode nhiều đoạn văn bản cùng lúc.
+        Trả về một ma trận float32 liên tục, shape (len(texts), dim).
+        """
+        if not texts:
+            return np.empty((0, self.dim), dtype=np.float32)
+        batch_size = batch_size or self.batch_size
+
+        if self.num_workers > 1:
+            if self._pool is None:
+                self._pool = self.model.start_multi_process_pool(target_devices=["cpu"] * self.num_workers)
+            vectors = self.model.encode_multi_process(texts, self._pool, batch_size=batch_size)
+        else:
+            vectors = self.model.encode(
+                texts,
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+    def close(self):
+        """Dừng pool đa tiến trình (nếu có)."""
+        if self._pool is not None:
+            self.model.stop_multi_process_pool(self._pool)
+            self._pool = None
@@ -0,0 +1,143 @@
+"""
+Cache embedding của chunk trên đĩa, địa chỉ theo nội dung: (tên model, hash nội dung chunk) -> vector.
+
+Mỗi model một thư mục (data/embedding_cache/<model>/):
+    header.json  - model, dim
+    keys.bin     - digest blake2b 16 byte của từng chunk, nối tiếp nhau
+    vectors.f32  - ma trận float32 (count x dim) cùng thứ tự với keys.bin, mở bằng mmap
+
+Chỉ ghi thêm: mỗi batch ghi một lần vào cuối hai file. Crash giữa chừng chỉ làm mất phần đuôi,
+khi mở lại số dòng hợp lệ = min(số key, số vector).
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from rag.storage import write_json
+
+HEADER_FILE = "header.json"
+KEYS_FILE = "keys.bin"
+VECTORS_FILE = "vectors.f32"
+KEY_SIZE = 16
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=KEY_SIZE).digest()
+
+
+class ChunkEmbeddingCache:
+    def __init__(self, root: str, model: str, dim: int):
+        self.model = model
+        self.dim = int(dim)
+        self.path = os.path.join(root, re.sub(r"[^A-Za-z0-9_.-]+", "_", model))
+        self._lock = threading.Lock()
+        self._rows: dict[bytes, int] = {}
+        self._vectors = np.empty((0, self.dim), dtype=np.float32)
+        self.hits = 0
+        self.misses = 0
+        self._open()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _open(self):
+        os.makedirs(self.path, exist_ok=True)
+        header_path = os.path.join(self.path, HEADER_FILE)
+        header = {"model": self.model, "dim": self.dim}
+        stored = None
+        if os.path.exists(header_path):
+            try:
+                with open(header_path, "r", encoding="utf-8") as f:
+                    stored = json.load(f)
+            except ValueError:
+                # header.json hỏng: không biết cache thuộc model nào, coi như không khớp
+                stored = None
+        if stored != header:
+            # Cache của model / dim khác (hoặc không rõ): bỏ đi làm lại
+            stale = [os.path.join(self.path, name) for name in (KEYS_FILE, VECTORS_FILE)]
+            stale = [path for path in stale if os.path.exists(path)]
+            if stale:
+                print(f"[WARN] Cache embedding {self.path} không khớp model, tạo mới")
+            for path in stale:
+                os.remove(path)
+            # Chỉ ghi khi thiếu / khác, và ghi nguyên tử: crash giữa chừng không để lại header dở
+            write_json(header_path, header)
+
+        keys_path = os.path.join(self.path, KEYS_FILE)
+        vectors_path = os.path.join(self.path, VECTORS_FILE)
+        keys = b""
+        if os.path.exists(keys_path):
+            with open(keys_path, "rb") as f:
+                keys = f.read()
+        row_bytes = 4 * self.dim
+        n_vectors = os.path.getsize(vectors_path) // row_bytes if os.path.exists(vectors_path) else 0
+        count = min(len(keys) // KEY_SIZE, n_vectors)
+        # Cắt phần đuôi ghi dở (nếu có) để key và vector luôn cùng số dòng
+        with open(keys_path, "ab") as f:
+            f.truncate(count * KEY_SIZE)
+        with open(vectors_path, "ab") as f:
+            f.truncate(count * row_bytes)
+        self._rows = {keys[i * KEY_SIZE:(i + 1) * KEY_SIZE]: i for i in range(count)}
+        self._remap()
+
+    def _remap(self):
+        count = len(self._rows)
+        if count == 0:
+            self._vectors = np.empty((0, self.dim), dtype=np.float32)
+            return
+        self._vectors = np.memmap(
+            os.path.join(self.path, VECTORS_FILE), dtype=np.float32, mode="r", shape=(count, self.dim)
+        )
+
+    def get_many(self, texts: list[str]) -> tuple[np.ndarray, list[int]]:
+        """
+        Tra cả batch một lần. Trả về (ma trận (n, dim) đã điền các dòng có trong cache,
+        danh sách vị trí chưa có cần encode).
+        """
+        keys = [text_key(text) for text in texts]
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        with self._lock:
+            rows = [self._rows.get(key) for key in keys]
+            found = [i for i, row in enumerate(rows) if row is not None]
+            missing = [i for i, row in enumerate(rows) if row is None]
+            if found:
+                # Một lần đọc gom (fancy indexing trên mmap) cho cả batch
+                out[found] = self._vectors[[rows[i] for i in found]]
+            self.hits += len(found)
+            self.misses += len(missing)
+        return out, missing
+
+    def put_many(self, texts: list[str], vectors: np.ndarray):
+        """Ghi thêm cả batch: một lần write cho vector, một lần cho key."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock:
+            new_keys: dict[bytes, int] = {}
+            for i, text in enumerate(texts):
+                key = text_key(text)
+                if key not in self._rows and key not in new_keys:
+                    new_keys[key] = i
+            new_rows = list(new_keys.values())
+            if not new_keys:
+                return
+            # Vector ghi trước key: crash giữa hai lần ghi thì dòng thừa bị cắt khi mở lại
+            with open(os.path.join(self.path, VECTORS_FILE), "ab") as f:
+                f.write(vectors[new_rows].tobytes())
+            with open(os.path.join(self.path, KEYS_FILE), "ab") as f:
+                f.write(b"".join(new_keys))
+            start = len(self._rows)
+            for offset, key in enumerate(new_keys):
+                self._rows[key] = start + offset
+            self._remap()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._rows),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,62 @@
+"""
+Manifest các file nguồn đã ingest (dùng cho ingest thư mục tăng dần).
+
+Lưu trong thư mục DB (FILES.json) nên bị xoá cùng DB khi reset. Với mỗi file:
+    size, mtime_ns - so sánh nhanh, không cần đọc file
+    sha256         - chỉ tính khi size/mtime đổi, để bỏ qua file chỉ bị "touch"
+    chunks         - số chunk đã nạp từ file
+    chunking       - cấu hình chunker lúc nạp; đổi cấu hình thì file được nạp lại dù nội dung không đổi
+"""
+import hashlib
+import json
+import os
+
+from rag.storage import write_json
+
+FILES_MANIFEST = "FILES.json"
+
+
+def file_digest(path: str, block_size: int = 1 << 20) -> str:
+    """sha256 của file, đọc theo khối để không giữ cả file trong RAM."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FileManifest:
+    def __init__(self, db_path: str):
+        self.path = os.path.join(db_path, FILES_MANIFEST)
+        self.files: dict[str, dict] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.files = json.load(f).get("files", {})
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        write_json(self.path, {"files": self.files})
+
+    def get(self, path: str) -> dict | None:
+        return self.files.get(path)
+
+    def set(self, path: str, stat: os.stat_result, sha256: str, chunks: int, chunking: str | None = None):
+        self.files[path] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": sha256,
+            "chunks": chunks,
+            "chunking": chunking,
+        }
+
+    def remove(self, path: str):
+        self.files.pop(path, None)
+
+    @staticmethod
+    def same_stat(entry: dict, stat: os.stat_result) -> bool:
+        return entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns
+
+    def under(self, root: str) -> list[str]:
+        """Các file trong manifest nằm dưới thư mục `root`."""
+        prefix = os.path.join(root, "")
+        return [path for path in self.files if path.startswith(prefix)]
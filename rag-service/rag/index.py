@@ -0,0 +1,176 @@
+"""
+Lớp chỉ mục tìm kiếm vector (ANN) đặt sau VectorStore.search.
+
+Các backend (chọn bằng INDEX_BACKEND trong rag/config.py):
+    exact - quét toàn bộ bằng numpy trong VectorStore (không cần file chỉ mục)
+    flat  - faiss IndexFlatIP, chính xác tuyệt đối
+    ivf   - faiss IndexIVFFlat, tham số tìm kiếm: nprobe
+    hnsw  - faiss IndexHNSWFlat, tham số tìm kiếm: ef_search
+Mọi vector đều đã chuẩn hoá nên dùng inner product (= cosine).
+"""
+import copy
+import math
+import os
+
+import numpy as np
+
+from rag.config import (
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_SEARCH,
+    HNSW_M,
+    IVF_NLIST,
+    IVF_NPROBE,
+)
+
+INDEX_BACKENDS = ("exact", "flat", "ivf", "hnsw")
+
+
+def _faiss():
+    try:
+        import faiss
+    except ImportError as e:
+        raise RuntimeError("Cần cài faiss-cpu để dùng chỉ mục flat/ivf/hnsw") from e
+    return faiss
+
+
+class FaissIndex:
+    """Lớp cơ sở: build / add / search / save / load quanh một index faiss."""
+
+    name = ""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.index = None
+
+    @property
+    def ntotal(self) -> int:
+        return int(self.index.ntotal) if self.index is not None else 0
+
+    def _create(self, vectors: np.ndarray):
+        raise NotImplementedError
+
+    def _search_params(self):
+        return None
+
+    def needs_rebuild(self, total: int) -> bool:
+        """True nếu nên dựng lại toàn bộ index khi DB đạt `total` vector."""
+        return False
+
+    def build(self, vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.index = self._create(vectors)
+        if len(vectors):
+            self.index.add(vectors)
+
+    def add(self, vectors: np.ndarray):
+        if len(vectors) == 0:
+            return
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.index is None:
+            self.build(vectors)
+        else:
+            self.index.add(vectors)
+
+    def copy(self) -> "FaissIndex":
+        """Bản sao độc lập (thêm vào bản sao không ảnh hưởng search đang chạy trên bản gốc)."""
+        clone = copy.copy(self)
+        clone.index = _faiss().clone_index(self.index) if self.index is not None else None
+        return clone
+
+    def search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Trả về (scores, ids) shape (m, k); id = -1 nếu không đủ kết quả."""
+        queries = np.ascontiguousarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        if self.index is None or self.index.ntotal == 0:
+            m = queries.shape[0]
+            return np.zeros((m, k), dtype=np.float32), np.full((m, k), -1, dtype=np.int64)
+        params = self._search_params()
+        if params is None:
+            return self.index.search(queries, k)
+        return self.index.search(queries, k, params=params)
+
+    def save(self, path: str):
+        if self.index is None:
+            return
+        tmp_path = path + ".tmp"
+        _faiss().write_index(self.index, tmp_path)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str):
+        self.index = _faiss().read_index(path)
+        self.dim = self.index.d
+
+
+class FlatIndex(FaissIndex):
+    name = "flat"
+
+    def _create(self, vectors):
+        return _faiss().IndexFlatIP(self.dim)
+
+
+class IVFIndex(FaissIndex):
+    name = "ivf"
+
+    def __init__(self, dim: int, nlist: int = IVF_NLIST, nprobe: int = IVF_NPROBE):
+        super().__init__(dim)
+        self.nlist = nlist
+        self.nprobe = nprobe
+
+    def _nlist_for(self, n: int) -> int:
+        # Không để số cụm vượt quá dữ liệu huấn luyện
+        return max(1, min(self.nlist, int(4 * math.sqrt(max(n, 1))), n or 1))
+
+    def _create(self, vectors):
+        faiss = _faiss()
+        nlist = self._nlist_for(len(vectors))
+        quantizer = faiss.IndexFlatIP(self.dim)
+        index = faiss.IndexIVFFlat(quantizer, self.dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        if len(vectors):
+            index.train(vectors)
+        return index
+
+    def add(self, vectors):
+        # IVF cần được huấn luyện trước khi thêm; lần đầu thì build từ chính dữ liệu này
+        if self.index is not None and not self.index.is_trained:
+            self.build(vectors)
+            return
+        super().add(vectors)
+
+    def needs_rebuild(self, total: int) -> bool:
+        # Các cụm được huấn luyện trên dữ liệu lúc build; DB lớn gấp nhiều lần thì huấn luyện lại
+        return self.index is not None and self._nlist_for(total) >= 2 * self.index.nlist
+
+    def _search_params(self):
+        return _faiss().SearchParametersIVF(nprobe=self.nprobe)
+
+
+class HNSWIndex(FaissIndex):
+    name = "hnsw"
+
+    def __init__(self, dim: int, m: int = HNSW_M, ef_construction: int = HNSW_EF_CONSTRUCTION, ef_search: int = HNSW_EF_SEARCH):
+        super().__init__(dim)
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+
+    def _create(self, vectors):
+        faiss = _faiss()
+        index = faiss.IndexHNSWFlat(self.dim, self.m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = self.ef_construction
+        return index
+
+    def _search_params(self):
+        return _faiss().SearchParametersHNSW(efSearch=self.ef_search)
+
+
+def create_index(backend: str, dim: int, **params) -> FaissIndex | None:
+    """Tạo index theo tên backend; "exact" trả về None (VectorStore tự quét bằng numpy)."""
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(f"INDEX_BACKEND không hợp lệ: {backend} (chọn một trong {INDEX_BACKENDS})")
+    if backend == "exact":
+        return None
+    cls = {"flat": FlatIndex, "ivf": IVFIndex, "hnsw": HNSWIndex}[backend]
+    return cls(dim, **params)
+
+
+def index_file(db_path: str, backend: str) -> str:
+    return os.path.join(db_path, f"index.{backend}.faiss")
@@ -0,0 +1,108 @@
+"""
+Job ingest chạy nền: request chỉ gửi job và nhận job_id, tiến độ / kết quả xem qua /jobs/{job_id}.
+
+Các job chạy tuần tự trên một thread riêng (một writer duy nhất), search không phải chờ:
+VectorStore công bố dữ liệu mới bằng cách thay snapshot, không sửa dữ liệu search đang đọc.
+Mọi thao tác ghi (kể cả request đồng bộ: JobManager.run) đều đi qua hàng đợi này, nên không có hai
+thao tác nào cùng ghi vào bộ đệm pending của VectorStore.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class Job:
+    def __init__(self, kind: str, params: dict):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.status = QUEUED
+        self.progress: dict = {}
+        self.result: dict | None = None
+        self.error: str | None = None
+        # Lỗi gốc, để JobManager.run ném lại cho request đồng bộ
+        self.exception: Exception | None = None
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.future: Future | None = None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "progress": dict(self.progress),
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    def __init__(self, workers: int = 1, history: int = 100):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest-job")
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._history = history
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, params: dict, fn: Callable[..., dict]) -> Job:
+        """
+        Xếp hàng `fn(on_progress=...)`; `on_progress(dict)` cập nhật tiến độ của job.
+        Chỉ giữ `history` job gần nhất đã xong.
+        """
+        job = Job(kind, params)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim()
+        job.future = self._executor.submit(self._run, job, fn)
+        return job
+
+    def run(self, kind: str, params: dict, fn: Callable[..., dict]) -> dict:
+        """Xếp hàng như submit rồi chờ job xong; trả về kết quả hoặc ném lại lỗi của job."""
+        job = self.submit(kind, params, fn)
+        job.future.result()
+        if job.exception is not None:
+            raise job.exception
+        return job.result
+
+    def _run(self, job: Job, fn: Callable[..., dict]):
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            job.result = fn(on_progress=job.progress.update)
+            job.status = SUCCEEDED
+        except Exception as e:
+            job.error = str(e)
+            job.exception = e
+            job.status = FAILED
+            print(f"[ERROR] Job {job.kind} {job.id} lỗi: {e}")
+        finally:
+            job.finished_at = time.time()
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in (SUCCEEDED, FAILED)]
+        for job_id in finished[:max(len(finished) - self._history, 0)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> list[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
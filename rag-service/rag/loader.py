@@ -1,4 +1,6 @@
+import codecs
 import os
+from typing import Callable, Iterator
 
 class DocumentLoader:
     def __init__(self):
@@ -22,5 +24,38 @@ class DocumentLoader:
 
         except Exception as e:
             raise RuntimeError(f"Lỗi khi đọc file {file_path}: {str(e)}")
-        
-        
\ No newline at end of file
+
+    def iter_lines(
+        self,
+        file_path: str,
+        on_bytes: Callable[[int], None] | None = None,
+        max_line_bytes: int = 64 * 1024,
+    ) -> Iterator[str]:
+        """
+        Đọc file theo từng dòng (generator) để không giữ cả file trong bộ nhớ.
+        Dòng dài hơn `max_line_bytes` được trả về thành nhiều phần.
+        `on_bytes(n)` được gọi sau mỗi lần đọc với số byte vừa đọc (dùng để báo tiến độ).
+        """
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"Không tìm thấy file tại đường dẫn: {file_path}")
+
+        # Decoder tăng dần: ký tự UTF-8 nhiều byte bị cắt giữa hai lần đọc vẫn giải mã đúng
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        total = 0
+        try:
+            with open(file_path, "rb") as f:
+                for raw in iter(lambda: f.readline(max_line_bytes), b""):
+                    total += len(raw)
+                    if on_bytes is not None:
+                        on_bytes(len(raw))
+                    line = decoder.decode(raw)
+                    if line:
+                        yield line
+                tail = decoder.decode(b"", final=True)
+                if tail:
+                    yield tail
+        except (OSError, UnicodeDecodeError) as e:
+            raise RuntimeError(f"Lỗi khi đọc file {file_path}: {str(e)}")
+
+        if total == 0:
+            print(f"Cảnh báo: File {file_path} rỗng.")
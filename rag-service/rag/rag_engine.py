@@ -1,21 +1,112 @@
+import glob
 import os
+import threading
+import time
+from itertools import islice
+from typing import Callable, Iterable, Iterator
+import numpy as np
+from rag.cache import LRUCache
+from rag.config import (
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    CHUNK_UNIT,
+    CONTEXT_DEDUP_THRESHOLD,
+    CONTEXT_MMR_LAMBDA,
+    CONTEXT_TOKEN_BUDGET,
+    EMBED_CACHE_ENABLED,
+    EMBED_CACHE_PATH,
+    HYBRID_CANDIDATES,
+    INGEST_BATCH_SIZE,
+    QUERY_CACHE_SIZE,
+    QUERY_CACHE_TTL,
+    RERANK_CANDIDATES,
+    RERANK_ENABLED,
+    RESULT_CACHE_SIZE,
+    RESULT_CACHE_TTL,
+    RETRIEVAL_MODE,
+    RRF_K,
+    WARMUP_ROUNDS,
+)
+from rag.file_manifest import FileManifest, file_digest
 from rag.loader import DocumentLoader
 from rag.chunker import Chunker
+from rag.context import estimate_tokens, select_context, truncate_tokens
 from rag.embedder import Embedder
+from rag.embedding_cache import ChunkEmbeddingCache
+from rag.reranker import Reranker
 from rag.vector_store import VectorStore
-from rag.config import VECTOR_DB_PATH
+
+RETRIEVAL_MODES = ("dense", "sparse", "hybrid")
+
+
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    """Gom iterator thành các list tối đa `size` phần tử (itertools.batched chỉ có từ Python 3.12)."""
+    it = iter(items)
+    while batch := list(islice(it, size)):
+        yield batch
+
 
 class RagEngine:
-    def __init__(self):
-        self.embedder = Embedder()
-        self.vector_store = VectorStore()
+    def __init__(self, embedder: Embedder | None = None, vector_store: VectorStore | None = None):
+        # Có thể truyền embedder / vector_store đã load sẵn (main.py load song song hai phần này khi khởi động)
+        self.embedder = embedder if embedder is not None else Embedder()
+        self.vector_store = vector_store if vector_store is not None else VectorStore()
         # Loader và Chunker khởi tạo khi cần dùng
         self.loader = DocumentLoader()
-        self.chunker = Chunker(chunk_size=500, chunk_overlap=50)
+        self.chunker = Chunker(
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
+            length_fn=self.embedder.count_tokens if CHUNK_UNIT == "tokens" else None,
+        )
+        # Ghi vào FILES.json: đổi cấu hình chunk thì ingest_dir nạp lại cả file không đổi nội dung
+        self.chunking = f"{CHUNK_SIZE}/{CHUNK_OVERLAP}/{CHUNK_UNIT}"
+        # Cache 2 tầng cho truy vấn lặp lại: câu hỏi -> embedding, (câu hỏi, top_k, version DB) -> kết quả
+        self.embedding_cache = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+        self.result_cache = LRUCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+        # Cache embedding của chunk trên đĩa: ingest lại nội dung cũ chỉ tốn đọc đĩa, không chạy model
+        self.chunk_embeddings = (
+            ChunkEmbeddingCache(EMBED_CACHE_PATH, self.embedder.model_name, self.embedder.dim)
+            if EMBED_CACHE_ENABLED else None
+        )
+        # Cross-encoder chỉ load ở lần rerank đầu tiên
+        self._reranker: Reranker | None = None
+        self._reranker_lock = threading.Lock()
+        # Tổng số token context trước / sau khi chọn lọc (xem build_context)
+        self.context_totals = {"requests": 0, "tokens_in": 0, "tokens_used": 0, "duplicates": 0}
+        self._context_lock = threading.Lock()
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        # Model all-MiniLM-L6-v2 không phân biệt hoa thường nên có thể gộp các biến thể
+        return " ".join(query.lower().split())
+
+    def embed_chunks(self, chunks: list[str]) -> np.ndarray:
+        """Embedding cho một batch chunk: tra cache đĩa một lần, chỉ encode các chunk chưa có."""
+        cache = self.chunk_embeddings
+        if cache is None:
+            return self.embedder.get_embeddings(chunks)
+        vectors, missing = cache.get_many(chunks)
+        if missing:
+            todo = [chunks[i] for i in missing]
+            fresh = self.embedder.get_embeddings(todo)
+            vectors[missing] = fresh
+            cache.put_many(todo, fresh)
+        return vectors
 
-    def ingest(self, file_path: str):
+    def ingest(
+        self,
+        file_path: str,
+        batch_size: int = INGEST_BATCH_SIZE,
+        source: str | None = None,
+        on_progress: Callable[[dict], None] | None = None,
+        replace: bool = False,
+    ) -> dict:
         """
-        Quy trình nạp dữ liệu: Đọc -> Cắt -> Vector hóa -> Lưu DB
+        Quy trình nạp dữ liệu: Đọc -> Cắt -> Vector hóa -> Lưu DB, chạy dạng stream theo từng batch
+        `batch_size` chunk nên bộ nhớ không tăng theo kích thước file.
+        `source` mặc định là đường dẫn tuyệt đối của file (dùng để xoá / thay chunk của file sau này).
+        `on_progress` (tuỳ chọn) nhận {"bytes", "total_bytes", "chunks"} sau mỗi batch (dùng cho job nền).
+        replace=True: thay chunk cũ của `source` (VectorStore.replace_source), bản mới chỉ hiện ra khi nạp xong.
         """
         print(f"--- Bắt đầu nạp dữ liệu từ {file_path} ---")
         # Kiểm tra tồn tại và đúng định dạng .txt
@@ -23,36 +114,354 @@ class RagEngine:
             raise FileNotFoundError(f"Không tìm thấy file: {file_path}")
         if not file_path.lower().endswith('.txt'):
             print("[CẢNH BÁO] File không phải .txt, vẫn tiếp tục nạp.")
-        
-        # 1. Đọc file
-        text = self.loader.load(file_path)
-        print(f"[1] Đọc xong: {len(text)} ký tự")
-
-        # 2. Cắt nhỏ
-        chunks = self.chunker.split_text(text)
-        print(f"[2] Cắt xong: {len(chunks)} đoạn")
-
-        # 3. Tạo vector (Bước này lâu nhất)
-        print(f"[3] Đang tạo vector (vui lòng chờ)...")
-        vectors = []
-        for chunk in chunks:
-            vec = self.embedder.get_embedding(chunk)
-            vectors.append(vec)
-            
-        # 4. Lưu vào DB
-        self.vector_store.add_documents(chunks, vectors)
-        print(f"[4] Đã lưu vào Database thành công.")
-        # Thông báo vị trí file text export để người dùng dễ kiểm tra
-        txt_path = os.path.join(os.path.dirname(VECTOR_DB_PATH), "vector_store.txt")
-        print(f"[INFO] Đã ghi nội dung đọc/vec vào: {txt_path}")
-
-    def retrieve(self, query: str, top_k: int = 3):
-        """
-        Tìm kiếm thông tin liên quan từ DB
-        """
-        query_vector = self.embedder.get_embedding(query)
-        results = self.vector_store.search(query_vector, top_k)
-        return results
+
+        source = source or os.path.abspath(file_path)
+        total_bytes = os.path.getsize(file_path)
+        progress = {"bytes": 0, "chunks": 0}
+
+        def on_bytes(n: int):
+            progress["bytes"] += n
+
+        # 1 + 2. Đọc và cắt dần từng dòng (generator, không giữ cả file)
+        lines = self.loader.iter_lines(file_path, on_bytes=on_bytes)
+        chunks = self.chunker.iter_chunks_with_metadata(lines)
+
+        # 3 + 4. Tạo vector và lưu theo từng batch
+        started = time.perf_counter()
+
+        def embedded():
+            for batch in _batched(chunks, batch_size):
+                texts = [chunk for chunk, _ in batch]
+                yield texts, self.embed_chunks(texts), [meta for _, meta in batch]
+                progress["chunks"] += len(batch)
+                elapsed = time.perf_counter() - started
+                rate = progress["chunks"] / elapsed if elapsed > 0 else 0.0
+                percent = 100.0 * progress["bytes"] / total_bytes if total_bytes else 100.0
+                if on_progress is not None:
+                    on_progress({**progress, "total_bytes": total_bytes})
+                print(
+                    f"[ingest] {progress['bytes'] / 2**20:.1f}/{total_bytes / 2**20:.1f} MB ({percent:.0f}%), "
+                    f"{progress['chunks']} đoạn, {rate:.1f} chunks/s"
+                )
+
+        if replace:
+            # Lỗi giữa chừng: bỏ phần mới, bản cũ vẫn nguyên
+            self.vector_store.replace_source(source, embedded())
+        else:
+            try:
+                for texts, vectors, metas in embedded():
+                    self.vector_store.add_documents(texts, vectors, flush=False, source=source, metadata=metas)
+            finally:
+                # Ghi phần còn lại trong bộ nhớ (kể cả khi lỗi giữa chừng, phần đã encode không bị mất)
+                self.vector_store.save_db()
+
+        elapsed = time.perf_counter() - started
+        rate = progress["chunks"] / elapsed if elapsed > 0 else 0.0
+        print(f"[ingest] Xong: {progress['chunks']} đoạn, {progress['bytes']} bytes trong {elapsed:.2f}s ({rate:.1f} chunks/s)")
+        return {"chunks": progress["chunks"], "bytes": progress["bytes"], "seconds": round(elapsed, 3)}
+
+    def ingest_dir(
+        self, root: str, pattern: str = "**/*.txt", on_progress: Callable[[dict], None] | None = None
+    ) -> dict:
+        """
+        Nạp tăng dần một thư mục: chỉ encode file mới / đã sửa, thay chunk của file đã sửa
+        và xoá chunk của file không còn tồn tại. File không đổi (size + mtime, hoặc cùng sha256) bị bỏ qua.
+        `on_progress` (tuỳ chọn) nhận số file đã xử lý / tổng số, file đang nạp và tiến độ của file đó.
+        """
+        root = os.path.abspath(root)
+        if not os.path.isdir(root):
+            raise FileNotFoundError(f"Không tìm thấy thư mục: {root}")
+        print(f"--- Nạp thư mục {root} ({pattern}) ---")
+        started = time.perf_counter()
+        manifest = FileManifest(self.vector_store.db_path)
+        stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0, "chunks": 0}
+
+        paths = sorted(
+            os.path.abspath(p) for p in glob.glob(os.path.join(root, pattern), recursive=True) if os.path.isfile(p)
+        )
+        # Tiến độ của file đang nạp: file_bytes / file_total_bytes / file_chunks
+        file_progress = None
+        if on_progress is not None:
+            def file_progress(progress: dict):
+                on_progress({f"file_{key}": value for key, value in progress.items()})
+
+        for done, path in enumerate(paths):
+            if on_progress is not None:
+                on_progress({"files_done": done, "files_total": len(paths), "file": path, **stats})
+            stat = os.stat(path)
+            entry = manifest.get(path)
+            if entry is not None and entry.get("chunking") != self.chunking:
+                # Nạp bằng cấu hình chunk khác: coi như file đã sửa
+                entry = dict(entry, size=None, sha256=None)
+            if entry is not None and manifest.same_stat(entry, stat):
+                stats["unchanged"] += 1
+                continue
+            digest = file_digest(path)
+            if entry is not None and entry.get("sha256") == digest:
+                # Chỉ đổi mtime (vd. copy lại): cập nhật manifest, không encode lại
+                manifest.set(path, stat, digest, entry.get("chunks", 0), self.chunking)
+                manifest.save()
+                stats["unchanged"] += 1
+                continue
+
+            # File mới hoặc đã sửa: bản mới thay chunk cũ của file trong cùng một lần công bố
+            result = self.ingest(path, source=path, on_progress=file_progress, replace=True)
+            manifest.set(path, stat, digest, result["chunks"], self.chunking)
+            # Ghi manifest sau từng file: bị ngắt giữa chừng thì lần sau chỉ làm tiếp phần còn lại
+            manifest.save()
+            stats["updated" if entry is not None else "added"] += 1
+            stats["chunks"] += result["chunks"]
+
+        for path in manifest.under(root):
+            if not os.path.exists(path):
+                self.vector_store.delete_source(path)
+                manifest.remove(path)
+                manifest.save()
+                stats["removed"] += 1
+
+        stats["seconds"] = round(time.perf_counter() - started, 3)
+        if on_progress is not None:
+            on_progress({"files_done": len(paths), "files_total": len(paths), "file": None, **stats})
+        print(
+            f"[ingest-dir] Mới {stats['added']}, sửa {stats['updated']}, xoá {stats['removed']}, "
+            f"bỏ qua {stats['unchanged']} file; {stats['chunks']} đoạn trong {stats['seconds']:.2f}s"
+        )
+        return stats
+
+    def upsert_source(self, source: str, text: str, metadata: dict | None = None) -> dict:
+        """Thay toàn bộ nội dung của một nguồn (vd. một trang web) bằng `text`."""
+        pairs = list(self.chunker.iter_chunks_with_metadata(text.splitlines()))
+        chunks = [chunk for chunk, _ in pairs]
+        # Metadata riêng của chunk (vd. SOURCE: url trong text) ghi đè metadata chung
+        metas = [{**(metadata or {}), **(meta or {})} or None for _, meta in pairs]
+        vectors = self.embed_chunks(chunks) if chunks else None
+        return self.vector_store.upsert_source(source, chunks, vectors, metadata=metas)
+
+    def delete_source(self, source: str) -> int:
+        """Xoá mọi chunk của một nguồn; nếu nguồn là file đã nạp bằng ingest_dir thì lần sau file được nạp lại."""
+        removed = self.vector_store.delete_source(source)
+        manifest = FileManifest(self.vector_store.db_path)
+        if manifest.get(source) is not None:
+            manifest.remove(source)
+            manifest.save()
+        return removed
+
+    @staticmethod
+    def _mode(mode: str | None) -> str:
+        mode = mode or RETRIEVAL_MODE
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Chế độ tìm kiếm không hợp lệ: {mode} (chọn {', '.join(RETRIEVAL_MODES)})")
+        return mode
+
+    @staticmethod
+    def _fuse(ranked: dict[str, list[dict]], top_k: int) -> list[dict]:
+        """
+        Reciprocal Rank Fusion: điểm = sum 1 / (RRF_K + hạng) qua các danh sách,
+        giữ lại điểm gốc của từng bên trong "<tên>_score".
+        """
+        fused: dict[tuple, dict] = {}
+        for name, results in ranked.items():
+            for rank, r in enumerate(results, start=1):
+                key = (r.get("source"), r["chunk"])
+                item = fused.get(key)
+                if item is None:
+                    item = fused[key] = dict(r, score=0.0)
+                item[f"{name}_score"] = r["score"]
+                item["score"] += 1.0 / (RRF_K + rank)
+        return sorted(fused.values(), key=lambda r: r["score"], reverse=True)[:top_k]
+
+    @property
+    def reranker(self) -> Reranker:
+        if self._reranker is None:
+            with self._reranker_lock:
+                if self._reranker is None:
+                    self._reranker = Reranker()
+        return self._reranker
+
+    @staticmethod
+    def _candidates(top_k: int, rerank: bool) -> int:
+        # Rerank cần nhiều ứng viên hơn top_k từ bước tìm kiếm thứ nhất
+        return max(top_k, RERANK_CANDIDATES) if rerank else top_k
+
+    def retrieve(self, query: str, top_k: int = 3, mode: str | None = None, rerank: bool | None = None):
+        """
+        Tìm kiếm thông tin liên quan từ DB.
+        mode: "dense" (embedding), "sparse" (BM25) hoặc "hybrid" (RRF của cả hai); mặc định RETRIEVAL_MODE.
+        rerank: chấm lại RERANK_CANDIDATES ứng viên bằng cross-encoder rồi lấy top_k; mặc định RERANK_ENABLED.
+        """
+        mode = self._mode(mode)
+        rerank = RERANK_ENABLED if rerank is None else rerank
+        key = self.normalize_query(query)
+        # Version thay đổi khi add_documents / reset nên kết quả cũ không còn được dùng
+        result_key = (key, top_k, mode, rerank, self.vector_store.version)
+        results = self.result_cache.get(result_key)
+        if results is None:
+            store = self.vector_store
+            n = self._candidates(top_k, rerank)
+            if mode == "dense":
+                results = store.search(self.embed_query(query, key), n)
+            elif mode == "sparse":
+                results = store.keyword_search(query, n)
+            else:
+                m = max(n, HYBRID_CANDIDATES)
+                results = self._fuse(
+                    {"dense": store.search(self.embed_query(query, key), m), "sparse": store.keyword_search(query, m)},
+                    n,
+                )
+            if rerank:
+                results = self.reranker.rerank(query, results, top_k)
+            if self._cacheable(results, rerank):
+                self.result_cache.set(result_key, results)
+        # Trả bản sao để nơi gọi có sửa kết quả cũng không làm hỏng cache
+        return [dict(r) for r in results]
+
+    @staticmethod
+    def _cacheable(results: list[dict], rerank: bool) -> bool:
+        # Kết quả rerank dở dang (hết ngân sách thời gian) không lưu cache để lần sau được chấm đủ
+        return not rerank or all("rerank_score" in r for r in results)
+
+    def retrieve_many(
+        self,
+        queries: list[str],
+        top_k: int | list[int] = 3,
+        mode: str | None = None,
+        rerank: bool | None = None,
+    ) -> list[list[dict]]:
+        """
+        Tìm kiếm nhiều câu hỏi cùng lúc: encode các câu chưa có trong cache thành một batch
+        và chấm điểm tất cả bằng một phép nhân ma trận - ma trận. Rerank (nếu bật) cũng chạy một batch.
+        """
+        mode = self._mode(mode)
+        rerank = RERANK_ENABLED if rerank is None else rerank
+        top_ks = list(top_k) if isinstance(top_k, (list, tuple)) else [top_k] * len(queries)
+        if len(top_ks) != len(queries):
+            raise ValueError("Số top_k phải bằng số câu hỏi")
+        version = self.vector_store.version
+        keys = [self.normalize_query(q) for q in queries]
+        results: list[list[dict] | None] = [
+            self.result_cache.get((key, k, mode, rerank, version)) for key, k in zip(keys, top_ks)
+        ]
+        missing = [i for i, r in enumerate(results) if r is None]
+        if missing:
+            store = self.vector_store
+            ns = [self._candidates(top_ks[i], rerank) for i in missing]
+            if mode == "sparse":
+                found = [store.keyword_search(queries[i], n) for i, n in zip(missing, ns)]
+            else:
+                vectors = self.embed_queries([queries[i] for i in missing], [keys[i] for i in missing])
+                if mode == "dense":
+                    found = store.search_many(vectors, ns)
+                else:
+                    ms = [max(n, HYBRID_CANDIDATES) for n in ns]
+                    dense = store.search_many(vectors, ms)
+                    found = [
+                        self._fuse({"dense": d, "sparse": store.keyword_search(queries[i], m)}, n)
+                        for i, d, m, n in zip(missing, dense, ms, ns)
+                    ]
+            if rerank:
+                found = self.reranker.rerank_many([queries[i] for i in missing], found, [top_ks[i] for i in missing])
+            for i, res in zip(missing, found):
+                results[i] = res
+                if self._cacheable(res, rerank):
+                    self.result_cache.set((keys[i], top_ks[i], mode, rerank, version), res)
+        return [[dict(r) for r in res] for res in results]
+
+    def embed_queries(self, queries: list[str], keys: list[str] | None = None) -> np.ndarray:
+        """Embedding của nhiều câu hỏi (n, dim); chỉ encode (một batch) các câu chưa có trong cache."""
+        keys = keys if keys is not None else [self.normalize_query(q) for q in queries]
+        cached = [self.embedding_cache.get(key) for key in keys]
+        todo = {}
+        for query, key, vector in zip(queries, keys, cached):
+            if vector is None and key not in todo:
+                todo[key] = query
+        if todo:
+            encoded = self.embedder.get_embeddings(list(todo.values()))
+            fresh = {}
+            for key, vector in zip(todo, encoded):
+                vector = vector.copy()
+                vector.setflags(write=False)
+                self.embedding_cache.set(key, vector)
+                fresh[key] = vector
+            cached = [vector if vector is not None else fresh[key] for key, vector in zip(keys, cached)]
+        return np.vstack(cached) if cached else np.empty((0, self.embedder.dim), dtype=np.float32)
+
+    def embed_query(self, query: str, key: str | None = None) -> np.ndarray:
+        """Embedding của câu hỏi, lấy từ cache nếu đã encode trước đó."""
+        key = key if key is not None else self.normalize_query(query)
+        vector = self.embedding_cache.get(key)
+        if vector is None:
+            vector = self.embedder.get_embeddings([query])[0]
+            vector.setflags(write=False)
+            self.embedding_cache.set(key, vector)
+        return vector
+
+    def warmup(self, rounds: int = WARMUP_ROUNDS) -> dict:
+        """
+        Chạy encode + search giả để khởi tạo lazy của model / BLAS / mmap trước khi nhận request thật.
+        Gọi thẳng embedder và vector_store nên không để lại gì trong cache truy vấn.
+        """
+        texts = ["warmup", "Câu hỏi khởi động: học phí, lịch thi và thủ tục cho sinh viên năm nhất là gì?"]
+        started = time.perf_counter()
+        for _ in range(rounds):
+            vectors = self.embedder.get_embeddings(texts)
+            self.embedder.get_embeddings(texts[:1])
+            self.vector_store.search(vectors[1], 3)
+            self.vector_store.search_many(vectors, [3, 3])
+            if RETRIEVAL_MODE != "dense":
+                self.vector_store.keyword_search(texts[1], 3)
+        if RERANK_ENABLED:
+            # Load cross-encoder ngay thay vì ở request rerank đầu tiên
+            self.reranker.score_pairs([(texts[1], texts[1])], budget_ms=0)
+        return {"rounds": rounds, "seconds": round(time.perf_counter() - started, 3)}
+
+    def cache_stats(self) -> dict:
+        with self._context_lock:
+            context = dict(self.context_totals)
+        context["tokens_saved"] = context["tokens_in"] - context["tokens_used"]
+        return {
+            "embedding": self.embedding_cache.stats(),
+            "results": self.result_cache.stats(),
+            "chunk_embeddings": self.chunk_embeddings.stats() if self.chunk_embeddings is not None else None,
+            "reranker": self._reranker.stats() if self._reranker is not None else None,
+            "context": context,
+            "store_version": self.vector_store.version,
+        }
+
+    def build_context(self, query: str, results: list[dict], budget: int | None = None) -> tuple[list[dict], dict]:
+        """
+        Chọn các chunk đưa vào prompt: bỏ chunk gần trùng, chọn theo MMR trong ngân sách token
+        (mặc định CONTEXT_TOKEN_BUDGET). Embedding của chunk là vector đã lưu đi kèm kết quả tìm kiếm
+        ("vector", lấy từ snapshot của VectorStore), không encode lại. Chunk liên quan nhất dài hơn
+        ngân sách được cắt cho vừa. Trả về (chunk được chọn, thống kê token trước / sau).
+        """
+        budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+        tokens = [estimate_tokens(r.get("chunk", "")) for r in results]
+        selected, duplicates = [], 0
+        if results:
+            vectors = np.stack([r["vector"] for r in results])
+            picked, duplicates = select_context(
+                self.embed_query(query), vectors, tokens, budget, CONTEXT_DEDUP_THRESHOLD, CONTEXT_MMR_LAMBDA
+            )
+            selected = [
+                results[i] if tokens[i] <= budget else dict(results[i], chunk=truncate_tokens(results[i]["chunk"], budget))
+                for i in picked
+            ]
+        stats = {
+            "candidates": len(results),
+            "selected": len(selected),
+            "duplicates": duplicates,
+            "budget": budget,
+            "tokens_in": sum(tokens),
+            "tokens_used": sum(estimate_tokens(r["chunk"]) for r in selected),
+        }
+        stats["tokens_saved"] = stats["tokens_in"] - stats["tokens_used"]
+        with self._context_lock:
+            totals = self.context_totals
+            totals["requests"] += 1
+            totals["tokens_in"] += stats["tokens_in"]
+            totals["tokens_used"] += stats["tokens_used"]
+            totals["duplicates"] += duplicates
+        return selected, stats
 
     def generate_prompt(self, query: str, context_results: list):
         """
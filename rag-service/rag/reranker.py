@@ -1,15 +1,99 @@
-from typing import List, Dict
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+from sentence_transformers import CrossEncoder
+
+from rag.cache import LRUCache
+from rag.config import (
+    RERANK_BATCH_SIZE,
+    RERANK_BUDGET_MS,
+    RERANK_CACHE_SIZE,
+    RERANK_CACHE_TTL,
+    RERANK_MODEL_NAME,
+)
+
 
 class Reranker:
-    def __init__(self):
-        # Có thể load model CrossEncoder ở đây nếu cần độ chính xác cao
-        pass
+    def __init__(
+        self,
+        model_name: str = RERANK_MODEL_NAME,
+        batch_size: int = RERANK_BATCH_SIZE,
+        budget_ms: float = RERANK_BUDGET_MS,
+    ):
+        # Cross-encoder chấm điểm cặp (câu hỏi, chunk) chính xác hơn so khớp embedding nhưng chậm hơn,
+        # nên chỉ dùng cho N ứng viên đầu của bước tìm kiếm thứ nhất
+        self.model_name = model_name
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        # Điểm theo cặp (câu hỏi đã chuẩn hoá, chunk)
+        self.cache = LRUCache(RERANK_CACHE_SIZE, RERANK_CACHE_TTL)
+        # Ước lượng thời gian chấm một cặp (ms), cập nhật sau mỗi lần gọi model
+        self._ms_per_pair: float | None = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(query: str, chunk: str) -> tuple[str, str]:
+        return " ".join(query.lower().split()), chunk
 
-    def rerank(self, query: str, results: List[Dict]) -> List[Dict]:
+    def _affordable(self, n: int, budget_ms: float | None) -> int:
+        """Số cặp chưa có điểm có thể chấm trong ngân sách thời gian (không giới hạn nếu budget <= 0)."""
+        budget_ms = self.budget_ms if budget_ms is None else budget_ms
+        if not budget_ms or budget_ms <= 0 or self._ms_per_pair is None:
+            return n
+        return min(n, max(int(budget_ms / self._ms_per_pair), 1))
+
+    def score_pairs(self, pairs: list[tuple[str, str]], budget_ms: float | None = None) -> list[float | None]:
         """
-        Hiện tại trả về nguyên bản. 
-        Mở rộng: Sử dụng CrossEncoder để tính lại score.
+        Điểm cross-encoder của các cặp (câu hỏi, chunk): lấy từ cache, phần còn lại chấm trong một batch.
+        Cặp không kịp chấm trong ngân sách thời gian trả về None.
         """
-        # Sắp xếp theo score (khoảng cách L2 càng nhỏ càng tốt với FAISS FlatL2)
-        # Nếu dùng Cosine Similarity thì logic sort sẽ ngược lại
-        return sorted(results, key=lambda x: x.get('score', 0))
\ No newline at end of file
+        scores: list[float | None] = [self.cache.get(self._key(q, c)) for q, c in pairs]
+        todo = list(dict.fromkeys(self._key(q, c) for (q, c), s in zip(pairs, scores) if s is None))
+        todo = todo[:self._affordable(len(todo), budget_ms)]
+        if todo:
+            started = time.perf_counter()
+            predicted = self.model.predict(todo, batch_size=self.batch_size, show_progress_bar=False)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                per_pair = elapsed_ms / len(todo)
+                self._ms_per_pair = per_pair if self._ms_per_pair is None else 0.8 * self._ms_per_pair + 0.2 * per_pair
+            fresh = {}
+            for key, value in zip(todo, np.asarray(predicted, dtype=np.float32).tolist()):
+                self.cache.set(key, value)
+                fresh[key] = value
+            scores = [s if s is not None else fresh.get(self._key(q, c)) for (q, c), s in zip(pairs, scores)]
+        return scores
+
+    def rerank_many(
+        self,
+        queries: list[str],
+        results: list[List[Dict]],
+        top_ks: list[int],
+        budget_ms: float | None = None,
+    ) -> list[List[Dict]]:
+        """Rerank ứng viên của nhiều câu hỏi bằng một lần gọi model cho toàn bộ các cặp."""
+        pairs = [(query, r["chunk"]) for query, res in zip(queries, results) for r in res]
+        scores = iter(self.score_pairs(pairs, budget_ms))
+        reranked = []
+        for res, k in zip(results, top_ks):
+            scored, rest = [], []
+            for r in res:
+                score = next(scores)
+                if score is None:
+                    rest.append(r)
+                else:
+                    scored.append(dict(r, rerank_score=score))
+            # Điểm cross-encoder càng cao càng liên quan: sắp xếp giảm dần.
+            # Ứng viên không kịp chấm giữ thứ tự của bước tìm kiếm thứ nhất, xếp sau
+            scored.sort(key=lambda r: r["rerank_score"], reverse=True)
+            reranked.append((scored + rest)[:k])
+        return reranked
+
+    def rerank(self, query: str, results: List[Dict], top_k: int | None = None, budget_ms: float | None = None) -> List[Dict]:
+        return self.rerank_many([query], [results], [top_k or len(results)], budget_ms)[0]
+
+    def stats(self) -> dict:
+        return {"model": self.model_name, "ms_per_pair": self._ms_per_pair, "cache": self.cache.stats()}
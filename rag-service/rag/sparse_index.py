@@ -0,0 +1,155 @@
+"""
+Chỉ mục từ khoá BM25 (inverted index) chạy song song với VectorStore.
+
+Segment của VectorStore không bao giờ bị sửa, nên postings cũng được dựng một lần cho từng segment
+(id dòng cục bộ) và chỉ segment mới cần dựng thêm. Postings gắn với đối tượng Segment (weakref): các view
+cũ / mới dùng chung postings của segment chung, và postings tự được giải phóng khi không còn view nào
+giữ segment. Thống kê toàn cục (số tài liệu, độ dài trung bình, df) được cộng từ các dòng chưa bị xoá
+của view. Khi tìm kiếm chỉ đọc postings của các từ có trong câu hỏi.
+"""
+import re
+import threading
+import weakref
+from collections import Counter
+
+import numpy as np
+
+from rag.storage import Segment
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> list[str]:
+    # \w giữ nguyên chữ có dấu tiếng Việt và mã môn học kiểu "cs101"
+    return _TOKEN_RE.findall(text.lower())
+
+
+class SegmentPostings:
+    """Postings của một segment: từ -> (dòng, tần suất)."""
+
+    def __init__(self, segment: Segment):
+        self.name = segment.name
+        rows: dict[str, list[int]] = {}
+        freqs: dict[str, list[int]] = {}
+        lengths = np.zeros(segment.count, dtype=np.float32)
+        for row, chunk in enumerate(segment.iter_chunks()):
+            tokens = tokenize(chunk)
+            lengths[row] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                rows.setdefault(term, []).append(row)
+                freqs.setdefault(term, []).append(tf)
+        self.postings = {
+            term: (np.asarray(rows[term], dtype=np.int64), np.asarray(freqs[term], dtype=np.float32))
+            for term in rows
+        }
+        self.lengths = lengths
+        self.count = segment.count
+        self.total_length = float(lengths.sum())
+        # Phần tf đã chuẩn hoá độ dài của BM25 theo từng từ; chỉ phụ thuộc độ dài trung bình toàn cục
+        # nên được tính một lần và dùng lại tới khi tập segment thay đổi
+        self._impacts: dict[str, np.ndarray] = {}
+        self._impacts_avg = 0.0
+
+    def impact(self, term: str, k1: float, b: float, avg_len: float) -> tuple[np.ndarray, np.ndarray] | None:
+        """(dòng, tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))) của `term`, None nếu không có."""
+        hit = self.postings.get(term)
+        if hit is None:
+            return None
+        if avg_len != self._impacts_avg:
+            self._impacts = {}
+            self._impacts_avg = avg_len
+        rows, tf = hit
+        impact = self._impacts.get(term)
+        if impact is None:
+            norm = k1 * (1.0 - b + b * self.lengths[rows] / max(avg_len, 1e-6))
+            impact = tf * (k1 + 1.0) / (tf + norm)
+            self._impacts[term] = impact
+        return rows, impact
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._segments: weakref.WeakKeyDictionary[Segment, SegmentPostings] = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        # (segments, dead, số dòng sống, độ dài trung bình) của view gần nhất: tính lại khi view đổi
+        self._stats: tuple | None = None
+
+    def sync(self, segments: list[Segment]) -> list[SegmentPostings]:
+        """Dựng postings cho segment chưa có; trả về postings theo thứ tự segments."""
+        with self._lock:
+            for seg in segments:
+                if seg not in self._segments:
+                    self._segments[seg] = SegmentPostings(seg)
+            return [self._segments[seg] for seg in segments]
+
+    def _live_stats(self, view, postings: list[SegmentPostings]) -> tuple[int, float]:
+        """Số dòng chưa bị xoá và độ dài trung bình của chúng trong `view`."""
+        segments, starts, dead = view[:3]
+        stats = self._stats
+        if stats is not None and stats[0] is segments and stats[1] is dead:
+            return stats[2], stats[3]
+        n_docs = sum(p.count for p in postings)
+        total_length = sum(p.total_length for p in postings)
+        if dead is not None:
+            n_docs -= int(dead.sum())
+            for p, start in zip(postings, starts[:-1]):
+                total_length -= float(p.lengths[dead[start:start + p.count]].sum())
+        avg_len = total_length / n_docs if n_docs else 0.0
+        self._stats = (segments, dead, n_docs, avg_len)
+        return n_docs, avg_len
+
+    def search(self, query: str, view, top_k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        BM25 của `query` trên `view` (segments, starts, dead, ...) của VectorStore.
+        Trả về (id toàn cục, điểm) của top_k dòng, điểm giảm dần.
+        """
+        segments, starts, dead = view[:3]
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not segments or top_k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        postings = self.sync(segments)
+
+        # Dòng đã xoá (tombstone) không được tính vào số tài liệu, độ dài trung bình và df
+        n_docs, avg_len = self._live_stats(view, postings)
+        ids, weights = [], []
+        for term in terms:
+            hits = [(start, p.impact(term, self.k1, self.b, avg_len)) for p, start in zip(postings, starts[:-1])]
+            hits = [(start, hit) for start, hit in hits if hit is not None]
+            if dead is None:
+                df = sum(hit[0].size for _, hit in hits)
+            else:
+                df = sum(int(np.count_nonzero(~dead[hit[0] + int(start)])) for start, hit in hits)
+            if df == 0:
+                continue
+            idf = np.float32(np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5)))
+            for start, (rows, impact) in hits:
+                ids.append(rows + int(start) if start else rows)
+                weights.append(idf * impact)
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        # Cộng điểm của cùng một dòng qua các từ. Ít postings: gom bằng np.unique (không đụng tới
+        # toàn bộ DB); nhiều postings (từ rất phổ biến): cộng vào mảng điểm dày rồi lấy các dòng khác 0
+        total = sum(block.size for block in ids)
+        if total * 16 < n_docs:
+            uniq, inverse = np.unique(np.concatenate(ids), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(weights)).astype(np.float32)
+        else:
+            dense = np.zeros(int(starts[-1]), dtype=np.float32)
+            for block, weight in zip(ids, weights):
+                # Trong một từ, mỗi dòng xuất hiện tối đa một lần nên cộng trực tiếp được
+                dense[block] += weight
+            uniq = np.flatnonzero(dense)
+            scores = dense[uniq]
+        if dead is not None:
+            alive = ~dead[uniq]
+            uniq, scores = uniq[alive], scores[alive]
+        k = min(top_k, uniq.size)
+        if k < uniq.size:
+            top = np.argpartition(scores, uniq.size - k)[uniq.size - k:]
+        else:
+            top = np.arange(uniq.size)
+        top = top[np.argsort(scores[top])[::-1]]
+        return uniq[top], scores[top]
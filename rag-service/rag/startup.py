@@ -0,0 +1,62 @@
+"""
+Trạng thái khởi động của rag-service.
+
+Load model, mở DB / chỉ mục, auto-ingest và warmup chạy nền sau khi app đã nhận kết nối;
+mỗi bước có trạng thái riêng để /health và /ready báo cáo.
+"""
+import threading
+import time
+from typing import Callable
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+
+class StartupTracker:
+    def __init__(self, stages: list[str], optional: tuple[str, ...] = ()):
+        # Bước optional lỗi không làm service mất sẵn sàng (vd. auto-ingest chỉ là tiện ích)
+        self.optional = set(optional)
+        self._stages = {name: {"state": PENDING} for name in stages}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def _set(self, name: str, **fields):
+        with self._lock:
+            self._stages[name].update(fields)
+
+    def run(self, name: str, fn: Callable, *args, **kwargs):
+        """Chạy một bước, ghi lại trạng thái, thời gian và lỗi (nếu có). Lỗi được ném lại cho nơi gọi."""
+        started = time.perf_counter()
+        self._set(name, state=RUNNING, started_at=time.time())
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._set(name, state=FAILED, seconds=round(time.perf_counter() - started, 3), error=str(e))
+            print(f"[ERROR] Khởi động - {name} lỗi: {e}")
+            raise
+        self._set(name, state=DONE, seconds=round(time.perf_counter() - started, 3))
+        print(f"[INFO] Khởi động - {name}: xong sau {time.perf_counter() - started:.2f}s")
+        return result
+
+    def skip(self, name: str, reason: str):
+        self._set(name, state=SKIPPED, reason=reason)
+        print(f"[INFO] Khởi động - bỏ qua {name}: {reason}")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {name: dict(stage) for name, stage in self._stages.items()}
+
+    @property
+    def failed(self) -> bool:
+        """Có bước bắt buộc bị lỗi: service sẽ không bao giờ sẵn sàng nếu không khởi động lại."""
+        return any(s["state"] == FAILED for name, s in self.snapshot().items() if name not in self.optional)
+
+    @property
+    def ready(self) -> bool:
+        return all(
+            s["state"] in (DONE, SKIPPED) or (s["state"] == FAILED and name in self.optional)
+            for name, s in self.snapshot().items()
+        )
@@ -0,0 +1,466 @@
+"""
+Định dạng lưu trữ nhị phân của VectorStore (thay cho file pickle).
+
+DB là một thư mục gồm file MANIFEST.json và các segment chỉ ghi thêm (append-only):
+    MANIFEST.json  - danh sách segment đang dùng, dim, model; thay thế nguyên tử khi đổi
+    seg-000001/    - mỗi lần add_documents ghi một segment mới, không sửa segment cũ
+
+Mỗi segment gồm:
+    header.json   - thông tin định dạng: version, dim, count, dtype, model,
+                    sources (danh sách nguồn - vd. đường dẫn file - xuất hiện trong segment)
+    vectors.f32   - ma trận float32 (count x dim) ghi liên tục, mở bằng mmap
+    chunks.bin    - toàn bộ nội dung chunk (utf-8) nối liền nhau
+    offsets.i64   - mảng int64 (count + 1) vị trí bắt đầu của từng chunk trong chunks.bin
+    sources.i32   - mảng int32 (count): chỉ số nguồn của từng chunk trong header["sources"], -1 = không có
+                    (từ version 2; segment version 1 coi như mọi chunk không có nguồn)
+    metadata.i32  - mảng int32 (count): chỉ số metadata (dict, vd. {"url": ...}) trong header["metadata"],
+                    -1 = không có (từ version 3)
+
+Bản lượng tử hoá của vector (tuỳ chọn, xem VECTOR_DTYPE trong rag/config.py) là dữ liệu dẫn xuất, dựng
+từ vectors.f32 khi cần và có thể xoá bất cứ lúc nào:
+    vectors.f16   - float16 (count x dim)
+    vectors.i8    - int8 (count x dim), giá trị thật ~ code * scale[d]
+    scale.f32     - float32 (dim): hệ số theo từng chiều của vectors.i8 = max |x[:, d]| / 127
+
+Xoá theo nguồn không sửa segment: MANIFEST.json ghi "tombstones" {tên segment: [nguồn đã xoá]},
+search bỏ qua các dòng đó và compaction loại hẳn chúng khi ghi segment mới.
+"""
+import json
+import mmap
+from array import array
+import os
+import pickle
+import shutil
+import threading
+from typing import Iterable
+
+import numpy as np
+
+FORMAT_NAME = "rag-vector-store"
+SEGMENT_VERSION = 3
+SUPPORTED_SEGMENT_VERSIONS = (1, 2, 3)
+MANIFEST_VERSION = 2
+
+MANIFEST_FILE = "MANIFEST.json"
+HEADER_FILE = "header.json"
+VECTORS_FILE = "vectors.f32"
+CHUNKS_FILE = "chunks.bin"
+OFFSETS_FILE = "offsets.i64"
+SOURCES_FILE = "sources.i32"
+METADATA_FILE = "metadata.i32"
+SEGMENT_FILES = (HEADER_FILE, VECTORS_FILE, CHUNKS_FILE, OFFSETS_FILE)
+QUANTIZED_FILES = {"float16": "vectors.f16", "int8": "vectors.i8"}
+SCALE_FILE = "scale.f32"
+VECTOR_DTYPES = ("float32", *QUANTIZED_FILES)
+_QUANTIZE_BLOCK_ROWS = 65536
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    """Chuyển về ma trận float32 liên tục và chuẩn hoá mỗi dòng về norm = 1."""
+    matrix = np.array(vectors, dtype=np.float32, ndmin=2, copy=True)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return np.ascontiguousarray(matrix)
+
+
+def _fsync_dir(path: str):
+    # Windows không hỗ trợ fsync thư mục, bỏ qua
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_json(path: str, data: dict):
+    """Ghi JSON nguyên tử: file tạm + fsync + os.replace (MANIFEST.json, FILES.json, checkpoint của crawler)."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(os.path.dirname(os.path.abspath(path)))
+
+
+def int8_scale(vectors: np.ndarray) -> np.ndarray:
+    """Hệ số theo từng chiều cho lượng tử hoá int8: max |x[:, d]| / 127 (đọc theo khối)."""
+    peak = np.zeros(vectors.shape[1], dtype=np.float32)
+    for start in range(0, vectors.shape[0], _QUANTIZE_BLOCK_ROWS):
+        np.maximum(peak, np.abs(vectors[start:start + _QUANTIZE_BLOCK_ROWS]).max(axis=0), out=peak)
+    peak[peak == 0] = 1.0
+    return peak / 127.0
+
+
+def quantize(block: np.ndarray, dtype: str, scale: np.ndarray | None = None) -> np.ndarray:
+    if dtype == "float16":
+        return block.astype(np.float16)
+    return np.clip(np.rint(block / scale), -127, 127).astype(np.int8)
+
+
+def _map_file(path: str):
+    """mmap chỉ đọc; file rỗng không mmap được nên trả về None."""
+    if os.path.getsize(path) == 0:
+        return None
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class Segment:
+    """Một segment đã ghi trên đĩa, mở lười bằng mmap (không đọc toàn bộ vào RAM)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(os.path.join(path, HEADER_FILE), "r", encoding="utf-8") as f:
+            self.header = json.load(f)
+        if self.header.get("format") != FORMAT_NAME:
+            raise ValueError(f"Không phải segment vector store: {path}")
+        if self.header.get("version") not in SUPPORTED_SEGMENT_VERSIONS:
+            raise ValueError(f"Không hỗ trợ phiên bản segment {self.header.get('version')} tại {path}")
+
+        self.count = int(self.header["count"])
+        self.dim = int(self.header["dim"])
+        self._maps = [
+            _map_file(os.path.join(path, VECTORS_FILE)),
+            _map_file(os.path.join(path, OFFSETS_FILE)),
+            _map_file(os.path.join(path, CHUNKS_FILE)),
+        ]
+        vec_map, off_map, self._blob = self._maps
+
+        if self.count and vec_map is not None:
+            self.vectors = np.frombuffer(vec_map, dtype=np.float32, count=self.count * self.dim)
+            self.vectors = self.vectors.reshape(self.count, self.dim)
+            self.offsets = np.frombuffer(off_map, dtype=np.int64, count=self.count + 1)
+        else:
+            self.vectors = np.empty((0, self.dim), dtype=np.float32)
+            self.offsets = np.zeros(1, dtype=np.int64)
+
+        self.sources: list[str] = list(self.header.get("sources", []))
+        self.metadata: list[dict] = list(self.header.get("metadata", []))
+        self.source_ids = self._read_ids(SOURCES_FILE)
+        self.metadata_ids = self._read_ids(METADATA_FILE)
+        # dtype -> (ma trận lượng tử hoá, scale hoặc None), mở khi gọi quantized()
+        self._quantized: dict[str, tuple[np.ndarray, np.ndarray | None]] = {}
+        self._quantize_lock = threading.Lock()
+
+    def _read_ids(self, file_name: str) -> np.ndarray:
+        """Cột int32 theo từng dòng; segment cũ không có file thì coi như toàn -1."""
+        file_path = os.path.join(self.path, file_name)
+        if self.count and os.path.exists(file_path):
+            ids_map = _map_file(file_path)
+            self._maps.append(ids_map)
+            return np.frombuffer(ids_map, dtype=np.int32, count=self.count)
+        return np.full(self.count, -1, dtype=np.int32)
+
+    def quantized(self, dtype: str) -> tuple[np.ndarray, np.ndarray | None]:
+        """
+        Vector lượng tử hoá (float16 / int8) của segment và scale theo chiều (chỉ int8).
+        Lần đầu dựng file từ vectors.f32 (ghi file tạm rồi đổi tên), sau đó chỉ mmap.
+        """
+        cached = self._quantized.get(dtype)
+        if cached is not None:
+            return cached
+        with self._quantize_lock:
+            return self._open_quantized(dtype)
+
+    def _open_quantized(self, dtype: str) -> tuple[np.ndarray, np.ndarray | None]:
+        cached = self._quantized.get(dtype)
+        if cached is not None:
+            return cached
+        file_path = os.path.join(self.path, QUANTIZED_FILES[dtype])
+        scale_path = os.path.join(self.path, SCALE_FILE)
+        np_dtype = np.float16 if dtype == "float16" else np.int8
+        if self.count == 0:
+            cached = (np.empty((0, self.dim), dtype=np_dtype), np.ones(self.dim, dtype=np.float32))
+            self._quantized[dtype] = cached
+            return cached
+        if dtype == "int8" and not os.path.exists(scale_path):
+            _write_atomic(scale_path, [int8_scale(self.vectors)])
+        scale = np.fromfile(scale_path, dtype=np.float32, count=self.dim) if dtype == "int8" else None
+        if not os.path.exists(file_path):
+            vectors = self.vectors
+            _write_atomic(file_path, (
+                quantize(vectors[start:start + _QUANTIZE_BLOCK_ROWS], dtype, scale)
+                for start in range(0, self.count, _QUANTIZE_BLOCK_ROWS)
+            ))
+        codes_map = _map_file(file_path)
+        self._maps.append(codes_map)
+        codes = np.frombuffer(codes_map, dtype=np_dtype, count=self.count * self.dim).reshape(self.count, self.dim)
+        cached = (codes, scale)
+        self._quantized[dtype] = cached
+        return cached
+
+    def chunk(self, i: int) -> str:
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return self._blob[start:end].decode("utf-8") if self._blob is not None else ""
+
+    def iter_chunks(self):
+        for i in range(self.count):
+            yield self.chunk(i)
+
+    def source(self, i: int) -> str | None:
+        sid = int(self.source_ids[i])
+        return self.sources[sid] if sid >= 0 else None
+
+    def iter_sources(self):
+        for sid in self.source_ids:
+            yield self.sources[sid] if sid >= 0 else None
+
+    def meta(self, i: int) -> dict | None:
+        mid = int(self.metadata_ids[i])
+        return self.metadata[mid] if mid >= 0 else None
+
+    def iter_metadata(self):
+        for mid in self.metadata_ids:
+            yield self.metadata[mid] if mid >= 0 else None
+
+    def rows_of(self, sources: Iterable[str]) -> np.ndarray:
+        """Mask các dòng thuộc một trong các nguồn `sources` (toàn False nếu segment không chứa)."""
+        wanted = set(sources)
+        ids = [i for i, name in enumerate(self.sources) if name in wanted]
+        if not ids:
+            return np.zeros(self.count, dtype=bool)
+        return np.isin(self.source_ids, ids)
+
+    def close(self):
+        """Giải phóng mmap (cần trước khi xoá thư mục trên Windows)."""
+        self.vectors = None
+        self.offsets = None
+        self.source_ids = None
+        self.metadata_ids = None
+        self._quantized = {}
+        self._blob = None
+        for m in self._maps:
+            if m is None:
+                continue
+            try:
+                m.close()
+            except BufferError:
+                # Vẫn còn view numpy đang dùng; GC sẽ đóng sau
+                pass
+        self._maps = []
+
+
+def _write_atomic(path: str, blocks: Iterable[np.ndarray]):
+    """Ghi các khối mảng nối tiếp ra file tạm rồi đổi tên (không để lại file ghi dở)."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        for block in blocks:
+            f.write(np.ascontiguousarray(block).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_segment(
+    path: str,
+    chunks: Iterable[str],
+    vector_blocks: Iterable[np.ndarray],
+    dim: int,
+    model: str = "",
+    sources: Iterable[str | None] | None = None,
+    metadata: Iterable[dict | None] | None = None,
+) -> int:
+    """
+    Ghi một segment mới vào `path` (chưa tồn tại): ghi ra thư mục tạm, fsync rồi đổi tên.
+    `vector_blocks` là các khối ma trận float32 ghi nối tiếp nhau (không cần ghép trong RAM).
+    `sources` / `metadata` (tuỳ chọn) là nguồn / metadata của từng chunk, cùng thứ tự với `chunks`.
+    Trả về số chunk đã ghi.
+    """
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    rows = 0
+    with open(os.path.join(tmp_path, VECTORS_FILE), "wb") as f:
+        for block in vector_blocks:
+            block = np.ascontiguousarray(block, dtype=np.float32)
+            if block.size:
+                f.write(block.tobytes())
+                rows += block.shape[0]
+        f.flush()
+        os.fsync(f.fileno())
+
+    offsets = [0]
+    with open(os.path.join(tmp_path, CHUNKS_FILE), "wb") as f:
+        for chunk in chunks:
+            data = chunk.encode("utf-8")
+            f.write(data)
+            offsets.append(offsets[-1] + len(data))
+        f.flush()
+        os.fsync(f.fileno())
+
+    # Bảng nguồn / metadata riêng của segment: mỗi chunk chỉ lưu một chỉ số int32
+    count = len(offsets) - 1
+    source_table, source_ids = _write_ids(os.path.join(tmp_path, SOURCES_FILE), sources, count, key=lambda v: v)
+    meta_table, meta_ids = _write_ids(
+        os.path.join(tmp_path, METADATA_FILE), metadata, count, key=lambda v: json.dumps(v, sort_keys=True)
+    )
+
+    if count != rows or count != len(source_ids) or count != len(meta_ids):
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise ValueError(
+            f"Số chunk ({count}) khác số vector ({rows}), số nguồn ({len(source_ids)}) hoặc metadata ({len(meta_ids)})"
+        )
+
+    with open(os.path.join(tmp_path, OFFSETS_FILE), "wb") as f:
+        f.write(np.asarray(offsets, dtype=np.int64).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+
+    header = {
+        "format": FORMAT_NAME,
+        "version": SEGMENT_VERSION,
+        "dim": int(dim),
+        "count": count,
+        "dtype": "float32",
+        "model": model,
+        "sources": list(source_table.values()),
+        "metadata": list(meta_table.values()),
+    }
+    with open(os.path.join(tmp_path, HEADER_FILE), "w", encoding="utf-8") as f:
+        json.dump(header, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.rename(tmp_path, path)
+    _fsync_dir(os.path.dirname(os.path.abspath(path)))
+    return count
+
+
+def _write_ids(path: str, values: Iterable | None, count: int, key) -> tuple[dict, array]:
+    """
+    Ghi cột chỉ số int32 cho `values` (mỗi dòng một giá trị, None = -1).
+    Trả về (bảng giá trị khác nhau theo thứ tự xuất hiện, mảng chỉ số).
+    """
+    table: dict = {}
+    positions: dict = {}
+    ids = array("i")
+    if values is None:
+        ids = array("i", [-1]) * count
+    else:
+        for value in values:
+            if value is None:
+                ids.append(-1)
+                continue
+            k = key(value)
+            if k not in positions:
+                positions[k] = len(positions)
+                table[k] = value
+            ids.append(positions[k])
+    with open(path, "wb") as f:
+        f.write(np.frombuffer(ids, dtype=np.int32).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    return table, ids
+
+
+def new_manifest(dim: int = 0, model: str = "") -> dict:
+    return {
+        "format": FORMAT_NAME,
+        "version": MANIFEST_VERSION,
+        "dim": int(dim),
+        "model": model,
+        "segments": [],
+        "next_segment": 1,
+        "tombstones": {},
+    }
+
+
+def segment_name(manifest: dict) -> str:
+    """Lấy tên segment kế tiếp và tăng bộ đếm trong manifest."""
+    name = f"seg-{manifest['next_segment']:06d}"
+    manifest["next_segment"] += 1
+    return name
+
+
+def read_manifest(db_path: str) -> dict | None:
+    """Đọc MANIFEST.json; tự nâng cấp thư mục định dạng cũ (một khối, không manifest)."""
+    manifest_path = os.path.join(db_path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        if os.path.exists(os.path.join(db_path, HEADER_FILE)):
+            return _upgrade_single_store(db_path)
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT_NAME or manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Không hỗ trợ manifest phiên bản {manifest.get('version')} tại {db_path}")
+    return manifest
+
+
+def write_manifest(db_path: str, manifest: dict):
+    """Thay manifest một cách nguyên tử: đây là điểm commit của mọi thay đổi."""
+    write_json(os.path.join(db_path, MANIFEST_FILE), manifest)
+
+
+def remove_orphans(db_path: str, manifest: dict):
+    """Xoá segment / file tạm không còn trong manifest (sót lại sau crash hoặc compaction)."""
+    live = set(manifest.get("segments", []))
+    for name in os.listdir(db_path):
+        full = os.path.join(db_path, name)
+        if name.startswith("seg-") and os.path.isdir(full) and name not in live:
+            shutil.rmtree(full, ignore_errors=True)
+
+
+def _upgrade_single_store(db_path: str) -> dict:
+    """Chuyển thư mục định dạng một khối (chỉ có header.json ở gốc) thành segment đầu tiên."""
+    with open(os.path.join(db_path, HEADER_FILE), "r", encoding="utf-8") as f:
+        header = json.load(f)
+    manifest = new_manifest(header.get("dim", 0), header.get("model", ""))
+    name = segment_name(manifest)
+    seg_path = os.path.join(db_path, name)
+    os.makedirs(seg_path, exist_ok=True)
+    for file_name in SEGMENT_FILES:
+        os.replace(os.path.join(db_path, file_name), os.path.join(seg_path, file_name))
+    manifest["segments"].append(name)
+    write_manifest(db_path, manifest)
+    return manifest
+
+
+def read_legacy_pickle(pkl_path: str) -> tuple[list[str], list]:
+    """Đọc file vector_store.pkl cũ (dict chunks/vectors, dict items, hoặc list tuple)."""
+    with open(pkl_path, "rb") as f:
+        loaded = pickle.load(f)
+    chunks, vectors = [], []
+    # Chuẩn hoá dữ liệu để tránh lỗi KeyError 'chunks'
+    if isinstance(loaded, dict):
+        chunks = list(loaded.get("chunks", []))
+        vectors = list(loaded.get("vectors", []))
+        # Nếu file cũ lưu dạng list các bản ghi {chunk, vector}
+        if not chunks and not vectors and isinstance(loaded.get("items"), list):
+            items = loaded.get("items", [])
+            chunks = [it.get("chunk", "") for it in items]
+            vectors = [it.get("vector", []) for it in items]
+    elif isinstance(loaded, list):
+        # Danh sách các tuple/list (chunk, vector)
+        for it in loaded:
+            if isinstance(it, (list, tuple)) and len(it) == 2:
+                chunks.append(it[0])
+                vectors.append(it[1])
+    # Không rõ định dạng: trả về rỗng
+    return chunks, vectors
+
+
+def migrate_pickle(pkl_path: str, db_path: str, model: str = "") -> int:
+    """
+    Chuyển một lần từ vector_store.pkl sang định dạng nhị phân.
+    File pickle được đổi tên thành *.migrated để không bị đọc lại. Trả về số chunk.
+    """
+    chunks, vectors = read_legacy_pickle(pkl_path)
+    n = min(len(chunks), len(vectors))
+    os.makedirs(db_path, exist_ok=True)
+    manifest = new_manifest(model=model)
+    if n:
+        matrix = normalize_rows(vectors[:n])
+        manifest["dim"] = matrix.shape[1]
+        name = segment_name(manifest)
+        write_segment(os.path.join(db_path, name), chunks[:n], [matrix], dim=matrix.shape[1], model=model)
+        manifest["segments"].append(name)
+    write_manifest(db_path, manifest)
+    os.replace(pkl_path, pkl_path + ".migrated")
+    return n
@@ -1,114 +1,903 @@
+import copy
+import hashlib
+import json
 import os
-import pickle
+import shutil
+import threading
+from itertools import chain
 import numpy as np
-from rag.config import VECTOR_DB_PATH
+from rag.config import (
+    BM25_B,
+    BM25_K1,
+    COMPACTION_MAX_SEGMENTS,
+    EMBEDDING_MODEL_NAME,
+    INDEX_BACKEND,
+    INDEX_DELTA_ROWS,
+    INGEST_FLUSH_ROWS,
+    LEGACY_DB_PATH,
+    RESCORE_CANDIDATES,
+    RETRIEVAL_MODE,
+    TOMBSTONE_COMPACT_RATIO,
+    VECTOR_DB_PATH,
+    VECTOR_DTYPE,
+)
+from rag.index import FaissIndex, create_index, index_file
+from rag.sparse_index import BM25Index
+from rag.storage import (
+    VECTOR_DTYPES,
+    Segment,
+    migrate_pickle,
+    new_manifest,
+    normalize_rows,
+    read_manifest,
+    remove_orphans,
+    segment_name,
+    write_manifest,
+    write_segment,
+)
+
+
+# Số dòng đổi sang float32 mỗi lần khi quét vector lượng tử hoá
+_SCAN_BLOCK_ROWS = 4096
+
 
 class VectorStore:
-    def __init__(self):
-        self.db_path = VECTOR_DB_PATH
-        # Lưu thêm bản sao dạng .txt để người dùng tiện kiểm tra
-        self.txt_path = os.path.join(os.path.dirname(VECTOR_DB_PATH), "vector_store.txt")
-        self.data = {
-            "chunks": [],
-            "vectors": []
-        }
+    def __init__(
+        self,
+        index_backend: str = INDEX_BACKEND,
+        vector_dtype: str = VECTOR_DTYPE,
+        rescore_candidates: int = RESCORE_CANDIDATES,
+        db_path: str = VECTOR_DB_PATH,
+    ):
+        if vector_dtype not in VECTOR_DTYPES:
+            raise ValueError(f"VECTOR_DTYPE không hợp lệ: {vector_dtype} (chọn {', '.join(VECTOR_DTYPES)})")
+        self.db_path = db_path
+        # File pickle cũ chỉ chuyển đổi vào DB mặc định
+        self.legacy_path = LEGACY_DB_PATH if db_path == VECTOR_DB_PATH else db_path + ".pkl"
+        self.index_backend = index_backend
+        # Lượt quét đầu của backend "exact" đọc bản float16 / int8 (nhỏ hơn, nằm gọn trong RAM),
+        # vectors.f32 chỉ được đọc ở các dòng ứng viên khi chấm lại
+        self.vector_dtype = vector_dtype
+        self.rescore_candidates = rescore_candidates
+        # File .txt để người dùng tiện kiểm tra, chỉ ghi khi gọi export_txt()
+        self.txt_path = os.path.join(os.path.dirname(db_path), "vector_store.txt")
+        # Chỉ mục từ khoá BM25 theo từng segment: dựng ngay khi ghi nếu dùng sparse / hybrid,
+        # ở thread nền nếu dùng dense (để truy vấn từ khoá đầu tiên không phải dựng cả chỉ mục)
+        self.sparse = BM25Index(k1=BM25_K1, b=BM25_B)
+        self._eager_sparse = RETRIEVAL_MODE != "dense"
+        self._manifest = new_manifest(model=EMBEDDING_MODEL_NAME)
+        # (danh sách segment, vị trí bắt đầu của từng segment, mask dòng đã xoá hoặc None, số dòng đã xoá,
+        # chỉ mục ANN hoặc None). Luôn gán lại cả bộ (snapshot) để search không thấy trạng thái nửa vời khi
+        # đang thêm / xoá / compaction. Segment và chỉ mục đã công bố không bao giờ bị sửa tại chỗ:
+        # chỉ mục phủ các dòng [0, ntotal), phần dòng mới hơn được quét chính xác tới khi chỉ mục được dựng lại
+        self._view: tuple[list[Segment], np.ndarray, np.ndarray | None, int, FaissIndex | None] = self._make_view([])
+        # Tăng khi id của các dòng bị dịch (compaction loại dòng, reset, load lại):
+        # chỉ mục dựng nền theo id cũ sẽ bị bỏ thay vì công bố
+        self._id_epoch = 0
+        self._refreshing = False
+        # Tập hash các chunk đã có để dedup (không giữ nguyên văn bản), chỉ dựng khi add_documents lần đầu
+        self._chunk_set: set[int] | None = None
+        # Các chunk/vector mới chưa ghi xuống đĩa
+        self._pending_chunks: list[str] = []
+        self._pending_vectors: list[np.ndarray] = []
+        self._pending_sources: list[str | None] = []
+        self._pending_metadata: list[dict | None] = []
+        # Segment đã ghi xuống đĩa nhưng chưa công bố (đang thay một nguồn bằng replace_source), None khi không thay
+        self._staged: list[Segment] | None = None
+        # Khoá cho các thao tác ghi (add, xoá, compaction, reset)
+        self._lock = threading.RLock()
+        self._compacting = False
+        # Tăng mỗi khi nội dung DB thay đổi (add / xoá / reset) để cache kết quả tự mất hiệu lực
+        self.version = 0
+        # Bộ đệm điểm số riêng cho mỗi thread, tái sử dụng giữa các lần search
+        self._scratch = threading.local()
         self.load_db()
 
+    def __len__(self):
+        """Số dòng vật lý (kể cả dòng đã xoá chưa được compaction dọn)."""
+        return int(self._view[1][-1])
+
+    @property
+    def dead_count(self) -> int:
+        return self._view[3]
+
+    @property
+    def segments(self) -> list[Segment]:
+        return self._view[0]
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """Ghép vector của mọi segment thành một ma trận (có copy, dùng cho build index / benchmark)."""
+        return self._concat_vectors(self.segments)
+
+    def _concat_vectors(self, segments: list[Segment]) -> np.ndarray:
+        if not segments:
+            return np.empty((0, self._manifest.get("dim", 0)), dtype=np.float32)
+        if len(segments) == 1:
+            return segments[0].vectors
+        return np.concatenate([seg.vectors for seg in segments])
+
+    @staticmethod
+    def _vectors_from(view, start: int) -> np.ndarray:
+        """Các vector có id >= start (dùng để bổ sung phần còn thiếu vào index)."""
+        segments, starts = view[:2]
+        blocks = [seg.vectors[max(start - s, 0):] for seg, s in zip(segments, starts[:-1]) if s + seg.count > start]
+        return np.concatenate(blocks) if blocks else np.empty((0, segments[0].dim if segments else 0), dtype=np.float32)
+
+    @staticmethod
+    def _make_view(segments: list[Segment], tombstones: dict | None = None, index: FaissIndex | None = None):
+        starts = np.zeros(len(segments) + 1, dtype=np.int64)
+        if segments:
+            np.cumsum([seg.count for seg in segments], out=starts[1:])
+        # Mask theo id toàn cục của các dòng thuộc nguồn đã xoá (None khi không có tombstone)
+        dead = None
+        for seg, start in zip(segments, starts[:-1]):
+            names = (tombstones or {}).get(seg.name)
+            if not names:
+                continue
+            mask = seg.rows_of(names)
+            if mask.any():
+                if dead is None:
+                    dead = np.zeros(int(starts[-1]), dtype=bool)
+                dead[start:start + seg.count] = mask
+        n_dead = int(dead.sum()) if dead is not None else 0
+        return segments, starts, dead, n_dead, index
+
+    @staticmethod
+    def _row_in(view, i: int) -> tuple[Segment, int]:
+        segments, starts = view[:2]
+        seg = int(np.searchsorted(starts, i, side="right")) - 1
+        return segments[seg], i - int(starts[seg])
+
+    @classmethod
+    def _chunk_in(cls, view, i: int) -> str:
+        seg, row = cls._row_in(view, i)
+        return seg.chunk(row)
+
+    def chunk(self, i: int) -> str:
+        return self._chunk_in(self._view, i)
+
+    def _iter_live(self):
+        """(segment, dòng) của mọi chunk chưa bị xoá."""
+        segments, starts, dead = self._view[:3]
+        for seg, start in zip(segments, starts[:-1]):
+            if dead is None or not dead[start:start + seg.count].any():
+                for row in range(seg.count):
+                    yield seg, row
+            else:
+                for row in np.flatnonzero(~dead[start:start + seg.count]):
+                    yield seg, int(row)
+
+    def iter_chunks(self):
+        for seg, row in self._iter_live():
+            yield seg.chunk(row)
+
+    def sources(self) -> dict[str, int]:
+        """Số chunk còn lại của từng nguồn."""
+        segments, starts, dead = self._view[:3]
+        counts: dict[str, int] = {}
+        for seg, start in zip(segments, starts[:-1]):
+            ids = seg.source_ids
+            if dead is not None:
+                ids = ids[~dead[start:start + seg.count]]
+            ids = ids[ids >= 0]
+            if not ids.size:
+                continue
+            for name, count in zip(seg.sources, np.bincount(ids, minlength=len(seg.sources))):
+                if count:
+                    counts[name] = counts.get(name, 0) + int(count)
+        return counts
+
     def load_db(self):
-        if os.path.exists(self.db_path):
-            with open(self.db_path, 'rb') as f:
-                loaded = pickle.load(f)
-                # Chuẩn hoá dữ liệu để tránh lỗi KeyError 'chunks'
-                if isinstance(loaded, dict):
-                    chunks = loaded.get("chunks", [])
-                    vectors = loaded.get("vectors", [])
-                    # Nếu file cũ lưu dạng list các bản ghi {chunk, vector}
-                    if not chunks and not vectors and isinstance(loaded.get("items"), list):
-                        items = loaded.get("items", [])
-                        chunks = [it.get("chunk", "") for it in items]
-                        vectors = [it.get("vector", []) for it in items]
-                    # Gán về cấu trúc chuẩn
-                    self.data = {"chunks": list(chunks), "vectors": list(vectors)}
-                elif isinstance(loaded, list):
-                    # Danh sách các tuple/list (chunk, vector)
-                    chunks, vectors = [], []
-                    for it in loaded:
-                        if isinstance(it, (list, tuple)) and len(it) == 2:
-                            chunks.append(it[0])
-                            vectors.append(it[1])
-                    self.data = {"chunks": chunks, "vectors": vectors}
-                else:
-                    # Không rõ định dạng, giữ nguyên mặc định rỗng
-                    self.data = {"chunks": [], "vectors": []}
-
-    def save_db(self):
-        # Tạo thư mục data nếu chưa có
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-        with open(self.db_path, 'wb') as f:
-            pickle.dump(self.data, f)
-        # Ghi thêm file .txt để dễ xem nội dung
+        # Chuyển đổi một lần từ file pickle cũ nếu chưa có DB nhị phân
+        if not os.path.exists(self.db_path) and os.path.exists(self.legacy_path):
+            n = migrate_pickle(self.legacy_path, self.db_path, model=EMBEDDING_MODEL_NAME)
+            print(f"[INFO] Đã chuyển {n} chunk từ {self.legacy_path} sang {self.db_path}")
+        manifest = read_manifest(self.db_path) if os.path.exists(self.db_path) else None
+        if manifest is None:
+            manifest = new_manifest(model=EMBEDDING_MODEL_NAME)
+        else:
+            remove_orphans(self.db_path, manifest)
+        manifest.setdefault("tombstones", {})
+        segments = [Segment(os.path.join(self.db_path, name)) for name in manifest["segments"]]
+        with self._lock:
+            self._manifest = manifest
+            view = self._make_view(segments, manifest["tombstones"])
+            self._view = self._make_view(segments, manifest["tombstones"], self._load_index(view))
+            self._id_epoch += 1
+            self.version += 1
+            self._sync_derived()
+
+    def _load_index(self, view) -> FaissIndex | None:
+        """Mở chỉ mục đã lưu nếu khớp với DB, nếu không thì dựng lại từ các vector."""
+        n = int(view[1][-1])
+        if self.index_backend == "exact" or n == 0:
+            return None
+        index = create_index(self.index_backend, self._manifest["dim"])
+        path = index_file(self.db_path, self.index_backend)
+        if os.path.exists(path):
+            try:
+                index.load(path)
+                if index.ntotal == n:
+                    return index
+                if index.ntotal < n:
+                    # Index được lưu trước các lần add cuối: chỉ cần bổ sung phần thiếu (chưa công bố nên sửa được)
+                    index.add(self._vectors_from(view, index.ntotal))
+                    return index
+                print(f"[INFO] Chỉ mục {path} lệch với DB, dựng lại")
+            except Exception as e:
+                print(f"[WARN] Không đọc được chỉ mục {path}: {e}")
+        index.build(self._concat_vectors(view[0]))
+        self._save_index(index)
+        return index
+
+    def save_index(self):
+        """Lưu chỉ mục ANN (không nằm trên đường ghi của add_documents)."""
+        self._save_index(self._view[4])
+
+    def _save_index(self, index: FaissIndex | None):
+        if index is not None and os.path.exists(self.db_path):
+            index.save(index_file(self.db_path, self.index_backend))
+
+    def _index_behind(self) -> bool:
+        """True nếu phần dòng chưa có trong chỉ mục (quét chính xác) vượt INDEX_DELTA_ROWS hoặc chỉ mục cần dựng lại."""
+        index, n = self._view[4], len(self)
+        covered = index.ntotal if index is not None else 0
+        return n - covered > INDEX_DELTA_ROWS or (index is not None and index.needs_rebuild(n))
+
+    def _maybe_refresh_index(self):
+        """Dựng lại chỉ mục nền khi chỉ mục tụt lại phía sau DB (gọi trong khoá)."""
+        if self.index_backend == "exact" or self._refreshing:
+            return
+        if self._index_behind():
+            threading.Thread(target=self.refresh_index, daemon=True).start()
+
+    def refresh_index(self):
+        """
+        Dựng chỉ mục mới phủ mọi dòng hiện có (bản sao của chỉ mục cũ + phần thêm, hoặc dựng lại từ đầu)
+        ngoài khoá rồi công bố bằng cách thay view; search đang chạy vẫn dùng chỉ mục cũ không bị sửa.
+        Dòng được thêm trong lúc dựng (yêu cầu refresh khi đó bị bỏ qua vì đang refresh) được phủ ở vòng sau,
+        lặp tới khi phần chưa phủ không còn vượt ngưỡng.
+        """
+        with self._lock:
+            if self.index_backend == "exact" or self._refreshing:
+                return
+            self._refreshing = True
+        try:
+            while True:
+                with self._lock:
+                    view, epoch = self._view, self._id_epoch
+                index, n = view[4], int(view[1][-1])
+                if n:
+                    if index is None or index.needs_rebuild(n):
+                        fresh = create_index(self.index_backend, view[0][0].dim)
+                        fresh.build(self._concat_vectors(view[0]))
+                    else:
+                        fresh = index.copy()
+                        fresh.add(self._vectors_from(view, index.ntotal))
+                    with self._lock:
+                        # Id bị dịch trong lúc dựng (compaction loại dòng / reset): chỉ mục vừa dựng không còn đúng
+                        published = self._id_epoch == epoch
+                        if published:
+                            self._view = self._view[:4] + (fresh,)
+                    if published:
+                        self._save_index(fresh)
+                with self._lock:
+                    # Kiểm tra và hạ cờ trong cùng khoá với save_db: không yêu cầu nào lọt vào giữa
+                    if not self._index_behind():
+                        self._refreshing = False
+                        return
+        except BaseException:
+            self._refreshing = False
+            raise
+
+    def save_db(self, tombstones: dict[str, list[str]] | None = None, staged: list[Segment] | None = None):
+        """
+        Ghi các chunk mới (pending) thành một segment mới; không ghi lại dữ liệu cũ.
+        `tombstones` {tên segment: [nguồn]} và các segment `staged` đã ghi trước đó được công bố
+        cùng manifest (một lần commit nguyên tử).
+        Khi đang thay một nguồn (replace_source), segment mới chỉ được ghi xuống đĩa, chưa công bố.
+        """
+        with self._lock:
+            if not self._pending_chunks and not tombstones and not staged:
+                return
+            if self._staged is not None and tombstones is None and staged is None:
+                if self._pending_chunks:
+                    self._stage_pending()
+                return
+            os.makedirs(self.db_path, exist_ok=True)
+            manifest = copy.deepcopy(self._manifest)
+            segments = list(self.segments)
+            new_vectors = None
+            for seg in staged or []:
+                manifest["dim"] = seg.dim
+                manifest["segments"].append(seg.name)
+                segments.append(seg)
+            if self._pending_chunks:
+                new_vectors = np.concatenate(self._pending_vectors)
+                manifest["dim"] = int(new_vectors.shape[1])
+                name = segment_name(manifest)
+                seg_path = os.path.join(self.db_path, name)
+                write_segment(
+                    seg_path,
+                    self._pending_chunks,
+                    [new_vectors],
+                    dim=manifest["dim"],
+                    model=manifest["model"],
+                    sources=self._pending_sources,
+                    metadata=self._pending_metadata,
+                )
+                manifest["segments"].append(name)
+                segments.append(Segment(seg_path))
+            for name, names in (tombstones or {}).items():
+                dead = manifest["tombstones"].setdefault(name, [])
+                dead.extend(source for source in names if source not in dead)
+            # Manifest được thay nguyên tử: crash trước bước này thì segment mới / tombstone bị bỏ qua
+            write_manifest(self.db_path, manifest)
+            self._manifest = manifest
+            self._pending_chunks = []
+            self._pending_vectors = []
+            self._pending_sources = []
+            self._pending_metadata = []
+            # Chỉ mục giữ nguyên: dòng mới được search quét chính xác tới khi refresh_index công bố chỉ mục mới
+            self._view = self._make_view(segments, manifest["tombstones"], self._view[4])
+            self.version += 1
+            if new_vectors is not None or staged:
+                self._maybe_refresh_index()
+            self._sync_derived()
+            self._maybe_compact()
+
+    def _stage_pending(self):
+        """Ghi các chunk pending thành segment chưa có trong manifest (crash thì remove_orphans dọn)."""
+        os.makedirs(self.db_path, exist_ok=True)
+        vectors = np.concatenate(self._pending_vectors)
+        name = segment_name(self._manifest)
+        seg_path = os.path.join(self.db_path, name)
+        write_segment(
+            seg_path,
+            self._pending_chunks,
+            [vectors],
+            dim=int(vectors.shape[1]),
+            model=self._manifest["model"],
+            sources=self._pending_sources,
+            metadata=self._pending_metadata,
+        )
+        self._staged.append(Segment(seg_path))
+        self._pending_chunks = []
+        self._pending_vectors = []
+        self._pending_sources = []
+        self._pending_metadata = []
+
+    def _sync_derived(self):
+        """Dựng sẵn dữ liệu dẫn xuất của segment mới: postings BM25, vector lượng tử hoá."""
+        segments = self.segments
+        if self._eager_sparse:
+            self.sparse.sync(segments)
+        elif segments:
+            threading.Thread(target=self.sparse.sync, args=(segments,), daemon=True).start()
+        if self._quantized_scan:
+            for seg in segments:
+                seg.quantized(self.vector_dtype)
+
+    @property
+    def _quantized_scan(self) -> bool:
+        return self.vector_dtype != "float32" and self.index_backend == "exact"
+
+    def _maybe_compact(self):
+        if self._compacting:
+            return
+        if len(self.segments) > COMPACTION_MAX_SEGMENTS or self._pick_reclaim() is not None:
+            threading.Thread(target=self.compact, daemon=True).start()
+
+    @staticmethod
+    def _pick_compaction(segments: list[Segment]) -> int:
+        """
+        Chọn vị trí bắt đầu của dãy segment cuối cần gộp.
+        Chỉ gộp segment lớn phía trước khi phần đã gộp có kích thước tương đương,
+        nhờ vậy mỗi chunk chỉ bị ghi lại O(log N) lần.
+        """
+        start = len(segments) - 1
+        merged = segments[-1].count
+        while start > 0 and segments[start - 1].count <= 2 * merged:
+            start -= 1
+            merged += segments[start].count
+        return start
+
+    def _pick_reclaim(self) -> int | None:
+        """Segment có tỉ lệ dòng đã xoá cao nhất, nếu vượt TOMBSTONE_COMPACT_RATIO."""
+        segments, starts, dead = self._view[:3]
+        if dead is None:
+            return None
+        best, best_ratio = None, 0.0
+        for i, (seg, start) in enumerate(zip(segments, starts[:-1])):
+            if seg.count == 0:
+                continue
+            ratio = float(dead[start:start + seg.count].mean())
+            if ratio > best_ratio:
+                best, best_ratio = i, ratio
+        return best if best_ratio >= TOMBSTONE_COMPACT_RATIO else None
+
+    @staticmethod
+    def _live_columns(seg: Segment, dead: np.ndarray):
+        """(chunk, khối vector, nguồn, metadata) của các dòng chưa bị xoá, đọc dần từ mmap."""
+        if not dead.any():
+            return seg.iter_chunks(), [seg.vectors], seg.iter_sources(), seg.iter_metadata()
+        keep = np.flatnonzero(~dead)
+        step = 65536
+        return (
+            (seg.chunk(int(row)) for row in keep),
+            (seg.vectors[keep[s:s + step]] for s in range(0, keep.size, step)),
+            (seg.source(int(row)) for row in keep),
+            (seg.meta(int(row)) for row in keep),
+        )
+
+    def compact(self, full: bool = False):
+        """
+        Gộp các segment nhỏ thành một segment (chạy nền, không chặn search / add).
+        Dòng thuộc nguồn đã xoá (tombstone) bị loại khi ghi segment mới.
+        """
+        with self._lock:
+            segments = self.segments
+            if self._compacting or not segments:
+                return
+            if full:
+                start, end = 0, len(segments)
+            elif len(segments) > COMPACTION_MAX_SEGMENTS:
+                start, end = self._pick_compaction(segments), len(segments)
+            else:
+                reclaim = self._pick_reclaim()
+                if reclaim is None:
+                    return
+                start, end = reclaim, reclaim + 1
+            candidates = segments[start:end]
+            tombstones = copy.deepcopy(self._manifest["tombstones"])
+            drops = [seg.rows_of(tombstones.get(seg.name, [])) for seg in candidates]
+            dropped = sum(int(mask.sum()) for mask in drops)
+            if len(candidates) < 2 and not dropped:
+                return
+            self._compacting = True
+            manifest = copy.deepcopy(self._manifest)
+            name = segment_name(manifest)
+            self._manifest["next_segment"] = manifest["next_segment"]
+        seg_path = os.path.join(self.db_path, name)
         try:
-            with open(self.txt_path, 'w', encoding='utf-8') as f:
-                for i, (chunk, vector) in enumerate(zip(self.data["chunks"], self.data["vectors"])):
-                    f.write(f"# Item {i+1}\n")
-                    f.write("CHUNK:\n")
-                    f.write(chunk.replace('\r', '') + "\n")
-                    f.write("VECTOR:\n")
-                    f.write(",".join(str(v) for v in vector) + "\n\n")
-        except Exception:
-            # Không để việc ghi .txt làm hỏng quá trình lưu DB nhị phân
-            pass
+            live = sum(seg.count for seg in candidates) - dropped
+            if live:
+                columns = [self._live_columns(seg, mask) for seg, mask in zip(candidates, drops)]
+                write_segment(
+                    seg_path,
+                    chain.from_iterable(c[0] for c in columns),
+                    chain.from_iterable(c[1] for c in columns),
+                    dim=manifest["dim"],
+                    model=manifest["model"],
+                    sources=chain.from_iterable(c[2] for c in columns),
+                    metadata=chain.from_iterable(c[3] for c in columns),
+                )
+            with self._lock:
+                current = self.segments
+                # DB bị reset / thay đổi trong lúc gộp: bỏ kết quả
+                if current[start:start + len(candidates)] != candidates:
+                    shutil.rmtree(seg_path, ignore_errors=True)
+                    return
+                new_segments = [Segment(seg_path)] if live else []
+                merged = current[:start] + new_segments + current[start + len(candidates):]
+                manifest = copy.deepcopy(self._manifest)
+                manifest["segments"] = [seg.name for seg in merged]
+                # Nguồn bị xoá trong lúc đang gộp: chuyển tombstone sang segment mới
+                late = set()
+                for seg in candidates:
+                    names = manifest["tombstones"].pop(seg.name, [])
+                    late.update(source for source in names if source not in tombstones.get(seg.name, []))
+                if late and live:
+                    manifest["tombstones"][name] = sorted(late)
+                new_index = self._view[4]
+                if dropped:
+                    # Id của các chunk phía sau bị dịch: dựng chỉ mục mới trước khi đổi view
+                    self._id_epoch += 1
+                    if new_index is not None:
+                        new_index = create_index(self.index_backend, manifest["dim"])
+                        new_index.build(self._concat_vectors(merged))
+                write_manifest(self.db_path, manifest)
+                self._manifest = manifest
+                # Không có dòng bị loại thì thứ tự chunk không đổi nên id trong chỉ mục vẫn đúng
+                self._view = self._make_view(merged, manifest["tombstones"], new_index if merged else None)
+                self.save_index()
+            # Segment cũ có thể còn được search đang chạy dùng tới: để GC đóng mmap,
+            # thư mục không xoá được (Windows) sẽ được dọn ở lần load sau
+            for seg in candidates:
+                shutil.rmtree(seg.path, ignore_errors=True)
+            self._sync_derived()
+            print(f"[INFO] Compaction: gộp {len(candidates)} segment thành {name}, loại {dropped} chunk đã xoá")
+        finally:
+            self._compacting = False
+
+    def export_txt(self, path: str | None = None) -> str:
+        """Xuất toàn bộ chunk + vector ra file .txt để kiểm tra (chỉ chạy khi được gọi)."""
+        path = path or self.txt_path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            for i, (seg, row) in enumerate(self._iter_live(), start=1):
+                f.write(f"# Item {i}\n")
+                source, meta = seg.source(row), seg.meta(row)
+                if source:
+                    f.write(f"SOURCE: {source}\n")
+                if meta:
+                    f.write(f"METADATA: {json.dumps(meta, ensure_ascii=False)}\n")
+                f.write("CHUNK:\n")
+                f.write(seg.chunk(row).replace('\r', '') + "\n")
+                f.write("VECTOR:\n")
+                f.write(",".join(str(v) for v in seg.vectors[row].tolist()) + "\n\n")
+        return path
+
+    def close(self):
+        """Lưu chỉ mục trước khi tắt service."""
+        with self._lock:
+            self.save_index()
 
     def reset(self):
         """Xóa toàn bộ DB (dùng khi muốn nạp lại từ đầu)."""
-        self.data = {"chunks": [], "vectors": []}
-        # Xóa file trên đĩa nếu có
-        for path in [self.db_path, self.txt_path]:
+        with self._lock:
+            self._view = self._make_view([])
+            self._id_epoch += 1
+            self.version += 1
+            self._manifest = new_manifest(model=EMBEDDING_MODEL_NAME)
+            self._chunk_set = None
+            self._pending_chunks = []
+            self._pending_vectors = []
+            self._pending_sources = []
+            self._pending_metadata = []
+            self._staged = None
+            # Xóa file trên đĩa nếu có
             try:
-                if os.path.exists(path):
-                    os.remove(path)
+                if os.path.exists(self.db_path):
+                    shutil.rmtree(self.db_path)
             except Exception:
                 pass
+            for path in [self.legacy_path, self.txt_path]:
+                try:
+                    if os.path.exists(path):
+                        os.remove(path)
+                except Exception:
+                    pass
+
+    @staticmethod
+    def _chunk_key(chunk: str, source: str | None = None) -> int:
+        # Hash 64 bit thay cho chuỗi gốc: tập dedup không lớn theo độ dài văn bản.
+        # Khoá gồm cả nguồn để xoá một nguồn không làm mất chunk trùng nội dung của nguồn khác
+        data = f"{source or ''}\0{chunk}".encode("utf-8")
+        return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+    def _iter_keys(self):
+        for seg, row in self._iter_live():
+            yield self._chunk_key(seg.chunk(row), seg.source(row))
 
-    def add_documents(self, chunks: list[str], vectors: list[list[float]]):
-        """Lưu thêm văn bản và vector tương ứng vào DB."""
-        # Đảm bảo khoá tồn tại
-        if "chunks" not in self.data or not isinstance(self.data.get("chunks"), list):
-            self.data["chunks"] = []
-        if "vectors" not in self.data or not isinstance(self.data.get("vectors"), list):
-            self.data["vectors"] = []
-        # Dedup theo nội dung chunk để tránh lặp khi ingest trùng file
-        existing = set(self.data["chunks"])
-        for chunk, vec in zip(chunks or [], vectors or []):
-            if chunk in existing:
+    def add_documents(
+        self,
+        chunks: list[str],
+        vectors,
+        flush: bool = True,
+        source: str | None = None,
+        metadata: dict | list[dict | None] | None = None,
+    ):
+        """
+        Lưu thêm văn bản và vector tương ứng vào DB.
+        `vectors` có thể là list các list float hoặc ma trận numpy (n, dim).
+        `source`: nguồn của các chunk (vd. đường dẫn file), dùng để xoá / thay theo nguồn.
+        `metadata`: một dict dùng chung cho mọi chunk, hoặc list dict theo từng chunk.
+        flush=False: chỉ giữ trong bộ nhớ tới khi đủ INGEST_FLUSH_ROWS chunk hoặc khi gọi save_db()
+        (dùng khi ingest theo batch để không tạo một segment cho mỗi batch nhỏ).
+        Trả về số chunk thực sự được thêm (sau dedup).
+        """
+        if not chunks or vectors is None or len(vectors) == 0:
+            return 0
+        with self._lock:
+            if self._chunk_set is None:
+                self._chunk_set = set(self._iter_keys())
+            # Dedup theo (nguồn, nội dung chunk) để tránh lặp khi ingest trùng file
+            keep_chunks, keep_rows = [], []
+            for i, chunk in enumerate(chunks):
+                if i >= len(vectors):
+                    continue
+                key = self._chunk_key(chunk, source)
+                if key in self._chunk_set:
+                    continue
+                keep_chunks.append(chunk)
+                keep_rows.append(i)
+                self._chunk_set.add(key)
+
+            if keep_chunks:
+                self._pending_chunks.extend(keep_chunks)
+                self._pending_sources.extend([source] * len(keep_chunks))
+                if isinstance(metadata, list):
+                    self._pending_metadata.extend(metadata[i] if i < len(metadata) else None for i in keep_rows)
+                else:
+                    self._pending_metadata.extend([metadata] * len(keep_chunks))
+                self._pending_vectors.append(normalize_rows(np.asarray(vectors, dtype=np.float32)[keep_rows]))
+            if flush or len(self._pending_chunks) >= INGEST_FLUSH_ROWS:
+                self.save_db()
+            return len(keep_chunks)
+
+    def _tombstones_for(self, source: str, forget: bool = True) -> tuple[dict[str, list[str]], int]:
+        """
+        Tombstone cần ghi để xoá `source` khỏi các segment hiện tại, và số chunk bị xoá.
+        forget=True: bỏ luôn hash của các chunk đó khỏi tập dedup.
+        """
+        segments, starts, dead = self._view[:3]
+        tombstones, removed = {}, 0
+        for seg, start in zip(segments, starts[:-1]):
+            mask = seg.rows_of([source])
+            if dead is not None:
+                mask &= ~dead[start:start + seg.count]
+            if not mask.any():
                 continue
-            self.data["chunks"].append(chunk)
-            self.data["vectors"].append(vec)
-            existing.add(chunk)
-        self.save_db()
+            tombstones[seg.name] = [source]
+            removed += int(mask.sum())
+            if forget and self._chunk_set is not None:
+                for row in np.flatnonzero(mask):
+                    self._chunk_set.discard(self._chunk_key(seg.chunk(int(row)), source))
+        return tombstones, removed
 
-    def search(self, query_vector: list[float], top_k: int = 3):
-        """Tìm top_k đoạn văn bản giống nhất với query_vector."""
-        if not self.data["vectors"]:
-            return []
+    def delete_source(self, source: str) -> int:
+        """
+        Xoá mọi chunk thuộc nguồn `source` bằng tombstone (không ghi lại segment);
+        compaction sẽ dọn dữ liệu sau. Trả về số chunk đã xoá.
+        """
+        with self._lock:
+            # Chunk đang chờ ghi cũng có thể thuộc nguồn này
+            self.save_db()
+            tombstones, removed = self._tombstones_for(source)
+            if tombstones:
+                self.save_db(tombstones=tombstones)
+            return removed
+
+    def upsert_source(
+        self,
+        source: str,
+        chunks: list[str],
+        vectors,
+        metadata: dict | list[dict | None] | None = None,
+    ) -> dict:
+        """
+        Thay toàn bộ chunk của `source` bằng `chunks`: tombstone cho dữ liệu cũ và segment mới
+        được commit trong cùng một lần ghi manifest.
+        """
+        return self.replace_source(source, [(chunks, vectors, metadata)])
+
+    def replace_source(self, source: str, batches) -> dict:
+        """
+        Thay toàn bộ chunk của `source` bằng các batch (chunks, vectors, metadata) đọc dần từ `batches`.
+        Segment mới được ghi xuống đĩa khi đủ INGEST_FLUSH_ROWS nhưng chỉ được công bố cùng tombstone của
+        dữ liệu cũ ở cuối: search luôn thấy trọn bản cũ hoặc trọn bản mới, lỗi giữa chừng thì giữ bản cũ.
+        """
+        with self._lock:
+            self.save_db()
+            # Quên hash của bản cũ để các chunk không đổi vẫn được thêm vào bản mới
+            self._tombstones_for(source)
+            self._staged = []
+        added = 0
+        try:
+            for chunks, vectors, metadata in batches:
+                added += self.add_documents(chunks, vectors, flush=False, source=source, metadata=metadata)
+            with self._lock:
+                staged, self._staged = self._staged, None
+                # Tính lại khi công bố: compaction chạy trong lúc thay có thể đã đổi tên segment
+                tombstones, removed = self._tombstones_for(source, forget=False)
+                self.save_db(tombstones=tombstones, staged=staged)
+        except BaseException:
+            with self._lock:
+                for seg in self._staged or []:
+                    shutil.rmtree(seg.path, ignore_errors=True)
+                self._staged = None
+                self._pending_chunks = []
+                self._pending_vectors = []
+                self._pending_sources = []
+                self._pending_metadata = []
+                # Tập dedup đã quên bản cũ và nhớ phần chưa công bố: dựng lại khi cần
+                self._chunk_set = None
+            raise
+        return {"removed": removed, "added": added}
+
+    def _score_buffer(self, n: int, m: int | None = None) -> np.ndarray:
+        """Bộ đệm điểm số (n,) hoặc (n, m) của thread hiện tại, chỉ cấp phát lại khi DB lớn lên."""
+        size = n * (m or 1)
+        buf = getattr(self._scratch, "scores", None)
+        if buf is None or buf.shape[0] < size:
+            buf = np.empty(max(size, 1024), dtype=np.float32)
+            self._scratch.scores = buf
+        return buf[:size] if m is None else buf[:size].reshape(n, m)
 
-        # Chuyển list về numpy array để tính toán nhanh
-        db_vectors = np.array(self.data["vectors"])
-        query_vector = np.array(query_vector)
-
-        # Tính Cosine Similarity: (A . B) / (|A| * |B|)
-        # Vì model sentence-transformers thường đã chuẩn hóa vector (norm=1),
-        # nên chỉ cần tính dot product.
-        scores = np.dot(db_vectors, query_vector)
-        
-        # Lấy index của top_k điểm cao nhất
-        top_indices = np.argsort(scores)[::-1][:top_k]
-        
+    @staticmethod
+    def _top_indices(scores: np.ndarray, k: int) -> np.ndarray:
+        """Chỉ chọn phần top_k (argpartition O(n)) rồi sắp xếp k phần tử đó."""
+        n = scores.shape[0]
+        k = min(k, n)
+        if k < n:
+            top_indices = np.argpartition(scores, n - k)[n - k:]
+        else:
+            top_indices = np.arange(n)
+        return top_indices[np.argsort(scores[top_indices])[::-1]]
+
+    def _results(self, view, ids, scores, k: int | None = None) -> list[dict]:
+        n, dead = int(view[1][-1]), view[2]
         results = []
-        for idx in top_indices:
+        for idx, score in zip(ids, scores):
+            # Bỏ qua id không hợp lệ / chưa có trong view hiện tại (index vừa được thêm trước view)
+            # và các dòng đã bị xoá (tombstone)
+            if idx < 0 or idx >= n or (dead is not None and dead[idx]):
+                continue
+            seg, row = self._row_in(view, int(idx))
+            meta = seg.meta(row)
+            # Vector đã lưu (bản sao, chỉ đọc) để bước sau (chọn context) không phải encode lại chunk
+            vector = np.array(seg.vectors[row])
+            vector.setflags(write=False)
             results.append({
-                "chunk": self.data["chunks"][idx],
-                "score": float(scores[idx])
+                "chunk": seg.chunk(row),
+                "score": float(score),
+                "source": seg.source(row),
+                "metadata": dict(meta) if meta is not None else None,
+                "vector": vector,
             })
-            
-        return results
\ No newline at end of file
+            if k is not None and len(results) >= k:
+                break
+        return results
+
+    def _scan(self, seg: Segment, queries: np.ndarray, out: np.ndarray):
+        """
+        Điểm của mọi dòng trong `seg` với `queries` ((dim,) hoặc (dim, m)), ghi vào `out`.
+        Với float16 / int8, từng khối nhỏ được đổi sang float32 trong bộ đệm dùng lại rồi nhân bằng BLAS;
+        int8 gộp scale vào câu hỏi: sum_d q[d] * scale[d] * code[d].
+        """
+        if not self._quantized_scan:
+            np.dot(seg.vectors, queries, out=out)
+            return
+        codes, scale = seg.quantized(self.vector_dtype)
+        if scale is not None:
+            queries = queries * (scale if queries.ndim == 1 else scale[:, None])
+        block = getattr(self._scratch, "block", None)
+        if block is None or block.shape[1] != seg.dim:
+            block = np.empty((_SCAN_BLOCK_ROWS, seg.dim), dtype=np.float32)
+            self._scratch.block = block
+        for start in range(0, seg.count, _SCAN_BLOCK_ROWS):
+            end = min(start + _SCAN_BLOCK_ROWS, seg.count)
+            rows = block[:end - start]
+            np.copyto(rows, codes[start:end], casting="unsafe")
+            np.dot(rows, queries, out=out[start:end])
+
+    @staticmethod
+    def _rescore(view, query: np.ndarray, ids: np.ndarray, top_k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Chấm lại các ứng viên `ids` bằng vector float32 gốc, trả về top_k (id, điểm) giảm dần."""
+        segments, starts = view[:2]
+        seg_of = np.searchsorted(starts, ids, side="right") - 1
+        exact = np.empty(ids.size, dtype=np.float32)
+        for s in np.unique(seg_of):
+            mask = seg_of == s
+            exact[mask] = segments[s].vectors[ids[mask] - starts[s]] @ query
+        # Ứng viên có thể là dòng đã xoá khi DB còn ít dòng sống hơn số ứng viên
+        dead = view[2]
+        if dead is not None:
+            exact[dead[ids]] = -np.inf
+        order = np.argsort(exact)[::-1][:top_k]
+        return ids[order], exact[order]
+
+    @staticmethod
+    def _index_search(view, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Tìm trên snapshot `view`: chỉ mục phủ các dòng [0, ntotal), các dòng thêm sau đó quét chính xác.
+        Trả về (scores, ids) shape (m, số ứng viên), mỗi hàng giảm dần. Chỉ mục chỉ được hỏi k ứng viên;
+        khi dòng đã xoá làm một truy vấn còn ít hơn k dòng sống thì hỏi lại với số ứng viên gấp đôi.
+        """
+        segments, starts, dead, _, index = view
+        n = int(starts[-1])
+        m = queries.shape[0]
+        covered = min(index.ntotal, n)
+        if covered:
+            fetch = min(k, covered)
+            while True:
+                scores, ids = index.search(queries, fetch)
+                if dead is None or fetch >= covered:
+                    break
+                live = (ids >= 0) & (ids < n)
+                live[live] = ~dead[ids[live]]
+                if (live.sum(axis=1) >= k).all():
+                    break
+                fetch = min(2 * fetch, covered)
+        else:
+            scores, ids = np.empty((m, 0), dtype=np.float32), np.empty((m, 0), dtype=np.int64)
+        if covered == n:
+            return scores, ids
+
+        delta = np.empty((n - covered, m), dtype=np.float32)
+        for seg, start in zip(segments, starts[:-1]):
+            end = int(start) + seg.count
+            if end <= covered:
+                continue
+            offset = max(covered - int(start), 0)
+            np.dot(seg.vectors[offset:], queries.T, out=delta[int(start) + offset - covered:end - covered])
+        if dead is not None:
+            delta[dead[covered:]] = -np.inf
+        kd = min(k, n - covered)
+        top = np.argpartition(-delta, kd - 1, axis=0)[:kd]
+        scores = np.concatenate([scores, np.take_along_axis(delta, top, axis=0).T], axis=1)
+        ids = np.concatenate([ids, top.T.astype(np.int64) + covered], axis=1)
+        order = np.argsort(-scores, axis=1)
+        return np.take_along_axis(scores, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+    def search(self, query_vector, top_k: int = 3):
+        """Tìm top_k đoạn văn bản giống nhất với query_vector."""
+        view = self._view
+        segments, starts, dead = view[:3]
+        n = int(starts[-1])
+        if n == 0 or top_k <= 0:
+            return []
+
+        query = normalize_rows(query_vector)[0]
+        if view[4] is not None:
+            scores, ids = self._index_search(view, query[None, :], top_k)
+            return self._results(view, ids[0], scores[0], top_k)
+
+        # Vector trong DB và query đều đã chuẩn hoá (norm=1),
+        # nên Cosine Similarity chỉ còn là phép nhân ma trận - vector trên từng segment.
+        scores = self._score_buffer(n)
+        for seg, start in zip(segments, starts[:-1]):
+            self._scan(seg, query, scores[start:start + seg.count])
+        if dead is not None:
+            scores[dead] = -np.inf
+
+        if self._quantized_scan and self.rescore_candidates > 0:
+            candidates = self._top_indices(scores, max(top_k, self.rescore_candidates))
+            top_indices, top_scores = self._rescore(view, query, candidates, top_k)
+            return self._results(view, top_indices, top_scores)
+        top_indices = self._top_indices(scores, top_k)
+        return self._results(view, top_indices, scores[top_indices])
+
+    def search_many(self, query_vectors, top_ks: list[int]) -> list[list[dict]]:
+        """
+        Tìm kiếm nhiều truy vấn cùng lúc: một phép nhân ma trận - ma trận cho cả batch.
+        `top_ks[i]` là top_k của truy vấn thứ i.
+        """
+        view = self._view
+        segments, starts, dead = view[:3]
+        n = int(starts[-1])
+        m = len(top_ks)
+        if m == 0:
+            return []
+        if n == 0:
+            return [[] for _ in top_ks]
+
+        queries = normalize_rows(query_vectors)
+        max_k = min(max(top_ks), n)
+        if max_k <= 0:
+            return [[] for _ in top_ks]
+        if view[4] is not None:
+            scores, ids = self._index_search(view, queries, max_k)
+            return [self._results(view, ids[i], scores[i], max(k, 0)) if k > 0 else [] for i, k in enumerate(top_ks)]
+
+        # scores[:, i] là điểm của truy vấn i với toàn bộ DB
+        scores = self._score_buffer(n, m)
+        queries_t = queries.T
+        for seg, start in zip(segments, starts[:-1]):
+            self._scan(seg, queries_t, scores[start:start + seg.count])
+        if dead is not None:
+            scores[dead] = -np.inf
+
+        rescore = self._quantized_scan and self.rescore_candidates > 0
+        results = []
+        for i, k in enumerate(top_ks):
+            if k <= 0:
+                results.append([])
+                continue
+            column = scores[:, i]
+            if rescore:
+                candidates = self._top_indices(column, max(k, self.rescore_candidates))
+                top_indices, top_scores = self._rescore(view, queries[i], candidates, k)
+                results.append(self._results(view, top_indices, top_scores))
+                continue
+            top_indices = self._top_indices(column, k)
+            results.append(self._results(view, top_indices, column[top_indices]))
+        return results
+
+    def keyword_search(self, query: str, top_k: int = 3) -> list[dict]:
+        """Tìm top_k chunk theo BM25 (khớp từ khoá chính xác: mã môn, tên riêng...)."""
+        view = self._view
+        ids, scores = self.sparse.search(query, view, top_k)
+        return self._results(view, ids, scores)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Chạy được cả từ thư mục gốc repo lẫn từ rag-service/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
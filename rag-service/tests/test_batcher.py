@@ -0,0 +1,154 @@
+"""MicroBatcher: các /search đồng thời được gom batch mà mỗi nơi gọi vẫn nhận đúng kết quả của mình."""
+import threading
+import time
+import zlib
+
+import numpy as np
+import pytest
+
+from rag.batcher import MicroBatcher
+from rag.vector_store import VectorStore
+
+DIM = 8
+N_CALLERS = 64
+MAX_BATCH = 8
+
+
+def embed(query: str) -> np.ndarray:
+    return np.random.default_rng(zlib.crc32(query.encode("utf-8"))).standard_normal(DIM).astype(np.float32)
+
+
+class FakeEngine:
+    """retrieve / retrieve_many trên VectorStore thật, embedding giả (xác định theo câu hỏi)."""
+
+    def __init__(self, store: VectorStore):
+        self.store = store
+        self.batches: list[int] = []
+        self.error: Exception | None = None
+
+    def retrieve(self, query: str, top_k: int) -> list[dict]:
+        return self.store.search(embed(query), top_k)
+
+    def retrieve_many(self, queries: list[str], top_ks: list[int]) -> list[list[dict]]:
+        self.batches.append(len(queries))
+        # Batch chạy lâu một chút để các request sau kịp dồn lại
+        time.sleep(0.005)
+        if self.error is not None:
+            raise self.error
+        return self.store.search_many(np.stack([embed(q) for q in queries]), top_ks)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    store = VectorStore(db_path=str(tmp_path / "db"))
+    vectors = np.random.default_rng(0).standard_normal((200, DIM)).astype(np.float32)
+    store.add_documents([f"chunk {i}" for i in range(200)], vectors, source="a")
+    return FakeEngine(store)
+
+
+@pytest.fixture
+def batcher(engine):
+    batcher = MicroBatcher(
+        lambda items: engine.retrieve_many([q for q, _ in items], [k for _, k in items]),
+        max_batch=MAX_BATCH,
+        max_wait_ms=5,
+        workers=2,
+    )
+    yield batcher
+    batcher.close()
+
+
+def submit_concurrently(batcher: MicroBatcher, items: list) -> list:
+    """Mỗi phần tử một thread, cùng xuất phát; trả về kết quả hoặc Exception theo đúng vị trí."""
+    out: list = [None] * len(items)
+    barrier = threading.Barrier(len(items))
+
+    def call(i):
+        barrier.wait()
+        try:
+            out[i] = batcher(items[i], timeout=10)
+        except Exception as e:
+            out[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(items))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(15)
+    assert not any(thread.is_alive() for thread in threads)
+    return out
+
+
+def assert_same(results: list[dict], expected: list[dict]):
+    assert [r["chunk"] for r in results] == [r["chunk"] for r in expected]
+    # Nhân ma trận - ma trận (batch) và ma trận - vector có thể lệch vài ulp
+    np.testing.assert_allclose([r["score"] for r in results], [r["score"] for r in expected], atol=1e-6)
+
+
+def test_each_caller_gets_its_own_results(engine, batcher):
+    items = [(f"câu hỏi số {i}", 1 + i % 5) for i in range(N_CALLERS)]
+    out = submit_concurrently(batcher, items)
+    for (query, k), results in zip(items, out):
+        assert_same(results, engine.retrieve(query, k))
+    assert sum(engine.batches) == N_CALLERS
+    # Có gom batch nhưng không batch nào vượt max_batch
+    assert max(engine.batches) > 1
+    assert max(engine.batches) <= MAX_BATCH
+    assert batcher.stats()["items"] == N_CALLERS
+
+
+def test_retrieve_many_error_reaches_every_waiter(engine, batcher):
+    engine.error = RuntimeError("encode lỗi")
+    out = submit_concurrently(batcher, [(f"q{i}", 3) for i in range(N_CALLERS)])
+    assert all(isinstance(e, RuntimeError) and str(e) == "encode lỗi" for e in out)
+    # Batcher vẫn chạy tiếp sau batch lỗi
+    engine.error = None
+    assert_same(batcher(("q0", 3), timeout=10), engine.retrieve("q0", 3))
+
+
+def test_search_endpoint_batches_match_direct_retrieve(tmp_path, monkeypatch):
+    pytest.importorskip("sentence_transformers")
+    import main
+    from rag import rag_engine
+
+    class Embedder:
+        dim = DIM
+        model_name = "fake"
+
+        def count_tokens(self, text):
+            return len(text.split())
+
+        def get_embeddings(self, texts):
+            return np.stack([embed(text) for text in texts])
+
+    monkeypatch.setattr(rag_engine, "EMBED_CACHE_ENABLED", False)
+    store = VectorStore(db_path=str(tmp_path / "db"))
+    vectors = np.random.default_rng(0).standard_normal((200, DIM)).astype(np.float32)
+    store.add_documents([f"chunk {i}" for i in range(200)], vectors, source="a")
+    engine = rag_engine.RagEngine(embedder=Embedder(), vector_store=store)
+    monkeypatch.setattr(main, "rag_engine", engine)
+    batches = []
+    retrieve_many = engine.retrieve_many
+
+    def recording(queries, *args, **kwargs):
+        batches.append(len(queries))
+        time.sleep(0.005)
+        return retrieve_many(queries, *args, **kwargs)
+
+    monkeypatch.setattr(engine, "retrieve_many", recording)
+    batcher = MicroBatcher(main._search_responses, max_batch=MAX_BATCH, max_wait_ms=5, workers=2)
+    try:
+        requests = [main.SearchRequest(query=f"câu hỏi {i}", top_k=1 + i % 4) for i in range(N_CALLERS)]
+        out = submit_concurrently(batcher, requests)
+        for request, response in zip(requests, out):
+            assert_same(response["results"], engine.retrieve(request.query, request.top_k))
+        assert 1 < max(batches) <= MAX_BATCH
+
+        def broken(queries, *args, **kwargs):
+            raise RuntimeError("model lỗi")
+
+        monkeypatch.setattr(engine, "retrieve_many", broken)
+        out = submit_concurrently(batcher, requests[:MAX_BATCH * 2])
+        assert all(isinstance(e, RuntimeError) for e in out)
+    finally:
+        batcher.close()
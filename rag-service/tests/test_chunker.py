@@ -0,0 +1,25 @@
+import math
+
+from rag.chunker import Chunker
+
+
+def fake_tokens(text: str) -> int:
+    """Tokenizer giả: mỗi token tối đa 4 ký tự của một từ."""
+    return sum(math.ceil(len(word) / 4) for word in text.split())
+
+
+def test_long_word_is_cut_by_tokens():
+    word = "x" * 100  # 25 token
+    chunker = Chunker(chunk_size=10, chunk_overlap=2, length_fn=fake_tokens)
+    chunks = chunker.split_text(word)
+    # Mỗi đoạn dùng hết ngân sách token (40 ký tự = 10 token) thay vì bị cắt mỗi 10 ký tự
+    assert chunks == ["x" * 40, "x" * 40, "x" * 20]
+    chunks = chunker.split_text(f"mở đầu câu {word} và phần kết thúc")
+    assert all(fake_tokens(c) <= 10 for c in chunks)
+    assert "x" * 40 in chunks
+
+
+def test_long_word_is_cut_by_chars():
+    word = "y" * 25
+    chunks = Chunker(chunk_size=10, chunk_overlap=2).split_text(word)
+    assert chunks == ["y" * 10, "y" * 10, "y" * 5]
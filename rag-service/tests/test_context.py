@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from rag.context import estimate_tokens, select_context, truncate_tokens
+from rag.vector_store import VectorStore
+
+QUERY = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+# Ứng viên 0 liên quan nhất, 1 gần trùng với 0, 2 khác hướng
+VECTORS = np.array([[1.0, 0.1, 0.0], [1.0, 0.12, 0.0], [0.6, 0.0, 0.8]], dtype=np.float32)
+
+
+def select(tokens, budget):
+    return select_context(QUERY, VECTORS, tokens, budget, dedup_threshold=0.95, mmr_lambda=0.7)
+
+
+def test_drops_near_duplicates_and_fills_budget():
+    assert select([10, 10, 10], budget=100) == ([0, 2], 1)
+    assert select([10, 10, 10], budget=15) == ([0], 1)
+
+
+def test_best_chunk_kept_when_larger_than_budget():
+    # Trước đây: ngân sách nhỏ hơn chunk tốt nhất thì context rỗng (hoặc chỉ còn chunk kém liên quan hơn)
+    assert select([50, 10, 3], budget=5) == ([0], 1)
+    assert select([50, 10, 3], budget=0) == ([], 1)
+
+
+def test_truncate_tokens_fits_budget():
+    text = "học phí ngành khoa học máy tính " * 20
+    for budget in (1, 5, 17):
+        assert estimate_tokens(truncate_tokens(text, budget)) <= budget
+        assert text.startswith(truncate_tokens(text, budget))
+    assert truncate_tokens(text, 0) == ""
+
+
+def test_search_results_carry_stored_vectors(tmp_path):
+    store = VectorStore(db_path=str(tmp_path / "db"))
+    vectors = np.random.default_rng(0).standard_normal((5, 8)).astype(np.float32)
+    store.add_documents([f"c{i}" for i in range(5)], vectors, source="a")
+    for r in store.search(vectors[2], top_k=3):
+        row = int(r["chunk"][1:])
+        np.testing.assert_allclose(r["vector"], vectors[row] / np.linalg.norm(vectors[row]), rtol=1e-6)
+        assert not r["vector"].flags.writeable
+
+
+class FakeEmbedder:
+    dim = 8
+    model_name = "fake"
+
+    def __init__(self):
+        self.encoded: list[str] = []
+
+    def count_tokens(self, text):
+        return len(text.split())
+
+    def get_embeddings(self, texts):
+        self.encoded.extend(texts)
+        return np.ones((len(texts), self.dim), dtype=np.float32)
+
+
+def test_build_context_uses_stored_vectors(tmp_path, monkeypatch):
+    pytest.importorskip("sentence_transformers")
+    from rag import rag_engine
+
+    monkeypatch.setattr(rag_engine, "EMBED_CACHE_ENABLED", False)
+    embedder = FakeEmbedder()
+    store = VectorStore(db_path=str(tmp_path / "db"))
+    engine = rag_engine.RagEngine(embedder=embedder, vector_store=store)
+    chunks = ["a" * 400, "b" * 40, "c" * 40]
+    store.add_documents(chunks, np.eye(3, 8, dtype=np.float32) + 0.01, source="s")
+    results = store.search(np.ones(8, dtype=np.float32), top_k=3)
+
+    selected, stats = engine.build_context("câu hỏi", results, budget=5)
+    # Chỉ câu hỏi được encode, không encode lại chunk
+    assert embedder.encoded == ["câu hỏi"]
+    assert stats["selected"] == 1 and stats["tokens_used"] <= 5
+    assert selected[0]["chunk"] == truncate_tokens(results[0]["chunk"], 5)
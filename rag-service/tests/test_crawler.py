@@ -0,0 +1,196 @@
+"""Crawl site mẫu tests/fixtures/site qua http.server chạy trong thread."""
+import asyncio
+import functools
+import json
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import crawler
+from crawler import Crawler, HostLimiter
+
+SITE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "site")
+# Trang đủ dài để được lưu; news.html quá ngắn, brochure.pdf và link ngoài bị bỏ qua
+SAVED = {"/", "/about.html", "/admissions.html", "/programs/cs.html", "/programs/economics.html"}
+VISITED = SAVED | {"/news.html"}
+
+
+class RecordingHandler(SimpleHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get("If-Modified-Since") is not None))
+        super().do_GET()
+
+    def send_response(self, code, message=None):
+        self.server.statuses.append((self.path, code))
+        super().send_response(code, message)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def site(tmp_path):
+    # Phục vụ một bản sao để test có thể sửa / xoá trang giữa hai lần crawl
+    directory = str(tmp_path / "site")
+    shutil.copytree(SITE_DIR, directory)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(RecordingHandler, directory=directory))
+    server.requests, server.statuses, server.directory = [], [], directory
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return {
+        "pages_dir": str(tmp_path / "pages"),
+        "state_file": str(tmp_path / "state.json"),
+        "output_file": str(tmp_path / "data1.txt"),
+    }
+
+
+def make_crawler(base: str, paths: dict, rps: float = 0, **kwargs) -> Crawler:
+    return Crawler([base], concurrency=4, limiter=HostLimiter(4, rps), **paths, **kwargs)
+
+
+def page_sources(pages_dir: str) -> dict[str, str]:
+    """URL (dòng SOURCE:) -> nội dung của từng file trang."""
+    pages = {}
+    for name in os.listdir(pages_dir):
+        with open(os.path.join(pages_dir, name), encoding="utf-8") as f:
+            text = f.read()
+        assert name.endswith(".txt") and text.startswith("SOURCE: ") and text.rstrip().endswith("=" * 20)
+        pages[text.splitlines()[0][len("SOURCE: "):]] = text
+    return pages
+
+
+def test_crawl_dedups_and_writes_one_file_per_page(site, paths):
+    server, base = site
+    stats = asyncio.run(make_crawler(base, paths).run())
+
+    # Mỗi URL chỉ được tải một lần dù có nhiều link (kể cả #fragment, ./, ../) trỏ tới
+    counts = Counter(path for path, _ in server.requests)
+    assert set(counts) == VISITED
+    assert all(count == 1 for count in counts.values())
+    assert stats["fetched"] == len(VISITED) and stats["saved"] == len(SAVED)
+
+    pages = page_sources(paths["pages_dir"])
+    assert set(pages) == {base.rstrip("/") + path for path in SAVED}
+    assert "CS101 Nhập môn lập trình" in pages[base + "programs/cs.html"]
+    with open(paths["output_file"], encoding="utf-8") as f:
+        merged = f.read()
+    assert merged.count("SOURCE: ") == len(SAVED)
+    assert all(text in merged for text in pages.values())
+
+
+def test_crawl_resumes_from_checkpoint(site, paths, monkeypatch):
+    server, base = site
+    monkeypatch.setattr(crawler, "CHECKPOINT_EVERY", 1)
+    first = make_crawler(base, paths, rps=20)
+
+    async def interrupted():
+        task = asyncio.create_task(first.run())
+        while first.stats["saved"] < 2:
+            await asyncio.sleep(0.005)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(interrupted())
+    assert first.stats["saved"] < len(SAVED)
+    done_before = {url for url, entry in first.pages.items() if entry.get("file")}
+    requested_before = len(server.requests)
+
+    second = make_crawler(base, paths)
+    # Checkpoint chưa xong: tiếp tục frontier đã lưu thay vì bắt đầu lại từ base
+    assert len(second.frontier) > 0 and second.stats["saved"] == first.stats["saved"]
+    stats = asyncio.run(second.run())
+    assert stats["saved"] == len(SAVED)
+    assert set(page_sources(paths["pages_dir"])) == {base.rstrip("/") + path for path in SAVED}
+    # Trang đã lưu trước khi bị ngắt không bị tải lại
+    resumed = {path for path, _ in server.requests[requested_before:]}
+    assert not resumed & {url[len(base) - 1:] for url in done_before}
+
+
+def test_recrawl_gets_304_for_unchanged_pages(site, paths):
+    server, base = site
+    asyncio.run(make_crawler(base, paths).run())
+    mtimes = {name: os.stat(os.path.join(paths["pages_dir"], name)).st_mtime_ns for name in os.listdir(paths["pages_dir"])}
+    server.requests.clear()
+    server.statuses.clear()
+
+    stats = asyncio.run(make_crawler(base, paths).run())
+    # Lần crawl sau gửi If-Modified-Since, http.server trả 304 cho mọi trang chưa sửa
+    assert {path for path, conditional in server.requests if conditional} == VISITED
+    assert all(code == 304 for _, code in server.statuses)
+    assert stats["not_modified"] == len(VISITED) and stats["fetched"] == 0
+    assert stats["saved"] == len(SAVED)
+    # File trang không bị ghi lại; file gộp được dựng lại từ các file đã lưu
+    assert {name: os.stat(os.path.join(paths["pages_dir"], name)).st_mtime_ns for name in mtimes} == mtimes
+    with open(paths["output_file"], encoding="utf-8") as f:
+        assert f.read().count("SOURCE: ") == len(SAVED)
+
+
+def test_recrawl_removes_pages_that_shrink_or_disappear(site, paths):
+    server, base = site
+    asyncio.run(make_crawler(base, paths).run())
+    assert set(page_sources(paths["pages_dir"])) == {base.rstrip("/") + path for path in SAVED}
+
+    # about.html còn quá ít nội dung (mtime mới hơn để http.server trả 200), economics.html bị gỡ (404)
+    about = os.path.join(server.directory, "about.html")
+    with open(about, "w", encoding="utf-8") as f:
+        f.write('<html><body><a href="/">Trang chủ</a><p>Trang đang được cập nhật nội dung.</p></body></html>')
+    later = time.time() + 10
+    os.utime(about, (later, later))
+    os.remove(os.path.join(server.directory, "programs", "economics.html"))
+
+    second = make_crawler(base, paths)
+    stats = asyncio.run(second.run())
+    remaining = SAVED - {"/about.html", "/programs/economics.html"}
+    assert stats["saved"] == len(remaining)
+    # File cũ của hai trang bị xoá nên /ingest-dir không nạp lại nội dung lỗi thời
+    assert set(page_sources(paths["pages_dir"])) == {base.rstrip("/") + path for path in remaining}
+    assert "file" not in second.pages[base + "about.html"]
+    assert base + "programs/economics.html" not in second.pages
+    with open(paths["state_file"], encoding="utf-8") as f:
+        assert base + "programs/economics.html" not in json.load(f)["pages"]
+
+
+@pytest.mark.parametrize("failing", ["extract", "write"])
+def test_page_error_does_not_abort_crawl(site, paths, monkeypatch, failing):
+    server, base = site
+    bad = base + "admissions.html"
+    if failing == "extract":
+        extract = crawler.extract
+
+        def broken(html, url, allowed_hosts):
+            if url == bad:
+                raise ValueError("HTML hỏng")
+            return extract(html, url, allowed_hosts)
+
+        monkeypatch.setattr(crawler, "extract", broken)
+    else:
+        write_page = Crawler._write_page
+
+        def broken(self, url, body_text):
+            if url == bad:
+                raise OSError("đĩa đầy")
+            return write_page(self, url, body_text)
+
+        monkeypatch.setattr(Crawler, "_write_page", broken)
+
+    c = make_crawler(base, paths)
+    stats = asyncio.run(c.run())
+    # Chỉ trang lỗi bị bỏ; các trang khác vẫn được lưu, không URL nào kẹt ở trạng thái "đang tải"
+    assert stats["errors"] == 1
+    assert set(page_sources(paths["pages_dir"])) == {base.rstrip("/") + path for path in SAVED - {"/admissions.html"}}
+    assert not c.in_flight
+    with open(paths["state_file"], encoding="utf-8") as f:
+        assert json.load(f)["done"] is True
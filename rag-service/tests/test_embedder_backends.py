@@ -0,0 +1,59 @@
+"""Embedding của backend ONNX phải gần với torch (chạy sau `python export_model.py`)."""
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("onnxruntime")
+
+from rag.config import EMBEDDING_MODEL_PATH, EMBEDDING_ONNX_FILE, EMBEDDING_ONNX_INT8_FILE  # noqa: E402
+from rag.embedder import Embedder  # noqa: E402
+from rag.storage import normalize_rows  # noqa: E402
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_DIR = EMBEDDING_MODEL_PATH if os.path.isabs(EMBEDDING_MODEL_PATH) else os.path.join(SERVICE_DIR, EMBEDDING_MODEL_PATH)
+
+# backend -> (file graph, cosine tối thiểu, |chênh lệch| tối đa trên vector đã chuẩn hoá)
+TOLERANCES = {
+    "onnx": (EMBEDDING_ONNX_FILE, 0.9999, 1e-3),
+    "onnx-int8": (EMBEDDING_ONNX_INT8_FILE, 0.98, 0.05),
+}
+
+TEXTS = [
+    "Học phí ngành Khoa học máy tính năm 2024 là bao nhiêu?",
+    "Sinh viên được đăng ký tối đa 25 tín chỉ mỗi học kỳ.",
+    "Trường Đại học Việt Nhật, Đại học Quốc gia Hà Nội",
+    "CS101 Introduction to Programming",
+    "Thư viện mở cửa từ 7h30 đến 21h các ngày trong tuần, trừ Chủ nhật.",
+    "a",
+    "Ký túc xá có 500 chỗ ở, ưu tiên sinh viên năm nhất và sinh viên có hoàn cảnh khó khăn. " * 8,
+]
+
+pytestmark = pytest.mark.skipif(not os.path.isdir(MODEL_DIR), reason=f"chưa xuất model vào {MODEL_DIR}")
+
+
+@pytest.fixture(scope="module")
+def reference() -> np.ndarray:
+    embedder = Embedder(num_workers=1, backend="torch", model_path=MODEL_DIR)
+    try:
+        return normalize_rows(embedder.get_embeddings(TEXTS))
+    finally:
+        embedder.close()
+
+
+@pytest.mark.parametrize("backend", sorted(TOLERANCES))
+def test_onnx_embeddings_close_to_torch(reference, backend):
+    file_name, min_cos, max_abs = TOLERANCES[backend]
+    if not os.path.exists(os.path.join(MODEL_DIR, file_name)):
+        pytest.skip(f"không có {file_name} trong {MODEL_DIR}")
+    embedder = Embedder(num_workers=1, backend=backend, model_path=MODEL_DIR)
+    try:
+        vectors = normalize_rows(embedder.get_embeddings(TEXTS))
+    finally:
+        embedder.close()
+    assert vectors.shape == reference.shape
+    cosine = (vectors * reference).sum(axis=1)
+    assert cosine.min() >= min_cos, f"{backend}: cosine thấp nhất {cosine.min():.5f} < {min_cos}"
+    diff = float(np.abs(vectors - reference).max())
+    assert diff <= max_abs, f"{backend}: max |diff| {diff:.2e} > {max_abs}"
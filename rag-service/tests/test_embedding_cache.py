@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+
+from rag.embedding_cache import HEADER_FILE, KEYS_FILE, KEY_SIZE, VECTORS_FILE, ChunkEmbeddingCache
+
+DIM = 8
+MODEL = "test/model"
+
+
+def make_vectors(n: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+
+
+def test_put_many_then_hit_after_reopen(tmp_path):
+    cache = ChunkEmbeddingCache(str(tmp_path), MODEL, DIM)
+    texts = ["chunk a", "chunk b", "chunk c"]
+    vectors = make_vectors(3)
+    # Chunk trùng trong cùng batch chỉ được ghi một lần
+    cache.put_many(texts + ["chunk a"], np.vstack([vectors, vectors[:1]]))
+    assert len(cache) == 3
+
+    reopened = ChunkEmbeddingCache(str(tmp_path), MODEL, DIM)
+    out, missing = reopened.get_many(["chunk c", "chunk new", "chunk a"])
+    assert missing == [1]
+    np.testing.assert_array_equal(out[[0, 2]], vectors[[2, 0]])
+    assert reopened.stats()["hits"] == 2 and reopened.stats()["misses"] == 1
+
+
+def test_reopen_does_not_rewrite_matching_header(tmp_path):
+    cache = ChunkEmbeddingCache(str(tmp_path), MODEL, DIM)
+    header_path = os.path.join(cache.path, HEADER_FILE)
+    os.utime(header_path, ns=(0, 0))
+    ChunkEmbeddingCache(str(tmp_path), MODEL, DIM)
+    assert os.stat(header_path).st_mtime_ns == 0
+
+
+def test_torn_tail_is_truncated_on_reopen(tmp_path):
+    cache = ChunkEmbeddingCache(str(tmp_path), MODEL, DIM)
+    vectors = make_vectors(3)
+    cache.put_many(["a", "b", "c"], vectors)
+    # Crash giữa hai lần ghi: vector của batch sau đã ghi (một phần), key thì chưa
+    with open(os.path.join(cache.path, VECTORS_FILE), "ab") as f:
+        f.write(make_vectors(2, seed=1).tobytes()[:-5])
+    with open(os.path.join(cache.path, KEYS_FILE), "ab") as f:
+        f.write(b"\x01" * (KEY_SIZE // 2))
+
+    reopened = ChunkEmbeddingCache(str(tmp_path), MODEL, DIM)
+    assert len(reopened) == 3
+    assert os.path.getsize(os.path.join(cache.path, KEYS_FILE)) == 3 * KEY_SIZE
+    assert os.path.getsize(os.path.join(cache.path, VECTORS_FILE)) == 3 * DIM * 4
+    out, missing = reopened.get_many(["a", "b", "c"])
+    assert missing == []
+    np.testing.assert_array_equal(out, vectors)
+    # Ghi tiếp sau khi cắt vẫn đúng thứ tự dòng
+    reopened.put_many(["d"], make_vectors(1, seed=2))
+    out, missing = ChunkEmbeddingCache(str(tmp_path), MODEL, DIM).get_many(["d", "a"])
+    assert missing == []
+    np.testing.assert_array_equal(out, np.vstack([make_vectors(1, seed=2), vectors[:1]]))
+
+
+def test_model_or_dim_mismatch_wipes_files(tmp_path):
+    ChunkEmbeddingCache(str(tmp_path), MODEL, DIM).put_many(["a", "b"], make_vectors(2))
+
+    other_dim = ChunkEmbeddingCache(str(tmp_path), MODEL, DIM * 2)
+    assert len(other_dim) == 0
+    assert os.path.getsize(os.path.join(other_dim.path, VECTORS_FILE)) == 0
+    assert os.path.getsize(os.path.join(other_dim.path, KEYS_FILE)) == 0
+    _, missing = other_dim.get_many(["a"])
+    assert missing == [0]
+
+    # Quay lại dim cũ: cache của dim kia không được đọc nhầm
+    assert len(ChunkEmbeddingCache(str(tmp_path), MODEL, DIM)) == 0
+
+
+def test_corrupt_header_starts_over(tmp_path):
+    cache = ChunkEmbeddingCache(str(tmp_path), MODEL, DIM)
+    cache.put_many(["a"], make_vectors(1))
+    # header.json bị cắt cụt (vd. bản cũ ghi không nguyên tử rồi bị kill)
+    with open(os.path.join(cache.path, HEADER_FILE), "w", encoding="utf-8") as f:
+        f.write('{"model": "te')
+
+    reopened = ChunkEmbeddingCache(str(tmp_path), MODEL, DIM)
+    assert len(reopened) == 0
+    reopened.put_many(["a"], make_vectors(1))
+    assert len(ChunkEmbeddingCache(str(tmp_path), MODEL, DIM)) == 1
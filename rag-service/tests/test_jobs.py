@@ -0,0 +1,47 @@
+import threading
+
+import pytest
+
+from rag.jobs import FAILED, SUCCEEDED, JobManager
+
+
+@pytest.fixture
+def jobs():
+    manager = JobManager()
+    yield manager
+    manager.shutdown()
+
+
+def test_run_waits_for_result(jobs):
+    assert jobs.run("ingest", {}, lambda on_progress: {"chunks": 3}) == {"chunks": 3}
+    assert [job.status for job in jobs.list()] == [SUCCEEDED]
+
+
+def test_run_raises_original_error(jobs):
+    def fail(on_progress):
+        raise FileNotFoundError("missing.txt")
+
+    with pytest.raises(FileNotFoundError):
+        jobs.run("ingest", {}, fail)
+    assert jobs.list()[0].status == FAILED
+
+
+def test_sync_and_background_jobs_share_one_writer(jobs):
+    # Job đồng bộ xếp sau job nền đang chạy: không bao giờ có hai job ghi cùng lúc
+    running, peak, lock = [0], [0], threading.Lock()
+    gate = threading.Event()
+
+    def write(on_progress):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        gate.wait(1)
+        with lock:
+            running[0] -= 1
+        return {}
+
+    background = jobs.submit("ingest", {}, write)
+    threading.Timer(0.05, gate.set).start()
+    jobs.run("upsert-source", {}, write)
+    assert background.status == SUCCEEDED
+    assert peak[0] == 1
@@ -0,0 +1,75 @@
+"""Ngân sách thời gian và cache điểm của Reranker, với cross-encoder giả (không tải model)."""
+import time
+
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+from rag import reranker as reranker_module  # noqa: E402
+from rag.reranker import Reranker  # noqa: E402
+
+MS_PER_PAIR = 10
+# Điểm cross-encoder giả theo chunk: thứ tự khác hẳn thứ tự của bước tìm kiếm thứ nhất
+SCORES = {f"c{i}": score for i, score in enumerate([0.1, 0.9, 0.5, 0.3, 0.8, 0.2])}
+
+
+class SlowCrossEncoder:
+    def __init__(self, model_name, device=None):
+        self.calls: list[list[tuple[str, str]]] = []
+
+    def predict(self, pairs, batch_size=32, show_progress_bar=False):
+        self.calls.append(list(pairs))
+        time.sleep(MS_PER_PAIR * len(pairs) / 1000)
+        return [SCORES[chunk] for _, chunk in pairs]
+
+
+@pytest.fixture
+def reranker(monkeypatch):
+    monkeypatch.setattr(reranker_module, "CrossEncoder", SlowCrossEncoder)
+    return Reranker(model_name="stub", budget_ms=0)
+
+
+def candidates(n: int = 6) -> list[dict]:
+    return [{"chunk": f"c{i}", "score": 1.0 - i / 10} for i in range(n)]
+
+
+def test_unscored_candidates_keep_first_stage_order(reranker):
+    # Lần đầu chưa có ước lượng thời gian: chấm hết để đo ms / cặp
+    reranker.rerank("khởi động", candidates(3), budget_ms=1)
+    assert reranker._ms_per_pair >= MS_PER_PAIR
+
+    # Ngân sách đủ cho 3 cặp: chấm 3 ứng viên đầu, 3 ứng viên còn lại giữ thứ tự cũ và xếp sau
+    results = reranker.rerank("học phí", candidates(), budget_ms=3.5 * reranker._ms_per_pair)
+    assert reranker.model.calls[-1] == [("học phí", f"c{i}") for i in range(3)]
+    assert [r["chunk"] for r in results] == ["c1", "c2", "c0", "c3", "c4", "c5"]
+    assert [r["rerank_score"] for r in results[:3]] == pytest.approx([0.9, 0.5, 0.1])
+    assert not any("rerank_score" in r for r in results[3:])
+
+
+def test_scores_are_cached_per_query_and_chunk(reranker):
+    reranker.rerank("khởi động", candidates(3), budget_ms=1)
+    reranker.rerank("Học phí", candidates(), budget_ms=3.5 * reranker._ms_per_pair)
+    calls = len(reranker.model.calls)
+    # Đủ cho đúng 3 cặp theo ước lượng hiện tại (ước lượng đổi sau mỗi lần gọi model)
+    budget = 3.5 * reranker._ms_per_pair
+
+    # Cùng câu hỏi (sau chuẩn hoá): 3 cặp đã có điểm lấy từ cache, ngân sách dành cho 3 cặp còn lại
+    results = reranker.rerank("  học   PHÍ ", candidates(), top_k=4, budget_ms=budget)
+    assert reranker.model.calls[calls:] == [[("học phí", f"c{i}") for i in range(3, 6)]]
+    assert [r["chunk"] for r in results] == ["c1", "c4", "c2", "c3"]
+
+    # Mọi cặp đã có điểm: không gọi model
+    assert [r["chunk"] for r in reranker.rerank("học phí", candidates(), budget_ms=budget)] == [
+        "c1", "c4", "c2", "c3", "c5", "c0"
+    ]
+    assert len(reranker.model.calls) == calls + 1
+    # Câu hỏi khác không dùng điểm của câu hỏi này
+    reranker.rerank("điểm chuẩn", candidates(2), budget_ms=0)
+    assert reranker.model.calls[-1] == [("điểm chuẩn", "c0"), ("điểm chuẩn", "c1")]
+
+
+def test_zero_budget_scores_everything(reranker):
+    reranker.rerank("khởi động", candidates(3))
+    results = reranker.rerank("học phí", candidates())
+    assert all("rerank_score" in r for r in results)
+    assert [r["chunk"] for r in results] == ["c1", "c4", "c2", "c3", "c5", "c0"]
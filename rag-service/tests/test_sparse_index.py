@@ -0,0 +1,83 @@
+import time
+
+import numpy as np
+import pytest
+
+from rag import sparse_index
+from rag import vector_store as vector_store_module
+from rag.vector_store import VectorStore
+
+DOCS = {
+    "a.txt": ["học phí ngành cs101 năm nay", "lịch thi cuối kỳ cs101", "ký túc xá sinh viên"],
+    "b.txt": ["học bổng toàn phần cho sinh viên", "cs101 nhập môn lập trình"],
+    "c.txt": ["thư viện mở cửa từ 7 giờ", "học phí ngành kinh tế"],
+}
+
+
+def vectors(n: int) -> np.ndarray:
+    return np.random.default_rng(n).standard_normal((n, 8)).astype(np.float32)
+
+
+@pytest.fixture
+def make_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store_module, "TOMBSTONE_COMPACT_RATIO", 2.0)
+    counter = iter(range(100))
+
+    def make(sources) -> VectorStore:
+        store = VectorStore(index_backend="exact", db_path=str(tmp_path / f"db{next(counter)}"))
+        for source in sources:
+            store.add_documents(DOCS[source], vectors(len(DOCS[source])), source=source)
+        return store
+
+    return make
+
+
+def wait_for_postings(store: VectorStore, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while any(seg not in store.sparse._segments for seg in store.segments):
+        assert time.monotonic() < deadline, "postings BM25 chưa được dựng nền"
+        time.sleep(0.01)
+
+
+def test_postings_built_in_background_for_dense_mode(make_store, monkeypatch):
+    built = []
+    init = sparse_index.SegmentPostings.__init__
+
+    def counting(self, segment):
+        built.append(segment.name)
+        init(self, segment)
+
+    monkeypatch.setattr(sparse_index.SegmentPostings, "__init__", counting)
+    store = make_store(["a.txt", "b.txt"])
+    assert not store._eager_sparse
+    wait_for_postings(store)
+    before = len(built)
+    store.keyword_search("cs101", top_k=3)
+    assert len(built) == before
+
+
+def test_concurrent_views_share_postings(make_store, monkeypatch):
+    store = make_store(["a.txt", "b.txt"])
+    wait_for_postings(store)
+    old_view = store._view
+    store.add_documents(DOCS["c.txt"], vectors(2), source="c.txt")
+    new_view = store._view
+    wait_for_postings(store)
+    built = []
+    monkeypatch.setattr(sparse_index, "SegmentPostings", lambda seg: built.append(seg) or pytest.fail("rebuilt"))
+    # Xen kẽ view cũ (search đang chạy) và view mới: không view nào làm mất postings của view kia
+    for _ in range(3):
+        store.sparse.search("học phí", old_view, 3)
+        store.sparse.search("học phí", new_view, 3)
+    assert not built
+
+
+def test_idf_ignores_deleted_rows(make_store):
+    store = make_store(["a.txt", "b.txt", "c.txt"])
+    store.delete_source("c.txt")
+    assert store.dead_count == 2
+    expected = make_store(["a.txt", "b.txt"])
+    for query in ["học phí", "cs101", "sinh viên", "thư viện"]:
+        got = [(r["chunk"], pytest.approx(r["score"], rel=1e-5)) for r in store.keyword_search(query, top_k=5)]
+        want = [(r["chunk"], r["score"]) for r in expected.keyword_search(query, top_k=5)]
+        assert got == want
@@ -0,0 +1,167 @@
+"""Trạng thái khởi động: /ready chờ mọi bước, /health chỉ lỗi khi bước bắt buộc thất bại."""
+import threading
+import time
+
+import pytest
+
+from rag.jobs import JobManager
+from rag.startup import DONE, FAILED, RUNNING, SKIPPED, StartupTracker
+
+
+def raises(error: Exception):
+    def fn():
+        raise error
+
+    return fn
+
+
+def test_tracker_ready_and_failed():
+    tracker = StartupTracker(["model", "auto_ingest"], optional=("auto_ingest",))
+    assert not tracker.ready and not tracker.failed
+    assert tracker.run("model", lambda: 42) == 42
+    assert not tracker.ready
+    with pytest.raises(ValueError):
+        tracker.run("auto_ingest", raises(ValueError("thiếu file")))
+    # Bước optional lỗi: vẫn sẵn sàng, không tính là hỏng
+    assert tracker.ready and not tracker.failed
+    stage = tracker.snapshot()["auto_ingest"]
+    assert stage["state"] == FAILED and stage["error"] == "thiếu file"
+
+
+def test_tracker_required_failure():
+    tracker = StartupTracker(["model", "warmup"])
+    tracker.skip("warmup", "tắt")
+    with pytest.raises(RuntimeError):
+        tracker.run("model", raises(RuntimeError("hết RAM")))
+    assert tracker.failed and not tracker.ready
+    assert tracker.snapshot()["warmup"]["state"] == SKIPPED
+
+
+class Gate:
+    """Bước khởi động giả: chờ tới khi test cho phép rồi trả kết quả hoặc ném lỗi."""
+
+    def __init__(self, result=None, error: Exception | None = None):
+        self.result, self.error = result, error
+        self.started, self.release = threading.Event(), threading.Event()
+
+    def __call__(self, *args, **kwargs):
+        self.started.set()
+        assert self.release.wait(10)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class FakeStore:
+    def __init__(self, size: int):
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def reset(self):
+        self.size = 0
+
+    def close(self):
+        pass
+
+
+class FakeEngine:
+    warmup: Gate
+
+    def __init__(self, embedder, vector_store):
+        self.vector_store = vector_store
+
+    def ingest(self, path, on_progress=None):
+        raise OSError(f"không đọc được {path}")
+
+
+def wait_for(predicate, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def app(monkeypatch, tmp_path):
+    """main.app với model / DB / engine giả; trả về (main, các bước chặn được)."""
+    pytest.importorskip("sentence_transformers")
+    import main
+
+    gates = {"model": Gate(result=object()), "index": Gate(result=FakeStore(10)), "warmup": Gate()}
+    monkeypatch.setattr(main, "startup", StartupTracker(
+        ["model", "index", "auto_ingest", "warmup"], optional=("auto_ingest",)
+    ))
+    monkeypatch.setattr(main, "jobs", JobManager())
+    monkeypatch.setattr(main, "rag_engine", None)
+    monkeypatch.setattr(main, "SEARCH_BATCH_ENABLED", False)
+    monkeypatch.setattr(main, "WARMUP_ENABLED", True)
+    monkeypatch.setattr(main, "Embedder", gates["model"])
+    monkeypatch.setattr(main, "VectorStore", gates["index"])
+    monkeypatch.setattr(FakeEngine, "warmup", gates["warmup"], raising=False)
+    monkeypatch.setattr(main, "RagEngine", FakeEngine)
+    data = tmp_path / "data1.txt"
+    data.write_text("nội dung", encoding="utf-8")
+    monkeypatch.setenv("DEFAULT_DATA_PATH", str(data))
+    return main, gates
+
+
+def states(client) -> dict:
+    return {name: stage["state"] for name, stage in client.get("/health").json()["stages"].items()}
+
+
+def test_ready_turns_200_when_stages_finish(app):
+    from fastapi.testclient import TestClient
+
+    main, gates = app
+    with TestClient(main.app) as client:
+        assert gates["model"].started.wait(5)
+        resp = client.get("/ready")
+        assert resp.status_code == 503 and resp.json()["status"] == "starting"
+        assert client.get("/health").status_code == 200
+
+        gates["model"].release.set()
+        gates["index"].release.set()
+        # DB đã có dữ liệu: auto-ingest bỏ qua; warmup còn chạy thì vẫn chưa sẵn sàng
+        assert gates["warmup"].started.wait(5)
+        assert states(client) == {"model": DONE, "index": DONE, "auto_ingest": SKIPPED, "warmup": RUNNING}
+        assert main.rag_engine is not None
+        assert client.get("/ready").status_code == 503
+
+        gates["warmup"].release.set()
+        wait_for(lambda: client.get("/ready").status_code == 200)
+        assert client.get("/ready").json()["status"] == "ready"
+        health = client.get("/health")
+        assert health.status_code == 200 and health.json()["ready"] is True
+
+
+def test_optional_stage_failure_keeps_service_healthy(app):
+    from fastapi.testclient import TestClient
+
+    main, gates = app
+    gates["index"].result = FakeStore(0)
+    for gate in gates.values():
+        gate.release.set()
+    with TestClient(main.app) as client:
+        wait_for(lambda: client.get("/ready").status_code == 200)
+        # DB trống nên auto-ingest chạy và lỗi: bước optional, /health và /ready vẫn 200
+        assert states(client)["auto_ingest"] == FAILED
+        assert client.get("/health").status_code == 200
+
+
+def test_required_stage_failure_fails_health(app):
+    from fastapi.testclient import TestClient
+
+    main, gates = app
+    gates["model"].error = RuntimeError("không tải được model")
+    gates["index"].release.set()
+    with TestClient(main.app) as client:
+        assert client.get("/health").status_code == 200
+        gates["model"].release.set()
+        wait_for(lambda: client.get("/health").status_code == 503)
+        health = client.get("/health").json()
+        assert health["status"] == "failed" and health["stages"]["model"]["error"] == "không tải được model"
+        resp = client.get("/ready")
+        assert resp.status_code == 503 and resp.json()["status"] == "failed"
+        assert main.rag_engine is None
@@ -0,0 +1,273 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from rag import vector_store as vector_store_module
+from rag.index import FlatIndex
+from rag.storage import QUANTIZED_FILES, SCALE_FILE
+from rag.vector_store import VectorStore
+
+DIM = 16
+
+
+def make_vectors(n: int, seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+
+
+def make_clusters(n: int, cluster: int) -> np.ndarray:
+    """Vector quanh trục `cluster`: hàng xóm gần nhất của một dòng nằm cùng nguồn với nó."""
+    vectors = make_vectors(n, cluster) * 0.2
+    vectors[:, cluster] += 4.0
+    return vectors
+
+
+def make_store(tmp_path, **kwargs) -> VectorStore:
+    return VectorStore(db_path=str(tmp_path / "vector_store"), **kwargs)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return make_store(tmp_path)
+
+
+def test_replace_source_publishes_old_or_new_only(store, monkeypatch):
+    # Flush giữa chừng: segment mới được ghi nhưng chưa được công bố
+    monkeypatch.setattr(vector_store_module, "INGEST_FLUSH_ROWS", 4)
+    store.add_documents([f"old {i}" for i in range(6)], make_vectors(6, 0), source="a.txt")
+    seen = []
+
+    def batches():
+        for b in range(3):
+            seen.append(store.sources())
+            yield [f"new {b}-{i}" for i in range(4)], make_vectors(4, b + 1), None
+
+    result = store.replace_source("a.txt", batches())
+    assert seen == [{"a.txt": 6}] * 3
+    assert result == {"removed": 6, "added": 12}
+    assert store.sources() == {"a.txt": 12}
+    assert sorted(store.iter_chunks()) == sorted(f"new {b}-{i}" for b in range(3) for i in range(4))
+
+
+def test_replace_source_error_keeps_old_content(store, monkeypatch):
+    monkeypatch.setattr(vector_store_module, "INGEST_FLUSH_ROWS", 4)
+    store.add_documents([f"old {i}" for i in range(6)], make_vectors(6, 0), source="a.txt")
+    segments = list(store.segments)
+
+    def batches():
+        yield [f"new {i}" for i in range(8)], make_vectors(8, 1), None
+        raise RuntimeError("encode failed")
+
+    with pytest.raises(RuntimeError):
+        store.replace_source("a.txt", batches())
+    assert store.segments == segments
+    assert sorted(store.iter_chunks()) == sorted(f"old {i}" for i in range(6))
+    # Nạp lại sau lỗi: chunk trùng nội dung vẫn được dedup đúng
+    assert store.add_documents(["old 0"], make_vectors(1, 2), source="a.txt") == 0
+
+
+def test_replace_source_keeps_unchanged_chunks(store):
+    vectors = make_vectors(3, 0)
+    store.add_documents(["x", "y", "z"], vectors, source="a.txt")
+    result = store.replace_source("a.txt", [(["x", "y", "w"], make_vectors(3, 1), None)])
+    assert result == {"removed": 3, "added": 3}
+    assert sorted(store.iter_chunks()) == ["w", "x", "y"]
+
+
+@pytest.fixture
+def indexed(tmp_path, monkeypatch):
+    # Compaction chỉ chạy khi test gọi compact(), để kết quả không phụ thuộc thread nền
+    monkeypatch.setattr(vector_store_module, "TOMBSTONE_COMPACT_RATIO", 2.0)
+    monkeypatch.setattr(vector_store_module, "COMPACTION_MAX_SEGMENTS", 1000)
+
+    def make(backend: str) -> VectorStore:
+        store = make_store(tmp_path, index_backend=backend)
+        for s in range(4):
+            store.add_documents(
+                [f"doc{s} chunk {i}" for i in range(50)], make_clusters(50, s), source=f"doc{s}.txt"
+            )
+        store.refresh_index()
+        assert store._view[4].ntotal == len(store)
+        return store
+
+    return make
+
+
+def brute_force(store: VectorStore, query: np.ndarray, k: int) -> list[str]:
+    rows = list(store._iter_live())
+    vectors = np.stack([seg.vectors[row] for seg, row in rows])
+    scores = vectors @ (query / np.linalg.norm(query))
+    return [rows[i][0].chunk(rows[i][1]) for i in np.argsort(-scores)[:k]]
+
+
+def spy_fetches(store: VectorStore) -> list[int]:
+    index, fetches = store._view[4], []
+    search = index.search
+
+    def recording(queries, k):
+        fetches.append(k)
+        return search(queries, k)
+
+    index.search = recording
+    return fetches
+
+
+@pytest.mark.parametrize("backend", ["flat", "hnsw"])
+def test_index_search_skips_deleted_rows(indexed, backend):
+    store = indexed(backend)
+    assert store.delete_source("doc1.txt") == 50
+    assert store.delete_source("doc2.txt") == 50
+    queries = make_vectors(8, 100)
+    for query in queries:
+        results = store.search(query, top_k=5)
+        assert len(results) == 5
+        assert {r["source"] for r in results} <= {"doc0.txt", "doc3.txt"}
+        if backend == "flat":
+            assert [r["chunk"] for r in results] == brute_force(store, query, 5)
+    batch = store.search_many(queries, [5] * len(queries))
+    assert all(len(results) == 5 for results in batch)
+    assert all(r["source"] in {"doc0.txt", "doc3.txt"} for results in batch for r in results)
+
+
+def test_index_search_fetches_k_before_widening(indexed):
+    store = indexed("flat")
+    store.delete_source("doc1.txt")
+    fetches = spy_fetches(store)
+    query = store._view[0][0].vectors[0]
+    # Hàng xóm gần nhất đều còn sống: không lấy dư theo tổng số dòng đã xoá (50)
+    assert len(store.search(query, top_k=3)) == 3
+    assert fetches == [3]
+    # Mọi hàng xóm gần nhất đã bị xoá: lấy rộng dần tới khi đủ k dòng sống
+    fetches.clear()
+    query = store._view[0][1].vectors[0]
+    results = store.search(query, top_k=3)
+    assert len(results) == 3 and all(r["source"] != "doc1.txt" for r in results)
+    assert fetches[0] == 3 and fetches[-1] < len(store)
+    assert fetches == sorted(fetches)
+
+
+@pytest.mark.parametrize("backend", ["flat", "hnsw"])
+def test_index_search_after_upsert(indexed, backend):
+    store = indexed(backend)
+    new_vectors = make_vectors(10, 42)
+    result = store.upsert_source("doc0.txt", [f"doc0 v2 {i}" for i in range(10)], new_vectors)
+    assert result == {"removed": 50, "added": 10}
+    # Dòng mới chưa có trong chỉ mục được quét chính xác
+    assert store._view[4].ntotal < len(store)
+    top = store.search(new_vectors[3], top_k=5)
+    assert top[0]["chunk"] == "doc0 v2 3"
+    assert all(r["chunk"].startswith("doc0 v2") or r["source"] != "doc0.txt" for r in top)
+    if backend == "flat":
+        assert [r["chunk"] for r in top] == brute_force(store, new_vectors[3], 5)
+
+
+@pytest.mark.parametrize("backend", ["flat", "hnsw"])
+def test_index_search_after_compaction(indexed, backend):
+    store = indexed(backend)
+    store.delete_source("doc1.txt")
+    queries = make_vectors(5, 7)
+    before = [[r["chunk"] for r in store.search(q, top_k=5)] for q in queries]
+    store.compact(full=True)
+    assert store.dead_count == 0 and len(store) == 150
+    assert store._view[4].ntotal == len(store)
+    after = [[r["chunk"] for r in store.search(q, top_k=5)] for q in queries]
+    if backend == "flat":
+        assert after == before
+    assert all(len(chunks) == 5 for chunks in after)
+    assert not any(chunk.startswith("doc1 ") for chunks in after for chunk in chunks)
+
+
+@pytest.fixture
+def quantized(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store_module, "TOMBSTONE_COMPACT_RATIO", 2.0)
+    monkeypatch.setattr(vector_store_module, "COMPACTION_MAX_SEGMENTS", 1000)
+
+    def make(dtype: str) -> VectorStore:
+        store = VectorStore(
+            index_backend="exact", vector_dtype=dtype, rescore_candidates=40, db_path=str(tmp_path / dtype)
+        )
+        for s in range(4):
+            store.add_documents([f"doc{s} chunk {i}" for i in range(50)], make_vectors(50, s), source=f"doc{s}.txt")
+        return store
+
+    return make
+
+
+def assert_matches_float32(store: VectorStore, reference: VectorStore, queries: np.ndarray, k: int = 5):
+    for query, results, expected in zip(
+        queries, store.search_many(queries, [k] * len(queries)), reference.search_many(queries, [k] * len(queries))
+    ):
+        assert [r["chunk"] for r in store.search(query, top_k=k)] == [r["chunk"] for r in expected]
+        assert [r["chunk"] for r in results] == [r["chunk"] for r in expected]
+        # Điểm trả về là điểm float32 chấm lại, không phải điểm của bản lượng tử hoá
+        unit = query / np.linalg.norm(query)
+        np.testing.assert_allclose([r["score"] for r in results], [r["vector"] @ unit for r in results], atol=1e-6)
+        np.testing.assert_allclose([r["score"] for r in results], [r["score"] for r in expected], atol=1e-6)
+
+
+def sidecar_names(dtype: str) -> list[str]:
+    return [QUANTIZED_FILES[dtype]] + ([SCALE_FILE] if dtype == "int8" else [])
+
+
+def quantized_files(store: VectorStore, dtype: str) -> list[list[str]]:
+    """File lượng tử hoá đang có trên đĩa của từng segment."""
+    names = sidecar_names(dtype)
+    return [[name for name in names if os.path.exists(os.path.join(seg.path, name))] for seg in store.segments]
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_quantized_scan_rescores_to_float32(quantized, dtype):
+    store, reference = quantized(dtype), quantized("float32")
+    assert quantized_files(store, dtype) == [sidecar_names(dtype)] * 4
+    assert_matches_float32(store, reference, make_vectors(10, 100))
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_quantized_files_rebuilt_after_compaction(quantized, dtype):
+    store, reference = quantized(dtype), quantized("float32")
+    for s in (store, reference):
+        s.delete_source("doc1.txt")
+    old_paths = [seg.path for seg in store.segments]
+    store.compact(full=True)
+    assert len(store.segments) == 1 and store.dead_count == 0
+    assert not any(os.path.exists(path) for path in old_paths)
+    # Segment do compaction ghi ra có bản lượng tử hoá riêng, dựng từ vector của chính nó
+    assert quantized_files(store, dtype) == [sidecar_names(dtype)]
+    assert store.segments[0].quantized(dtype)[0].shape == (150, DIM)
+    assert_matches_float32(store, reference, make_vectors(10, 100))
+
+
+def test_upsert_counts_rows_across_intermediate_flushes(store, monkeypatch):
+    monkeypatch.setattr(vector_store_module, "INGEST_FLUSH_ROWS", 4)
+    store.add_documents(["a", "b"], make_vectors(2, 0), source="a.txt")
+    result = store.upsert_source("a.txt", [f"v2 {i}" for i in range(10)], make_vectors(10, 1))
+    assert result == {"removed": 2, "added": 10}
+    assert store.sources() == {"a.txt": 10}
+
+
+def test_refresh_index_covers_rows_added_while_refreshing(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store_module, "INDEX_DELTA_ROWS", 100)
+    store = make_store(tmp_path, index_backend="flat")
+    started, release = threading.Event(), threading.Event()
+    build = FlatIndex.build
+
+    def slow_build(self, vectors):
+        started.set()
+        release.wait(5)
+        build(self, vectors)
+
+    monkeypatch.setattr(FlatIndex, "build", slow_build)
+    store.add_documents([f"a {i}" for i in range(150)], make_vectors(150, 0), source="a")
+    assert started.wait(5)
+    # Các lần thêm trong lúc đang dựng: yêu cầu refresh của chúng bị bỏ qua vì cờ _refreshing
+    for b in range(5):
+        store.add_documents([f"b{b} {i}" for i in range(150)], make_vectors(150, b + 1), source=f"b{b}")
+    release.set()
+    deadline = time.monotonic() + 5
+    while store._refreshing:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert len(store) == 900
+    assert len(store) - store._view[4].ntotal <= 100